@@ -0,0 +1,4 @@
+import time
+
+# Before any app module is imported; app.main reports its import time from here
+import_started = time.perf_counter()
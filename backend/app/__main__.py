@@ -0,0 +1,38 @@
+"""Production entry point: python -m app (worker count from WEB_CONCURRENCY)"""
+import socket
+
+import uvicorn
+
+from app.core.config import settings
+
+
+def main() -> None:
+    if settings.WEB_CONCURRENCY <= 1:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            log_config=None  # app.core.logging_config configures logging in each worker
+        )
+        return
+
+    from uvicorn.supervisors import Multiprocess
+
+    config = uvicorn.Config(
+        "app.main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=settings.WEB_CONCURRENCY,
+        log_config=None
+    )
+    # uvicorn binds the shared listening socket without IPPROTO_TCP, so asyncio leaves
+    # Nagle on for accepted connections and every response waits ~40 ms for a delayed ACK.
+    # Accepted sockets inherit TCP_NODELAY from the listening socket.
+    sock = config.bind_socket()
+    if sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    Multiprocess(config, target=uvicorn.Server(config).run, sockets=[sock]).run()
+
+
+if __name__ == "__main__":
+    main()
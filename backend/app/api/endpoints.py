@@ -1,13 +1,24 @@
 """API endpoints for nutrition and allergen extraction"""
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Header, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+import json
 import logging
+from typing import Dict, List, Optional, Set
 
+from app.core import profiling
+from app.core.deadline import Deadline
+from app.core.logging_config import request_id_var
+from app.core.responses import FastJSONResponse
+from app.services.admission import AdmissionController, AdmissionRejected, Ticket, client_key
 from app.services.simple_nutrition_extractor import SimpleNutritionExtractor
-from app.models.schemas import ExtractResponse, HealthCheck
+from app.services.triage import ROUTE_TEXT, Triage, UnprocessableDocumentError
+from app.models.schemas import ExtractResponse, HealthCheck, TextExtractRequest
 from app.core.config import settings
 
 router = APIRouter()
 nutrition_extractor = SimpleNutritionExtractor()
+admission = AdmissionController.from_settings(nutrition_extractor.pdf_processor.ocr_threads)
 logger = logging.getLogger(__name__)
 
 @router.get("/health", response_model=HealthCheck)
@@ -17,8 +28,13 @@ async def health_check():
 
 @router.post("/extract", response_model=ExtractResponse)
 async def extract_nutrition_data(
+    request: Request,
     file: UploadFile = File(..., description="PDF file to analyze"),
-    gemini_api_key: str = Form(..., description="Your Gemini API key")
+    gemini_api_key: str = Form(..., description="Your Gemini API key"),
+    fields: Optional[str] = Form(None, description="Comma-separated response fields to return (default: all)"),
+    include_text: bool = Form(True, description="Include extracted_text"),
+    max_text_chars: int = Form(0, description="Cut extracted_text and page texts to this length (0 = full text)"),
+    text_pages: bool = Form(False, description="Add the cleaned text of each page (pages)")
 ):
     """
     Extract allergens and nutrients from uploaded PDF using Gemini.
@@ -26,41 +42,262 @@ async def extract_nutrition_data(
     Args:
         file: PDF file containing product specifications
         gemini_api_key: Google Gemini API key
+        fields, include_text, max_text_chars, text_pages: response shaping
     
     Returns:
         ExtractResponse with allergens and nutrients
     """
+    deadline = Deadline.for_request(request.headers.get(Deadline.HEADER))
+    include = _response_fields(fields)
+    ticket = None
     try:
-        # File validation
-        if not file.filename or not file.filename.lower().endswith(tuple(settings.ALLOWED_EXTENSIONS)):
-            raise HTTPException(400, f"Only {', '.join(settings.ALLOWED_EXTENSIONS)} files are allowed")
-        
-        # Read file
-        pdf_data = await file.read()
-        
-        if len(pdf_data) == 0:
-            raise HTTPException(400, "Empty file")
-        
-        if len(pdf_data) > settings.MAX_FILE_SIZE:
-            raise HTTPException(400, f"File too large (max {settings.MAX_FILE_SIZE / (1024 * 1024):.0f}MB)")
-        
-        # API key validation
-        if not gemini_api_key:
-            raise HTTPException(400, "Gemini API key required")
+        pdf_data = await _read_pdf_upload(file, gemini_api_key)
+        triage = await _triage(pdf_data)
+        ticket = await _admit(request, triage, gemini_api_key)
         
         logger.info("Starting extraction with Gemini")
         
-        # Data extraction
-        result = await nutrition_extractor.extract_from_pdf(
-            pdf_data=pdf_data,
-            gemini_key=gemini_api_key
-        )
+        # Data extraction (profiled on request or for a sampled fraction, see app/core/profiling.py)
+        profile_requested = profiling.should_profile(request.headers.get(profiling.HEADER))
+        async with profiling.profile_request(profile_requested, request_id_var.get()) as profile:
+            result = await nutrition_extractor.extract_from_pdf(
+                pdf_data=pdf_data,
+                gemini_key=gemini_api_key,
+                deadline=deadline,
+                triage=triage,
+                text_pages=text_pages,
+                reserve_ocr=ticket.reserve_ocr if ticket else None
+            )
         
         logger.info("Extraction completed successfully")
-        return ExtractResponse(**result)
+        # Validated and serialised once (the response_model only documents the shape)
+        response = FastJSONResponse(_shape_response(result, include, include_text, max_text_chars))
+        if profile:
+            response.headers["X-Profile-Id"] = profile.name
+        return response
+        
+    except HTTPException:
+        raise
+    except UnprocessableDocumentError as e:
+        # The document hit a sandbox limit during extraction
+        raise HTTPException(422, f"Unprocessable PDF: {e}")
+    except AdmissionRejected as e:
+        # The text layer was too poor and the OCR it needs does not fit the budget
+        raise HTTPException(e.status_code, e.detail, headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error("Processing error: %s", str(e))
+        raise HTTPException(500, f"Processing error: {str(e)}")
+    finally:
+        if ticket:
+            ticket.release()
+
+
+@router.post("/extract/text", response_model=ExtractResponse)
+async def extract_nutrition_data_from_text(request: Request, body: TextExtractRequest):
+    """
+    Extract allergens and nutrients from page text the caller already has, e.g. the text
+    layer of a PDF read in the browser. No upload, triage or PDF parsing; cleaning, the
+    local model, Gemini, the regex fallback and the caches are the same as for /extract.
+    """
+    deadline = Deadline.for_request(request.headers.get(Deadline.HEADER))
+    include = _response_fields(body.fields)
+    if not body.gemini_api_key:
+        raise HTTPException(400, "Gemini API key required")
+    if not any(page.strip() for page in body.pages):
+        raise HTTPException(400, "No page text")
+    size = sum(len(page.encode("utf-8")) for page in body.pages)  # bytes, like an upload
+    if size > settings.MAX_FILE_SIZE:
+        raise HTTPException(400, f"Text too large (max {settings.MAX_FILE_SIZE / (1024 * 1024):.0f}MB)")
+    if settings.TRIAGE_MAX_PAGES and len(body.pages) > settings.TRIAGE_MAX_PAGES:
+        raise HTTPException(422, f"Unprocessable text: more than {settings.TRIAGE_MAX_PAGES} pages")
+    
+    # Per-client quotas apply; no OCR pages are charged
+    ticket = await _admit(request, Triage(ROUTE_TEXT, len(body.pages), size=size), body.gemini_api_key)
+    try:
+        profile_requested = profiling.should_profile(request.headers.get(profiling.HEADER))
+        async with profiling.profile_request(profile_requested, request_id_var.get()) as profile:
+            result = await nutrition_extractor.extract_from_texts(
+                body.pages,
+                body.gemini_api_key,
+                deadline=deadline,
+                text_pages=body.text_pages
+            )
+        
+        response = FastJSONResponse(_shape_response(result, include, body.include_text, body.max_text_chars))
+        if profile:
+            response.headers["X-Profile-Id"] = profile.name
+        return response
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Processing error: {str(e)}")
+        logger.error("Processing error: %s", str(e))
         raise HTTPException(500, f"Processing error: {str(e)}")
+    finally:
+        if ticket:
+            ticket.release()
+
+
+@router.post("/extract/stream")
+async def extract_nutrition_data_stream(
+    request: Request,
+    file: UploadFile = File(..., description="PDF file to analyze"),
+    gemini_api_key: str = Form(..., description="Your Gemini API key"),
+    format: str = Form("sse", description="Stream format: 'sse' (text/event-stream) or 'ndjson'"),
+    fields: Optional[str] = Form(None, description="Comma-separated fields of the result event (default: all)"),
+    include_text: bool = Form(True, description="Include extracted_text in the result event"),
+    max_text_chars: int = Form(0, description="Cut extracted_text and page texts to this length (0 = full text)"),
+    text_pages: bool = Form(False, description="Add the cleaned text of each page (pages) to the result event")
+):
+    """
+    Streaming variant of /extract. Emits events as pipeline stages complete:
+    triage (route and cost), direct_text, ocr_page (one per OCR'd page), fallback (regex result),
+    llm (Gemini result) and result (final ExtractResponse), or error if the document
+    turns out to be unprocessable during extraction.
+    """
+    if format not in ("sse", "ndjson"):
+        raise HTTPException(400, "format must be 'sse' or 'ndjson'")
+    include = _response_fields(fields)
+    
+    deadline = Deadline.for_request(request.headers.get(Deadline.HEADER))
+    pdf_data = await _read_pdf_upload(file, gemini_api_key)
+    triage = await _triage(pdf_data)
+    ticket = await _admit(request, triage, gemini_api_key)
+    
+    async def event_stream():
+        try:
+            events = nutrition_extractor.stream_extract(
+                pdf_data, gemini_api_key, deadline, triage, text_pages=text_pages,
+                reserve_ocr=ticket.reserve_ocr if ticket else None
+            )
+            async for event, data in events:
+                if event == "result":
+                    data = _shape_response(data, include, include_text, max_text_chars)
+                if format == "sse":
+                    yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                else:
+                    yield json.dumps({"event": event, "data": data}) + "\n"
+        except (UnprocessableDocumentError, AdmissionRejected) as e:
+            # Headers are already sent; report what /extract answers with (422, or 503 for OCR budget)
+            if isinstance(e, AdmissionRejected):
+                data = {"status_code": e.status_code, "detail": e.detail, "retry_after": e.retry_after}
+            else:
+                data = {"status_code": 422, "detail": f"Unprocessable PDF: {e}"}
+            if format == "sse":
+                yield f"event: error\ndata: {json.dumps(data)}\n\n"
+            else:
+                yield json.dumps({"event": "error", "data": data}) + "\n"
+        finally:
+            if ticket:
+                ticket.release()
+    
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also releases the ticket if the client disconnects before the stream starts
+        background=BackgroundTask(ticket.release) if ticket else None
+    )
+
+
+@router.get("/profiles", response_model=List[str])
+async def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    """Stored request profiles, oldest first (requires X-Profile-Token)"""
+    _check_profile_access(x_profile_token)
+    return profiling.list_profiles(settings.PROFILING_DIR)
+
+
+@router.get("/profiles/{name}")
+async def get_profile(name: str, format: str = "prof", x_profile_token: Optional[str] = Header(None)):
+    """
+    Download a stored profile: format=prof returns the pstats file (snakeviz, pstats),
+    format=text the top functions by cumulative time
+    """
+    _check_profile_access(x_profile_token)
+    path = profiling.profile_path(name)
+    if path is None:
+        raise HTTPException(404, "Profile not found")
+    if format == "text":
+        return PlainTextResponse(profiling.profile_summary(path))
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+
+def _check_profile_access(token: Optional[str]) -> None:
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(404, "Not Found")
+    if not profiling.is_admin(token):
+        raise HTTPException(403, "Invalid profiling token")
+
+
+async def _read_pdf_upload(file: UploadFile, gemini_api_key: str) -> bytes:
+    """Validate the uploaded PDF and API key, return the file bytes"""
+    # File validation
+    if not file.filename or not file.filename.lower().endswith(tuple(settings.ALLOWED_EXTENSIONS)):
+        raise HTTPException(400, f"Only {', '.join(settings.ALLOWED_EXTENSIONS)} files are allowed")
+    
+    # Read file
+    pdf_data = await file.read()
+    
+    if len(pdf_data) == 0:
+        raise HTTPException(400, "Empty file")
+    
+    if len(pdf_data) > settings.MAX_FILE_SIZE:
+        raise HTTPException(400, f"File too large (max {settings.MAX_FILE_SIZE / (1024 * 1024):.0f}MB)")
+    
+    # API key validation
+    if not gemini_api_key:
+        raise HTTPException(400, "Gemini API key required")
+    
+    return pdf_data
+
+
+def _response_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """Top-level response fields requested with `fields` (None = all); 400 for unknown names"""
+    if not fields:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(ExtractResponse.model_fields)
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+    # Whether the extraction worked is always reported
+    return requested | {"success", "error"}
+
+
+def _shape_response(result: Dict, include: Optional[Set[str]], include_text: bool, max_text_chars: int) -> Dict:
+    """Pipeline result as the JSON-ready response body, without the parts the caller did not ask for"""
+    # Copies: the result and its pages may be shared with a cache or another caller
+    result = dict(result)
+    if result.get("pages"):
+        result["pages"] = [dict(page) for page in result["pages"]]
+    if not include_text:
+        result["extracted_text"] = None
+    elif max_text_chars > 0 and len(result.get("extracted_text") or "") > max_text_chars:
+        result["extracted_text"] = result["extracted_text"][:max_text_chars]
+        result["text_truncated"] = True
+    if max_text_chars > 0 and result.get("pages"):
+        for page in result["pages"]:
+            if len(page["text"]) > max_text_chars:
+                page["text"] = page["text"][:max_text_chars]
+                result["text_truncated"] = True
+    return ExtractResponse(**result).model_dump(include=include)
+
+
+async def _triage(pdf_data: bytes) -> Triage:
+    """Route and cost of the upload; 422 for documents the pipeline cannot process"""
+    try:
+        return await nutrition_extractor.triage(pdf_data)
+    except UnprocessableDocumentError as e:
+        raise HTTPException(422, f"Unprocessable PDF: {e}")
+
+
+async def _admit(request: Request, triage: Triage, gemini_api_key: str) -> Optional[Ticket]:
+    """Reserve capacity for the request; 429/503 with Retry-After when over budget or quota"""
+    if not settings.ADMISSION_CONTROL:
+        return None
+    
+    key = client_key(gemini_api_key, request.client.host if request.client else None)
+    try:
+        return admission.try_admit(key, triage)
+    except AdmissionRejected as e:
+        raise HTTPException(e.status_code, e.detail, headers={"Retry-After": str(e.retry_after)})
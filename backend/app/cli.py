@@ -0,0 +1,299 @@
+"""
+Offline bulk extraction: runs the extraction pipeline over a directory tree or manifest of PDFs
+in a pool of worker processes and appends one result per file to JSONL or CSV.
+
+    python -m app.cli ./archive --out results.jsonl --gemini-key $GEMINI_API_KEY
+    python -m app.cli --manifest files.txt --out results.csv --workers 8 --no-llm
+    python -m app.cli ./archive --out results.jsonl --gemini-base http://127.0.0.1:8090
+
+The output is the checkpoint: files already in it are skipped, so an interrupted run
+continues where it stopped when started again with the same --out. --retry-failed also
+redoes files recorded as failed (the last record of a file wins). --profile writes one
+cProfile file for the whole run, merged from every worker process.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.profiling import RawStats
+
+ALLERGENS = ("gluten", "egg", "crustaceans", "fish", "peanut", "soy", "milk", "tree_nuts", "celery", "mustard")
+NUTRIENTS = ("energy", "fat", "carbohydrate", "sugar", "protein", "sodium")
+CSV_COLUMNS = ("file", "success", "error", "llm_used", "degraded", "processing_time") + ALLERGENS + NUTRIENTS
+
+# A file whose worker died this many times is recorded as failed instead of being retried
+MAX_CRASHES = 2
+
+# Set in worker processes by _init_worker
+_extractor = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_gemini_key = ""
+_timeout = 0.0
+_include_text = False
+_profile = False
+
+
+def _init_worker(overrides: Dict, gemini_key: str, timeout: float, include_text: bool, profile: bool) -> None:
+    """Apply the run's settings and build one extractor per worker process"""
+    global _extractor, _loop, _gemini_key, _timeout, _include_text, _profile
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+    from app.core.logging_config import setup_logging
+    from app.services.simple_nutrition_extractor import SimpleNutritionExtractor
+
+    setup_logging()
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    _extractor = SimpleNutritionExtractor()
+    _gemini_key = gemini_key
+    _timeout = timeout
+    _include_text = include_text
+    _profile = profile
+
+
+def _extract_file(path: str, name: str) -> Tuple[Dict, Optional[Dict]]:
+    """Result record for one PDF and, with --profile, its raw cProfile stats; runs in a worker process"""
+    from app.core.deadline import Deadline
+    from app.core.logging_config import request_id_var
+    from app.core.profiling import RequestProfile, profile_var
+    from app.services.triage import UnprocessableDocumentError
+
+    request_id_var.set(name)
+    profile = None
+    if _profile:
+        # As for a profiled request: the loop thread plus the OCR and text-extraction threads
+        profile = RequestProfile(name)
+        profile_var.set(profile)
+        profile.loop_profile.enable()
+    started = time.perf_counter()
+    try:
+        with open(path, "rb") as f:
+            pdf_data = f.read()
+        deadline = Deadline(_timeout) if _timeout > 0 else None
+        result = _loop.run_until_complete(_extractor.extract_from_pdf(pdf_data, _gemini_key, deadline=deadline))
+    except (OSError, UnprocessableDocumentError) as e:
+        result = {"success": False, "error": str(e), "processing_time": time.perf_counter() - started}
+    except Exception as e:
+        result = {"success": False, "error": f"{e.__class__.__name__}: {e}", "processing_time": time.perf_counter() - started}
+    finally:
+        if profile:
+            profile.loop_profile.disable()
+            profile_var.set(None)
+    if not _include_text:
+        result.pop("extracted_text", None)
+        result.pop("pages", None)
+    return {"file": name, **result}, profile.merged().stats if profile else None
+
+
+def iter_inputs(paths: List[str], manifest: Optional[str]) -> Iterator[Tuple[str, str]]:
+    """(path, name) of every PDF: directories are walked in sorted order, names are as given"""
+    if manifest:
+        with open(manifest, encoding="utf-8") as f:
+            paths = paths + [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for filename in sorted(files):
+                    if filename.lower().endswith(".pdf"):
+                        full = os.path.join(root, filename)
+                        yield full, full
+        else:
+            yield path, path
+
+
+def _repair_tail(path: str) -> None:
+    """Drop a record cut off by an interrupted write"""
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def load_checkpoint(path: str, output_format: str, retry_failed: bool) -> Set[str]:
+    """Names of the files an earlier run already recorded (only successful ones with retry_failed)"""
+    if not os.path.exists(path):
+        return set()
+    _repair_tail(path)
+    latest: Dict[str, bool] = {}
+    with open(path, encoding="utf-8", newline="") as f:
+        if output_format == "csv":
+            for row in csv.DictReader(f):
+                latest[row["file"]] = row["success"] == "True"
+        else:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    latest[record["file"]] = bool(record.get("success"))
+    return {name for name, succeeded in latest.items() if succeeded or not retry_failed}
+
+
+class ResultWriter:
+    """Appends records as they complete, flushed after each one so a crash loses at most the last"""
+
+    def __init__(self, path: str, output_format: str):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._csv = None
+        if output_format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+            if new:
+                self._csv.writeheader()
+
+    def write(self, record: Dict) -> None:
+        if self._csv is not None:
+            row = {**record.get("allergens", {}), **record.get("nutrients", {})}
+            row.update((column, record.get(column)) for column in CSV_COLUMNS[:6])
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+def run(args, overrides: Dict) -> Dict:
+    """Process every input not yet in the output; returns counts"""
+    output_format = args.format or ("csv" if args.out.lower().endswith(".csv") else "jsonl")
+    if args.overwrite and os.path.exists(args.out):
+        os.remove(args.out)
+    done = load_checkpoint(args.out, output_format, args.retry_failed)
+    todo = [(path, name) for path, name in iter_inputs(args.inputs, args.manifest) if name not in done]
+    counts = {"skipped": len(done), "total": len(todo), "succeeded": 0, "failed": 0}
+    print(f"{len(todo)} files to process, {len(done)} already done", file=sys.stderr)
+
+    writer = ResultWriter(args.out, output_format)
+    stats = None
+    if args.profile:
+        import pstats
+
+        stats = pstats.Stats()
+    pending = list(reversed(todo))
+    crashes: Dict[str, int] = {}
+    started = last_report = time.monotonic()
+    try:
+        while pending:
+            pool = _create_pool(args, overrides)
+            running: Dict[Future, Tuple[str, str]] = {}
+            try:
+                while pending or running:
+                    # Keep a bounded number of files queued so a pool failure loses little work
+                    while pending and len(running) < args.workers * 2:
+                        path, name = pending.pop()
+                        running[pool.submit(_extract_file, path, name)] = (path, name)
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record, file_stats = future.result()  # raises BrokenProcessPool with the file still in running
+                        del running[future]
+                        writer.write(record)
+                        if file_stats:
+                            stats.add(RawStats(file_stats))
+                        counts["succeeded" if record.get("success") else "failed"] += 1
+                    if time.monotonic() - last_report >= args.progress_interval:
+                        last_report = time.monotonic()
+                        _report(counts, started)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed by the OOM killer); requeue the files that were in flight
+                for path, name in running.values():
+                    crashes[name] = crashes.get(name, 0) + 1
+                    if crashes[name] >= MAX_CRASHES:
+                        writer.write({"file": name, "success": False, "error": "worker process crashed"})
+                        counts["failed"] += 1
+                    else:
+                        pending.append((path, name))
+                print(f"Worker process crashed, restarting the pool ({len(running)} files requeued or failed)", file=sys.stderr)
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+    finally:
+        writer.close()
+        if stats is not None and stats.stats:
+            stats.dump_stats(args.profile)
+            print(f"Profile written to {args.profile}", file=sys.stderr)
+    _report(counts, started)
+    return counts
+
+
+def _create_pool(args, overrides: Dict) -> ProcessPoolExecutor:
+    import multiprocessing
+
+    return ProcessPoolExecutor(
+        max_workers=args.workers,
+        # Spawned, not forked: no threads or locks are inherited from this process
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(overrides, args.gemini_key or "", args.timeout, args.include_text, bool(args.profile)),
+        max_tasks_per_child=args.max_tasks_per_child or None
+    )
+
+
+def _report(counts: Dict, started: float) -> None:
+    finished = counts["succeeded"] + counts["failed"]
+    elapsed = time.monotonic() - started
+    rate = finished / elapsed if elapsed > 0 else 0.0
+    print(
+        f"{finished}/{counts['total']} done, {counts['failed']} failed, {rate:.2f} files/s",
+        file=sys.stderr
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli", description="Extract allergens and nutrients from many PDFs without the HTTP API"
+    )
+    parser.add_argument("inputs", nargs="*", help="PDF files or directories (searched recursively for *.pdf)")
+    parser.add_argument("--manifest", default=None, help="File with one PDF path per line")
+    parser.add_argument("--out", required=True, help="Output file; also the checkpoint of an interrupted run")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default=None, help="Default: from the --out extension")
+    parser.add_argument("--overwrite", action="store_true", help="Start over instead of resuming from --out")
+    parser.add_argument("--retry-failed", action="store_true", help="Also redo files recorded as failed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--max-tasks-per-child", type=int, default=200, help="Files per worker before it is replaced (0 = never)")
+    parser.add_argument("--timeout", type=float, default=0.0, help="Seconds per file, as REQUEST_TIMEOUT (0 = none)")
+    parser.add_argument("--gemini-key", default=os.environ.get("GEMINI_API_KEY", ""), help="Default: $GEMINI_API_KEY")
+    parser.add_argument("--gemini-base", default=None, help="GEMINI_API_BASE, e.g. a tools.gemini_stub URL")
+    parser.add_argument("--no-llm", action="store_true", help="Regex fallback (and LOCAL_MODEL) only, fully offline")
+    parser.add_argument("--include-text", action="store_true", help="Keep the extracted text in JSONL records")
+    parser.add_argument("--profile", default=None, help="Write a cProfile (pstats) file of all workers here")
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the worker processes")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="Seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    if not args.inputs and not args.manifest:
+        parser.error("give PDF files, directories or --manifest")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    overrides = {
+        "LOG_LEVEL": args.log_level.upper(),
+        # The pool plays the part of the server workers: split the cores between them
+        "WEB_CONCURRENCY": args.workers,
+    }
+    if args.gemini_base:
+        overrides["GEMINI_API_BASE"] = args.gemini_base
+    if args.no_llm:
+        overrides["LLM_PROVIDERS"] = []
+    elif "gemini" in settings.LLM_PROVIDERS and not args.gemini_key:
+        parser.error("pass --gemini-key (or set GEMINI_API_KEY), or use --no-llm")
+
+    try:
+        counts = run(args, overrides)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+        return 130
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
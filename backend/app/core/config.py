@@ -1,3 +1,4 @@
+import os
 from pydantic_settings import BaseSettings
 from typing import List
 
@@ -6,25 +7,115 @@ class Settings(BaseSettings):
     VERSION: str = "1.0.0"
     API_V1_STR: str = "/api/v1"
     
+    # Server (python -m app)
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WEB_CONCURRENCY: int = 1  # Number of uvicorn worker processes
+    
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = ["*"]
     
     # File upload
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: List[str] = [".pdf"]
+    TRIAGE_MAX_PAGES: int = 0  # Reject PDFs with more pages (422); 0 = no limit
+    
+    # Responses
+    RESPONSE_COMPRESSION: bool = True  # gzip (brotli if brotli-asgi is installed) for larger bodies
+    RESPONSE_COMPRESSION_MIN_SIZE: int = 1024  # bytes; smaller bodies are sent as is
     
     # OCR Settings
     OCR_DPI: int = 300
     OCR_LANGUAGES: List[str] = ["hun+eng", "hun", "eng"]
+    OCR_BACKEND: str = "pytesseract"  # "pytesseract" (subprocess per call) or "tesserocr" (in-process)
+    OCR_THREADS: int = 0  # OCR threads per worker process; 0 = CPU count / WEB_CONCURRENCY
+    OCR_PAGE_SECONDS: float = 3.0  # Initial estimate of OCR time per page (deadlines, Retry-After)
+    OCR_EMBEDDED_IMAGES: bool = True  # OCR a single-image scanned page from its embedded image instead of rendering it
+    
+    # Scheduling of queued PDF work: cheapest estimated job first
+    SCHEDULER_AGING: float = 1.0  # Seconds of estimated cost forgiven per second waited; 0 = pure shortest-job-first
+    SCHEDULER_TEXT_SLOTS: int = 0  # Concurrent direct-text jobs per worker; 0 = CPU count
+    
+    # Isolated processing: parsing, rendering and OCR in resource-limited worker processes
+    PDF_SANDBOX: bool = False
+    SANDBOX_WORKERS: int = 0  # Worker processes per server worker; 0 = OCR threads + 1
+    SANDBOX_MAX_TASKS: int = 50  # Documents per worker process before it is replaced
+    SANDBOX_TIMEOUT: float = 120.0  # Wall-clock seconds per document stage; the worker is killed after it (422)
+    SANDBOX_CPU_SECONDS: int = 60  # CPU seconds per document stage (RLIMIT_CPU); 0 = no limit
+    SANDBOX_MEMORY_MB: int = 1024  # Address space per worker process (RLIMIT_AS); 0 = no limit
+    
+    # Admission control (per worker process)
+    ADMISSION_CONTROL: bool = True
+    ADMISSION_MAX_OCR_PAGES: int = 0  # Budget of in-flight OCR pages; 0 = 4 x OCR threads
+    ADMISSION_CLIENT_MAX_INFLIGHT: int = 0  # Concurrent requests per client; 0 = unlimited
+    ADMISSION_CLIENT_RATE: float = 0.0  # Requests per minute per client; 0 = unlimited
+    ADMISSION_CLIENT_KEY: str = "api_key"  # Quota key: "api_key" (SHA-256 of gemini_api_key) or "ip"
+    
+    # Readiness (GET /ready answers 503 while the worker process is over capacity)
+    READINESS_OCR_BUDGET_SHARE: float = 1.0  # Not ready once this share of the OCR page budget is in flight
+    READINESS_MAX_IN_FLIGHT: int = 0  # Not ready above this many extraction requests in flight; 0 = no limit
+    READINESS_MAX_P95_SECONDS: float = 0.0  # Not ready while recent p95 latency is above this; 0 = ignored
+    METRICS_LATENCY_WINDOW: int = 300  # seconds of completed requests behind the latency percentiles
+    
+    # Request deadline (X-Request-Timeout header may shorten it)
+    REQUEST_TIMEOUT: float = 0.0  # seconds; 0 = no deadline
+    DEADLINE_LLM_MIN_SECONDS: float = 2.0  # Skip Gemini (regex fallback only) with less time left
+    
+    # Profiling (cProfile); nothing is wrapped unless PROFILING_ENABLED
+    PROFILING_ENABLED: bool = False
+    PROFILING_ADMIN_TOKEN: str = ""  # X-Profile-Token value: profiles that request and allows downloads
+    PROFILING_SAMPLE_RATE: float = 0.0  # Fraction of /extract requests profiled automatically
+    PROFILING_DIR: str = "/tmp/nutrition_extractor_profiles"
+    PROFILING_MAX_FILES: int = 50  # Newest profiles kept in PROFILING_DIR
+    
+    # Startup
+    WARMUP_ON_STARTUP: bool = False  # Preload OCR stack and compile regexes on startup
     
     # LLM Settings
     OPENAI_MODEL: str = "gpt-3.5-turbo"
     OPENAI_MAX_TOKENS: int = 800
     OPENAI_TEMPERATURE: float = 0.0
+    OPENAI_API_BASE: str = "https://api.openai.com/v1"  # any OpenAI-compatible server, e.g. llama.cpp at http://localhost:8080/v1
+    OPENAI_API_KEY: str = ""  # server-side key for the "openai" provider; may be empty for a local server
     
+    GEMINI_API_BASE: str = "https://generativelanguage.googleapis.com/v1beta"  # point at tools/gemini_stub.py for load tests
     GEMINI_MODEL: str = "gemini-2.0-flash"
-    GEMINI_MAX_TOKENS: int = 800
-    GEMINI_TEMPERATURE: float = 0.0
+    GEMINI_MAX_TOKENS: int = 1000  # maxOutputTokens
+    GEMINI_TEMPERATURE: float = 0.1
+    GEMINI_MAX_INPUT_TOKENS: int = 8000  # Budget for document text in the prompt; longer text is cut to relevant parts
+    GEMINI_STRUCTURED_OUTPUT: bool = False  # Request JSON matching the response models (responseSchema)
+    PROMPT_TEMPLATE_PATH: str = ""  # File with a prompt template containing {text}; empty = built-in template
+    
+    # LLM routing: each prompt goes to the fastest healthy provider
+    LLM_PROVIDERS: List[str] = ["gemini"]  # "gemini" (caller's key) and/or "openai" (OpenAI-compatible), ties go to the first; [] = regex/local model only
+    LLM_HEDGE: bool = False  # Also send the prompt to the next provider once the first is slower than its p90
+    LLM_HEDGE_MIN_SECONDS: float = 2.0  # Never hedge earlier than this
+    LLM_MAX_ERROR_RATE: float = 0.5  # Providers failing more often than this recently are tried last
+    LLM_LATENCY_WINDOW: int = 600  # seconds of calls behind each provider's latency and error rate
+    
+    # Circuit breaker per LLM provider: after repeated upstream failures, skip it for a while
+    LLM_CIRCUIT_FAILURES: int = 5  # Consecutive failures (timeouts, 429, 5xx) that open the circuit; 0 = disabled
+    LLM_CIRCUIT_RESET_SECONDS: float = 30.0  # Seconds until one trial call is let through
+    
+    # LLM response cache (keyed by model, generation config and prompt)
+    LLM_CACHE_SIZE: int = 256  # 0 disables caching
+    LLM_CACHE_TTL: int = 3600  # seconds
+    LLM_CACHE_BACKEND: str = "memory"  # "memory" (per process) or "sqlite" (shared by all workers on the host)
+    LLM_CACHE_PATH: str = "/tmp/nutrition_extractor_cache.sqlite3"
+    LLM_CACHE_SHARED_MAX_ROWS: int = 20000  # sqlite tier incl. OCR pages; oldest written are evicted; 0 = unlimited
+    LLM_CACHE_RELEVANT_PAGES: bool = True  # Key multi-page documents by their nutrition/allergen pages only
+    
+    # Per-page OCR results keyed by page content fingerprint (a revised PDF re-OCRs only changed pages)
+    PAGE_CACHE_SIZE: int = 2048  # pages; 0 disables
+    PAGE_CACHE_TTL: int = 86400  # seconds; shared between workers when LLM_CACHE_BACKEND=sqlite
+    
+    # Regex fallback
+    FALLBACK_KEYWORD_PREFILTER: bool = True  # Skip patterns whose keywords do not occur in the document (same result)
+    
+    # Local extraction model (offline stage before Gemini)
+    LOCAL_MODEL: str = ""  # "" = disabled, "linear" = logistic candidate scorer
+    LOCAL_MODEL_PATH: str = ""  # Weights JSON from tools/train_local_model.py; empty = built-in weights
+    LOCAL_MODEL_THRESHOLD: float = 0.85  # Skip Gemini when the local result's confidence is at least this
     
     # Retry Settings
     MAX_RETRIES: int = 3
@@ -32,8 +123,17 @@ class Settings(BaseSettings):
     
     # Logging
     LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"  # "text" or "json"
+    LOG_ASYNC: bool = True  # Write log records to stdout from a background thread
+    LOG_PAYLOAD_SAMPLE_RATE: float = 0.0  # Fraction of document-content log lines to emit
     
     class Config:
         case_sensitive = True
+    
+    def ocr_threads_per_worker(self) -> int:
+        """OCR pool size per worker so that all workers together do not oversubscribe the cores"""
+        if self.OCR_THREADS > 0:
+            return self.OCR_THREADS
+        return max(1, (os.cpu_count() or 1) // max(1, self.WEB_CONCURRENCY))
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""Per-request deadline shared by all pipeline stages"""
+import time
+from typing import List, Optional
+
+from app.core.config import settings
+
+
+class Deadline:
+    """
+    Time budget of one extraction request. Stages check remaining() before starting
+    work they may not finish, and call degrade() when they skip or cut something
+    short, so the response can be marked as a partial result.
+    """
+
+    HEADER = "X-Request-Timeout"  # seconds, may only shorten REQUEST_TIMEOUT
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+        self.reasons: List[str] = []
+
+    @classmethod
+    def for_request(cls, header_value: Optional[str] = None) -> Optional["Deadline"]:
+        """Deadline from the X-Request-Timeout header and REQUEST_TIMEOUT; None if neither is set"""
+        timeouts = []
+        if settings.REQUEST_TIMEOUT > 0:
+            timeouts.append(settings.REQUEST_TIMEOUT)
+        if header_value:
+            try:
+                requested = float(header_value)
+            except ValueError:
+                requested = 0
+            if requested > 0:
+                timeouts.append(requested)
+        return cls(min(timeouts)) if timeouts else None
+
+    def remaining(self) -> float:
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def degrade(self, reason: str) -> None:
+        """Record that a stage returned less than it would have without the deadline"""
+        if reason not in self.reasons:
+            self.reasons.append(reason)
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self.reasons)
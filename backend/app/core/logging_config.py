@@ -1,48 +1,157 @@
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import queue
+import random
+import re
 import sys
+import uuid
 from app.core.config import settings
 
+# Correlation id of the request being handled (set by RequestIdMiddleware)
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+_SAFE_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+_queue_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current request id to every log record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as single-line JSON objects"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class RequestIdMiddleware:
+    """ASGI middleware: takes X-Request-ID from the request (or generates one) and echoes it back"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = ""
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if not _SAFE_REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
+
+
+def log_payload(logger: logging.Logger, msg: str, *args) -> None:
+    """
+    Log a message that carries document content (extracted text, raw LLM replies).
+    Emitted for a LOG_PAYLOAD_SAMPLE_RATE fraction of calls only; off by default.
+    """
+    rate = settings.LOG_PAYLOAD_SAMPLE_RATE
+    if rate <= 0 or not logger.isEnabledFor(logging.INFO):
+        return
+    if rate >= 1 or random.random() < rate:
+        logger.info(msg, *args)
+
+
+def _stop_queue_listener():
+    """Flush queued records and stop the listener thread"""
+    global _queue_listener
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
+atexit.register(_stop_queue_listener)
+
+
 def setup_logging():
     """Configures logging for the application"""
-    
+    global _queue_listener
+
     # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
+    if settings.LOG_FORMAT == "json":
+        formatter = JsonFormatter(datefmt='%Y-%m-%dT%H:%M:%S')
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+
     # Configure root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, settings.LOG_LEVEL))
-    
+
     # Remove existing handlers
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
-    
+    _stop_queue_listener()
+
     # Create console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(getattr(logging, settings.LOG_LEVEL))
     console_handler.setFormatter(formatter)
-    
-    # Add handler to root logger
-    root_logger.addHandler(console_handler)
-    
+
+    if settings.LOG_ASYNC:
+        # Records are queued by the caller and written to stdout by a listener thread,
+        # so a slow stdout never blocks the event loop
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(RequestIdFilter())
+        root_logger.addHandler(queue_handler)
+
+        _queue_listener = logging.handlers.QueueListener(log_queue, console_handler, respect_handler_level=True)
+        _queue_listener.start()
+    else:
+        console_handler.addFilter(RequestIdFilter())
+        root_logger.addHandler(console_handler)
+
     # Configure logging for our modules
     modules_to_log = [
-        'app.services.nutrition_extractor',
-        'app.services.pdf_processor', 
-        'app.services.llm_service',
+        'app.services.simple_nutrition_extractor',
+        'app.services.pdf_processor',
+        'app.services.universal_extraction_service',
         'app.api.endpoints'
     ]
-    
+
     for module in modules_to_log:
         logger = logging.getLogger(module)
         logger.setLevel(getattr(logging, settings.LOG_LEVEL))
-    
+
     # Reduce logging level for external libraries
     logging.getLogger('httpx').setLevel(logging.WARNING)
     logging.getLogger('httpcore').setLevel(logging.WARNING)
     logging.getLogger('openai').setLevel(logging.WARNING)
     logging.getLogger('PIL').setLevel(logging.WARNING)
-    
+
     logging.info("Logging configured successfully")
@@ -0,0 +1,141 @@
+"""Per-process load metrics for readiness checks: in-flight requests, latency, circuit state"""
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class LatencyWindow:
+    """Durations of the requests completed in the last `window` seconds (at most max_samples)"""
+
+    def __init__(self, window: float, max_samples: int = 4096):
+        self.window = window
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples)  # (finished at, seconds)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append((time.monotonic(), seconds))
+
+    def percentile(self, share: float) -> Optional[float]:
+        """Duration below which `share` of the recent requests finished; None without recent requests"""
+        cutoff = time.monotonic() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        if not self._samples:
+            return None
+        durations = sorted(seconds for _, seconds in self._samples)
+        return durations[max(0, math.ceil(share * len(durations)) - 1)]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class RequestMetrics:
+    """Extraction requests in flight and their recent latency; updated by MetricsMiddleware"""
+
+    def __init__(self, window: float):
+        self.in_flight = 0
+        self.completed = 0
+        self.latency = LatencyWindow(window)
+
+    def stats(self) -> Dict:
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        return {
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "recent": len(self.latency),
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class MetricsMiddleware:
+    """Counts requests under path_prefix while they run, including streamed bodies"""
+
+    def __init__(self, app: ASGIApp, metrics: RequestMetrics, path_prefix: str):
+        self.app = app
+        self.metrics = metrics
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        self.metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.metrics.in_flight -= 1
+            self.metrics.completed += 1
+            self.metrics.latency.record(time.perf_counter() - started)
+
+
+class CircuitOpenError(Exception):
+    """The upstream is not called while its circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing upstream: after `failures` consecutive failures the circuit
+    opens and calls are refused for reset_seconds. Then one trial call is let through
+    (half open); its success closes the circuit, its failure opens it again. A trial that
+    reports neither (e.g. cancelled) allows another after reset_seconds.
+    """
+
+    def __init__(self, failures: int, reset_seconds: float):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.opened = 0
+
+    @classmethod
+    def from_settings(cls) -> "CircuitBreaker":
+        return cls(settings.LLM_CIRCUIT_FAILURES, settings.LLM_CIRCUIT_RESET_SECONDS)
+
+    def allow(self) -> bool:
+        """Whether a call may be made now"""
+        if self.failures <= 0 or self.state == CIRCUIT_CLOSED:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            # Let one trial call through; the next one waits another reset period
+            self.state = CIRCUIT_HALF_OPEN
+            self.opened_at = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.failures > 0 and (self.state == CIRCUIT_HALF_OPEN or self.consecutive_failures >= self.failures):
+            if self.state != CIRCUIT_OPEN:
+                self.opened += 1
+            self.state = CIRCUIT_OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+# Extraction requests of this worker process (registered in app.main)
+request_metrics = RequestMetrics(settings.METRICS_LATENCY_WINDOW)
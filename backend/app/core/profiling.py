@@ -0,0 +1,199 @@
+"""On-demand and sampled cProfile capture of single extraction requests"""
+import contextvars
+import logging
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Profile-Token"  # send PROFILING_ADMIN_TOKEN to profile this request
+
+_SAFE_PROFILE_NAME = re.compile(r'^[A-Za-z0-9._-]+\.prof$')
+
+# Profile of the request being handled; None (the default) means executor work runs unwrapped
+profile_var: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("profile", default=None)
+
+# One profiled request per worker at a time: cProfile cannot nest on the event loop thread
+_active = False
+
+
+class RequestProfile:
+    """cProfile data for one request: the event loop thread plus every executor call it made"""
+
+    def __init__(self, name: str):
+        import cProfile
+
+        self.name = name
+        self.loop_profile = cProfile.Profile()
+        self._thread_profiles: List = []
+        self._lock = threading.Lock()
+
+    def run_profiled(self, fn: Callable, *args):
+        """Run fn in the current (executor) thread under its own profiler"""
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active on this thread (or globally on 3.12+)
+            return fn(*args)
+        try:
+            return fn(*args)
+        finally:
+            profile.disable()
+            with self._lock:
+                self._thread_profiles.append(profile)
+
+    def add_stats(self, stats: Dict) -> None:
+        """Add raw stats of work done for this request in another process (see run_with_stats)"""
+        with self._lock:
+            self._thread_profiles.append(RawStats(stats))
+
+    def merged(self):
+        """pstats.Stats of the loop thread, executor calls and other processes together"""
+        import pstats
+
+        stats = pstats.Stats(self.loop_profile)
+        with self._lock:
+            for profile in self._thread_profiles:
+                stats.add(profile)
+        return stats
+
+    def save(self, directory: str) -> str:
+        """Merge all profiles into one pstats file in directory and return its path"""
+        stats = self.merged()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.name)
+        stats.dump_stats(path)
+        return path
+
+
+class RawStats:
+    """Raw cProfile stats from another process, in the form pstats.Stats and Stats.add accept"""
+
+    def __init__(self, stats: Dict):
+        self._stats = stats
+
+    def create_stats(self) -> None:
+        # pstats takes .stats and empties it; keep the original for the next merge
+        self.stats = dict(self._stats)
+
+
+def run_with_stats(fn: Callable, *args) -> Tuple[Any, Dict]:
+    """
+    (fn(*args), raw cProfile stats of the call), for worker processes: the picklable
+    stats go back to the parent's RequestProfile.add_stats
+    """
+    import cProfile
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        result = fn(*args)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return result, profile.stats
+
+
+def profiled(fn: Callable) -> Callable:
+    """
+    fn wrapped to be profiled when the current request is being profiled.
+    Used for callables handed to run_in_executor; without an active profile
+    this is a single context variable lookup and fn is returned as is.
+    """
+    profile = profile_var.get()
+    if profile is None:
+        return fn
+    return lambda *args: profile.run_profiled(fn, *args)
+
+
+def should_profile(token: Optional[str]) -> bool:
+    """Profile this request? Explicitly with the admin token, or for a sampled fraction"""
+    if not settings.PROFILING_ENABLED:
+        return False
+    if token:
+        return is_admin(token)
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    admin_token = settings.PROFILING_ADMIN_TOKEN
+    return bool(admin_token and token and secrets.compare_digest(token, admin_token))
+
+
+@asynccontextmanager
+async def profile_request(enabled: bool, request_id: str) -> AsyncIterator[Optional[RequestProfile]]:
+    """
+    Profile the block if enabled and no other request is being profiled.
+    Yields the RequestProfile (or None); the merged stats are written to PROFILING_DIR
+    on exit and old files are rotated out.
+    """
+    global _active
+    if not enabled or _active:
+        yield None
+        return
+
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{request_id}.prof"
+    profile = RequestProfile(name)
+    token = profile_var.set(profile)
+    _active = True
+    # The loop profiler also sees other requests' coroutines that run on the loop meanwhile
+    profile.loop_profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.loop_profile.disable()
+        _active = False
+        profile_var.reset(token)
+        try:
+            path = profile.save(settings.PROFILING_DIR)
+            logger.info("Profile written to %s", path)
+            _rotate(settings.PROFILING_DIR, settings.PROFILING_MAX_FILES)
+        except OSError as e:
+            logger.warning("Could not write profile %s: %s", name, e)
+
+
+def _rotate(directory: str, keep: int) -> None:
+    """Delete all but the newest keep profiles"""
+    names = sorted(list_profiles(directory), reverse=True)
+    for name in names[keep:]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+def list_profiles(directory: str) -> List[str]:
+    try:
+        return sorted(name for name in os.listdir(directory) if _SAFE_PROFILE_NAME.match(name))
+    except FileNotFoundError:
+        return []
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path of a stored profile, or None for unknown or unsafe names"""
+    if not _SAFE_PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(settings.PROFILING_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def profile_summary(path: str, limit: int = 40) -> str:
+    """Text report of the top functions by cumulative time"""
+    import io
+    import pstats
+
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
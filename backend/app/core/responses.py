@@ -0,0 +1,35 @@
+"""Response serialisation and compression"""
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# orjson serialises several times faster than the json module; used when installed
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    FastJSONResponse = JSONResponse
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least minimum_size bytes for clients that accept it:
+    brotli when brotli-asgi is installed (gzip for clients without br), gzip otherwise.
+    Streaming endpoints (paths ending in /stream) are passed through, as the compressor
+    would hold events back until its buffer fills.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        try:
+            from brotli_asgi import BrotliMiddleware
+
+            self.compressed = BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+        except ImportError:
+            self.compressed = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and not scope["path"].endswith("/stream"):
+            await self.compressed(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
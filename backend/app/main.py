@@ -1,9 +1,14 @@
+import time
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.core.logging_config import setup_logging
-from app.api.endpoints import router
+from app.core.metrics import MetricsMiddleware, request_metrics
+from app.core.logging_config import setup_logging, RequestIdMiddleware
+from app.core.responses import CompressionMiddleware, FastJSONResponse
+from app.api.endpoints import router, nutrition_extractor, admission
 import logging
+from app import import_started
 
 # Configure logging
 setup_logging()
@@ -13,7 +18,8 @@ app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     description="API for extracting allergens and nutritional values from PDF documents",
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=FastJSONResponse
 )
 
 # CORS
@@ -34,8 +40,28 @@ else:
         allow_headers=["*"],
     )
 
+if settings.RESPONSE_COMPRESSION:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.RESPONSE_COMPRESSION_MIN_SIZE)
+
+app.add_middleware(MetricsMiddleware, metrics=request_metrics, path_prefix=f"{settings.API_V1_STR}/extract")
+app.add_middleware(RequestIdMiddleware)
+
 app.include_router(router, prefix=settings.API_V1_STR)
 
+app.state.import_time = time.perf_counter() - import_started
+app.state.startup_time = None
+app.state.warmup = None
+
+@app.on_event("startup")
+async def startup():
+    started = time.perf_counter()
+    if settings.WARMUP_ON_STARTUP:
+        try:
+            app.state.warmup = await nutrition_extractor.warm_up()
+        except Exception as e:
+            logger.error("Warm-up failed: %s", e)
+    app.state.startup_time = time.perf_counter() - started
+
 @app.get("/")
 async def root():
     logger.info("Root endpoint accessed")
@@ -48,4 +74,72 @@ async def root():
 @app.get("/health")
 async def health_check():
     logger.info(" Health check endpoint accessed")
-    return {"status": "healthy", "version": settings.VERSION}
\ No newline at end of file
+    return {
+        "status": "healthy",
+        "version": settings.VERSION,
+        "import_time": app.state.import_time,
+        "startup_time": app.state.startup_time,
+        "warmup": app.state.warmup,
+        "llm_cache": nutrition_extractor.extraction_service.llm_cache.stats(),
+        "page_cache": nutrition_extractor.pdf_processor.page_cache.stats(),
+        "page_images": dict(nutrition_extractor.pdf_processor.page_image_sources),
+        "sandbox": nutrition_extractor.pdf_processor.sandbox.stats() if nutrition_extractor.pdf_processor.sandbox else None,
+        "admission": admission.stats(),
+        "llm_router": nutrition_extractor.extraction_service.llm_router.stats(),
+        "triage_routes": dict(nutrition_extractor.routes),
+        "scheduler": {
+            "ocr": nutrition_extractor.pdf_processor.ocr_scheduler.stats(),
+            "text": nutrition_extractor.pdf_processor.text_scheduler.stats()
+        }
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Capacity of this worker process for load balancers and autoscalers; 503 while over
+    capacity. Reads counters only (no logging, no I/O), so it can be polled every second.
+    """
+    processor = nutrition_extractor.pdf_processor
+    requests = request_metrics.stats()
+    capacity = admission.stats()
+    ocr_budget_used = capacity["ocr_pages_in_flight"] / capacity["max_ocr_pages"] if capacity["max_ocr_pages"] else 0.0
+
+    reasons = []
+    if ocr_budget_used >= settings.READINESS_OCR_BUDGET_SHARE:
+        reasons.append("ocr_budget")
+    if settings.READINESS_MAX_IN_FLIGHT and requests["in_flight"] > settings.READINESS_MAX_IN_FLIGHT:
+        reasons.append("in_flight")
+    if (
+        settings.READINESS_MAX_P95_SECONDS
+        and requests["latency_p95"] is not None
+        and requests["latency_p95"] > settings.READINESS_MAX_P95_SECONDS
+    ):
+        reasons.append("latency")
+
+    body = {
+        "ready": not reasons,
+        "reasons": reasons,
+        "requests": requests,
+        "ocr_pages_in_flight": capacity["ocr_pages_in_flight"],
+        "max_ocr_pages": capacity["max_ocr_pages"],
+        "ocr_budget_used": round(ocr_budget_used, 3),
+        "ocr_pool": _pool_stats(processor.ocr_scheduler),
+        "text_pool": _pool_stats(processor.text_scheduler),
+        "sandbox": {"busy": processor.sandbox.busy, "workers": processor.sandbox.workers} if processor.sandbox else None,
+        # An open circuit degrades results (regex fallback) but does not make the instance unready
+        "llm_circuits": {
+            provider.name: provider.circuit.state
+            for provider in nutrition_extractor.extraction_service.llm_router.providers
+        },
+        "llm_cache_hit_rate": round(nutrition_extractor.extraction_service.llm_cache.stats()["hit_rate"], 3),
+        "page_cache_hit_rate": round(processor.page_cache.stats()["hit_rate"], 3),
+    }
+    return FastJSONResponse(body, status_code=200 if not reasons else 503)
+
+def _pool_stats(scheduler) -> dict:
+    return {
+        "running": scheduler.running,
+        "slots": scheduler.slots,
+        "queued": scheduler.queued,
+        "utilisation": round(scheduler.running / scheduler.slots, 3),
+    }
@@ -0,0 +1,95 @@
+"""Per-document text representation shared by the pipeline stages"""
+from typing import Callable, Iterable, Iterator, List, Optional
+
+SOURCE_DIRECT = "direct"  # PDF text layer
+SOURCE_OCR = "ocr"
+
+
+class PageSpan:
+    """One page of a Document: where its text sits in Document.text and how it was obtained"""
+
+    __slots__ = ("page", "source", "start", "end", "confidence")
+
+    def __init__(self, page: int, source: str, start: int, end: int, confidence: Optional[float] = None):
+        self.page = page  # 1-based page number in the PDF
+        self.source = source  # SOURCE_DIRECT or SOURCE_OCR
+        self.start = start  # character offsets into Document.text
+        self.end = end
+        self.confidence = confidence  # mean OCR confidence 0-100, None if unknown or not OCR
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return f"PageSpan(page={self.page}, source={self.source!r}, start={self.start}, end={self.end})"
+
+
+class Document:
+    """
+    Text of one PDF as an ordered list of page spans over a single string.
+    Pages are appended once; the full text is joined on first access, so stages
+    pass the Document around instead of re-concatenating strings, and can read
+    single pages (page_text) or a subset of pages (select) by offset.
+    Empty pages keep a zero-length span and add no separator.
+    """
+
+    __slots__ = ("separator", "pages", "_parts", "_length", "_text")
+
+    def __init__(self, separator: str = "\n"):
+        self.separator = separator
+        self.pages: List[PageSpan] = []
+        self._parts: List[str] = []
+        self._length = 0
+        self._text: Optional[str] = ""
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], source: str = SOURCE_DIRECT, separator: str = "\n") -> "Document":
+        """Document with one page per string, numbered from 1"""
+        document = cls(separator)
+        for number, text in enumerate(texts, start=1):
+            document.add_page(text, number, source)
+        return document
+
+    def add_page(self, text: str, page: int, source: str, confidence: Optional[float] = None) -> PageSpan:
+        if text:
+            if self._length:
+                self._parts.append(self.separator)
+                self._length += len(self.separator)
+            self._parts.append(text)
+            self._text = None
+        start = self._length
+        self._length += len(text)
+        span = PageSpan(page, source, start, self._length, confidence)
+        self.pages.append(span)
+        return span
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(self._parts)
+            # Later add_page calls append to the joined string
+            self._parts = [self._text]
+        return self._text
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[PageSpan]:
+        return iter(self.pages)
+
+    def page_text(self, span: PageSpan) -> str:
+        return self.text[span.start:span.end]
+
+    def select(self, pages: Iterable[int]) -> str:
+        """Text of the given page numbers only, in document order"""
+        wanted = set(pages)
+        return self.separator.join(
+            self.page_text(span) for span in self.pages if span.page in wanted and span.end > span.start
+        )
+
+    def map_pages(self, transform: Callable[[str], str], separator: Optional[str] = None) -> "Document":
+        """New Document with transform applied to every page; page numbers, sources and confidences are kept"""
+        result = Document(self.separator if separator is None else separator)
+        for span in self.pages:
+            result.add_page(transform(self.page_text(span)), span.page, span.source, span.confidence)
+        return result
@@ -1,16 +1,18 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 
 # Removed LLMProvider enum - now only using Gemini
 # Removed ExtractRequest - no longer needed
 
+_NUTRIENT_VALUE = "Value with unit per 100 g, e.g. \"6,9 g\" or \"1173 kJ\", or \"N/A\" if not found"
+
 class NutritionData(BaseModel):
-    energy: Optional[str] = "N/A"
-    fat: Optional[str] = "N/A"
-    carbohydrate: Optional[str] = "N/A"
-    sugar: Optional[str] = "N/A"
-    protein: Optional[str] = "N/A"
-    sodium: Optional[str] = "N/A"
+    energy: Optional[str] = Field("N/A", description=_NUTRIENT_VALUE)
+    fat: Optional[str] = Field("N/A", description=_NUTRIENT_VALUE)
+    carbohydrate: Optional[str] = Field("N/A", description=_NUTRIENT_VALUE)
+    sugar: Optional[str] = Field("N/A", description=_NUTRIENT_VALUE)
+    protein: Optional[str] = Field("N/A", description=_NUTRIENT_VALUE)
+    sodium: Optional[str] = Field("N/A", description=_NUTRIENT_VALUE)
 
 class AllergenData(BaseModel):
     gluten: bool = False
@@ -24,14 +26,51 @@ class AllergenData(BaseModel):
     celery: bool = False
     mustard: bool = False
 
+class ExtractionResult(BaseModel):
+    """Shape of a Gemini extraction reply (structured output mode)"""
+    allergens: AllergenData
+    nutrients: NutritionData
+
+class LLMUsage(BaseModel):
+    model: str
+    provider: Optional[str] = None  # LLM provider that answered ("gemini", "openai"); None for cached replies
+    hedged: bool = False  # a duplicate request went to a second provider
+    prompt_tokens_estimate: int
+    prompt_tokens: Optional[int] = None  # as reported by the API; None for cached replies
+    response_tokens: Optional[int] = None
+    input_truncated: bool = False  # document text was cut to fit GEMINI_MAX_INPUT_TOKENS
+    cached: bool = False  # reply came from the LLM cache, no tokens spent
+
+class PageText(BaseModel):
+    page: int  # 1-based page number in the PDF
+    source: str  # "direct" (text layer) or "ocr"
+    text: str
+    confidence: Optional[float] = None  # mean OCR confidence 0-100
+
 class ExtractResponse(BaseModel):
     success: bool
     allergens: AllergenData
     nutrients: NutritionData
     llm_used: str
-    extracted_text: Optional[str] = None
+    extracted_text: Optional[str] = None  # omitted with include_text=false
+    text_truncated: bool = False  # extracted_text (and page texts) cut to max_text_chars
+    pages: Optional[List[PageText]] = None  # cleaned text per page, with text_pages=true
     error: Optional[str] = None
     processing_time: Optional[float] = None
+    timings: Optional[Dict[str, float]] = None  # seconds per pipeline stage
+    degraded: bool = False  # partial result: a stage was cut short by the request deadline
+    degraded_reasons: Optional[List[str]] = None  # e.g. ocr_incomplete, llm_skipped, llm_timeout
+    llm_usage: Optional[LLMUsage] = None
+
+
+class TextExtractRequest(BaseModel):
+    """Body of /extract/text: page texts the caller already has, instead of a PDF"""
+    pages: List[str] = Field(..., description="Text of each page, in page order")
+    gemini_api_key: str
+    fields: Optional[str] = None  # same response shaping as the /extract form fields
+    include_text: bool = True
+    max_text_chars: int = 0
+    text_pages: bool = False
 
 
 class HealthCheck(BaseModel):
@@ -0,0 +1,205 @@
+"""Admission control: in-flight OCR page budget and per-client quotas"""
+import hashlib
+import logging
+import math
+import time
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.services.triage import Triage
+
+
+class AdmissionRejected(Exception):
+    """Request refused by admission control; mapped to 429/503 with Retry-After"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def client_key(api_key: Optional[str], client_ip: Optional[str]) -> str:
+    """Quota key: hash of the API key or the client IP (ADMISSION_CLIENT_KEY)"""
+    if settings.ADMISSION_CLIENT_KEY == "api_key" and api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return f"ip:{client_ip or 'unknown'}"
+
+
+class AdmissionController:
+    """
+    Per-worker admission control. Requests whose PDF needs OCR are charged their
+    page count against a budget of in-flight OCR pages (503 when exceeded), so text
+    PDFs keep flowing while scans saturate the OCR pool. Each client is also limited
+    in concurrent requests and request rate (429). All state lives on the event loop.
+    """
+
+    EWMA_ALPHA = 0.2
+
+    def __init__(
+        self,
+        max_ocr_pages: int,
+        client_max_inflight: int = 0,
+        client_rate: float = 0.0,
+        ocr_threads: int = 1,
+        seconds_per_ocr_page: float = 3.0
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.max_ocr_pages = max_ocr_pages
+        self.client_max_inflight = client_max_inflight
+        self.client_rate = client_rate  # requests per minute, 0 = unlimited
+        self.ocr_threads = max(1, ocr_threads)
+        self.ocr_pages_in_flight = 0
+        self.requests_in_flight = 0
+        self._client_inflight: Dict[str, int] = {}
+        self._client_buckets: Dict[str, list] = {}  # key -> [tokens, last refill]; full buckets are pruned
+        self._buckets_pruned_at = time.monotonic()
+        self._seconds_per_ocr_page = seconds_per_ocr_page
+        self._seconds_per_request = 1.0
+        self.admitted = 0
+        self.rejected = {"ocr_budget": 0, "client_inflight": 0, "client_rate": 0}
+
+    @classmethod
+    def from_settings(cls, ocr_threads: int) -> "AdmissionController":
+        max_ocr_pages = settings.ADMISSION_MAX_OCR_PAGES or 4 * ocr_threads
+        return cls(
+            max_ocr_pages=max_ocr_pages,
+            client_max_inflight=settings.ADMISSION_CLIENT_MAX_INFLIGHT,
+            client_rate=settings.ADMISSION_CLIENT_RATE,
+            ocr_threads=ocr_threads,
+            seconds_per_ocr_page=settings.OCR_PAGE_SECONDS
+        )
+
+    def _take_rate_token(self, key: str) -> Optional[int]:
+        """Consume one request token for key; returns seconds to wait if none is left"""
+        if self.client_rate <= 0:
+            return None
+        per_second = self.client_rate / 60
+        burst = max(1.0, self.client_rate / 6)  # up to ten seconds' worth at once
+        now = time.monotonic()
+        if now - self._buckets_pruned_at >= burst / per_second:
+            self._prune_buckets(now, per_second, burst)
+        bucket = self._client_buckets.setdefault(key, [burst, now])
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * per_second)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return max(1, math.ceil((1 - bucket[0]) / per_second))
+        bucket[0] -= 1
+        return None
+
+    def _prune_buckets(self, now: float, per_second: float, burst: float) -> None:
+        """Drop buckets that have refilled: a missing bucket starts full, so nothing changes for their clients"""
+        self._client_buckets = {
+            key: bucket for key, bucket in self._client_buckets.items()
+            if bucket[0] + (now - bucket[1]) * per_second < burst
+        }
+        self._buckets_pruned_at = now
+
+    def _ocr_retry_after(self, ocr_pages: int) -> int:
+        """Seconds until enough in-flight OCR pages should have drained"""
+        excess = self.ocr_pages_in_flight + ocr_pages - self.max_ocr_pages
+        return max(1, math.ceil(excess * self._seconds_per_ocr_page / self.ocr_threads))
+
+    def try_admit(self, key: str, cost: Triage) -> "Ticket":
+        """Reserve capacity for a request or raise AdmissionRejected"""
+        # A document larger than the whole budget is admitted only when OCR is idle
+        ocr_pages = min(cost.ocr_pages, self.max_ocr_pages)
+
+        if self.client_max_inflight and self._client_inflight.get(key, 0) >= self.client_max_inflight:
+            self.rejected["client_inflight"] += 1
+            raise AdmissionRejected(
+                429, "Too many concurrent requests for this client", max(1, math.ceil(self._seconds_per_request))
+            )
+
+        if ocr_pages and self.ocr_pages_in_flight + ocr_pages > self.max_ocr_pages:
+            self.rejected["ocr_budget"] += 1
+            self.logger.warning(
+                "OCR budget exhausted: %s/%s pages in flight, rejecting %s-page scan",
+                self.ocr_pages_in_flight, self.max_ocr_pages, cost.pages
+            )
+            raise AdmissionRejected(503, "OCR capacity exhausted, retry later", self._ocr_retry_after(ocr_pages))
+
+        # Checked last so rejected requests do not use up the client's rate
+        wait = self._take_rate_token(key)
+        if wait is not None:
+            self.rejected["client_rate"] += 1
+            raise AdmissionRejected(429, "Request rate limit exceeded for this client", wait)
+
+        self.ocr_pages_in_flight += ocr_pages
+        self.requests_in_flight += 1
+        self._client_inflight[key] = self._client_inflight.get(key, 0) + 1
+        self.admitted += 1
+        return Ticket(self, key, ocr_pages, cost)
+
+    def _reserve_ocr(self, ticket: "Ticket", pages: Optional[int]) -> None:
+        """Charge an admitted request for OCR that triage did not foresee, or raise AdmissionRejected"""
+        # Like an oversized document at admission, one request holds at most the whole budget
+        limit = self.max_ocr_pages - ticket.ocr_pages
+        pages = limit if pages is None else min(pages, limit)
+        if pages <= 0:
+            return
+        if self.ocr_pages_in_flight + pages > self.max_ocr_pages:
+            self.rejected["ocr_budget"] += 1
+            self.logger.warning(
+                "OCR budget exhausted: %s/%s pages in flight, rejecting OCR fallback of %s pages",
+                self.ocr_pages_in_flight, self.max_ocr_pages, pages
+            )
+            raise AdmissionRejected(503, "OCR capacity exhausted, retry later", self._ocr_retry_after(pages))
+        self.ocr_pages_in_flight += pages
+        ticket.ocr_pages += pages
+
+    def _release(self, ticket: "Ticket") -> None:
+        elapsed = time.monotonic() - ticket.started
+        self.ocr_pages_in_flight -= ticket.ocr_pages
+        self.requests_in_flight -= 1
+        remaining = self._client_inflight.get(ticket.key, 1) - 1
+        if remaining > 0:
+            self._client_inflight[ticket.key] = remaining
+        else:
+            self._client_inflight.pop(ticket.key, None)
+
+        # Observed durations feed the Retry-After estimates
+        self._seconds_per_request += self.EWMA_ALPHA * (elapsed - self._seconds_per_request)
+        if ticket.triage.ocr_pages_done:
+            # Only the OCR stage: one document's pages are OCR'd one after another on a single thread
+            per_page = ticket.triage.ocr_seconds / ticket.triage.ocr_pages_done
+            self._seconds_per_ocr_page += self.EWMA_ALPHA * (per_page - self._seconds_per_ocr_page)
+
+    def stats(self) -> Dict:
+        return {
+            "ocr_pages_in_flight": self.ocr_pages_in_flight,
+            "max_ocr_pages": self.max_ocr_pages,
+            "requests_in_flight": self.requests_in_flight,
+            "clients_in_flight": len(self._client_inflight),
+            "rate_buckets": len(self._client_buckets),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "seconds_per_ocr_page": round(self._seconds_per_ocr_page, 3),
+        }
+
+
+class Ticket:
+    """Capacity held by one admitted request; release() is idempotent"""
+
+    __slots__ = ("controller", "key", "ocr_pages", "triage", "started", "released")
+
+    def __init__(self, controller: AdmissionController, key: str, ocr_pages: int, triage: Triage):
+        self.controller = controller
+        self.key = key
+        self.ocr_pages = ocr_pages
+        self.triage = triage  # the pipeline records its OCR time here (Triage.ocr_seconds)
+        self.started = time.monotonic()
+        self.released = False
+
+    def reserve_ocr(self, pages: Optional[int]) -> None:
+        """
+        Add OCR pages to the held capacity (e.g. a text layer too poor to use); None for a
+        document of unknown length holds the whole budget. AdmissionRejected if over budget.
+        """
+        if not self.released:
+            self.controller._reserve_ocr(self, pages)
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
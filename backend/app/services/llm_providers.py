@@ -0,0 +1,300 @@
+"""LLM backends (Gemini, OpenAI-compatible) and a router that picks the fastest healthy one"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import CIRCUIT_OPEN, CircuitBreaker, CircuitOpenError, LatencyWindow
+from app.services.structured_output import extraction_generation_config
+
+# Calls without a shorter request deadline get this long; only their timeouts count against the provider
+DEFAULT_TIMEOUT = 30.0
+
+
+class ProviderError(Exception):
+    """An LLM provider refused the request or answered with an error status"""
+
+
+class LLMProvider:
+    """
+    One LLM backend with its own circuit breaker, recent latencies and error rate.
+    Subclasses build the HTTP request and take the reply text out of the response.
+    """
+
+    name = ""
+
+    def __init__(self, model: str, window: float):
+        self.logger = logging.getLogger(__name__)
+        self.model = model
+        self.window = window
+        self.circuit = CircuitBreaker.from_settings()
+        self.latency = LatencyWindow(window)
+        self._cancelled_after = LatencyWindow(window)  # elapsed seconds of calls cut short
+        self._outcomes: Deque[Tuple[float, bool]] = deque(maxlen=1024)  # (finished at, succeeded)
+        self.calls = 0
+        self.errors = 0
+        self.cancelled = 0
+
+    @property
+    def label(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    def generation_config(self, structured: bool) -> Dict:
+        raise NotImplementedError
+
+    def _request(self, prompt: str, generation_config: Dict, api_key: str) -> Tuple[str, Dict, Dict]:
+        """(url, headers, JSON payload) of one completion request"""
+        raise NotImplementedError
+
+    def _reply(self, data: Dict, usage: Dict) -> str:
+        """Reply text of a successful response; token counts go into usage"""
+        raise NotImplementedError
+
+    async def complete(self, prompt: str, structured: bool, api_key: str, timeout: Optional[float], usage: Dict) -> str:
+        """Reply text for prompt; raises CircuitOpenError, ProviderError or the aiohttp/timeout error"""
+        import aiohttp
+
+        if not self.circuit.allow():
+            raise CircuitOpenError(f"{self.name} circuit open after repeated failures")
+        total = min(DEFAULT_TIMEOUT, timeout) if timeout is not None else DEFAULT_TIMEOUT
+        url, headers, payload = self._request(prompt, self.generation_config(structured), api_key)
+        self.calls += 1
+        started = time.monotonic()
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=total)) as session:
+                async with session.post(url, json=payload, headers=headers) as response:
+                    if response.status == 429 or response.status >= 500:
+                        self._record_failure()
+                        raise ProviderError(f"{self.name} API error: {response.status}")
+                    if response.status != 200:
+                        # e.g. 400/403 for a bad key: the caller's problem, not the provider's
+                        self.circuit.record_success()
+                        raise ProviderError(f"{self.name} API error: {response.status}")
+                    data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # A timeout forced by a short request deadline says nothing about the provider
+            if total >= DEFAULT_TIMEOUT:
+                self._record_failure()
+            raise
+        except asyncio.CancelledError:
+            # Lost a hedged race or the request went away; the elapsed time is only a lower bound
+            self.cancelled += 1
+            self._cancelled_after.record(time.monotonic() - started)
+            raise
+
+        self.latency.record(time.monotonic() - started)
+        self._outcomes.append((time.monotonic(), True))
+        self.circuit.record_success()
+        return self._reply(data, usage)
+
+    def _record_failure(self) -> None:
+        self.errors += 1
+        self._outcomes.append((time.monotonic(), False))
+        self.circuit.record_failure()
+
+    def expected_latency(self) -> float:
+        """Recent p50; without completed calls, at least the longest recently cancelled one (0 if none)"""
+        p50 = self.latency.percentile(0.5)
+        if p50 is not None:
+            return p50
+        return self._cancelled_after.percentile(1.0) or 0.0
+
+    def error_rate(self) -> float:
+        """Share of failed calls in the last `window` seconds"""
+        cutoff = time.monotonic() - self.window
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, succeeded in self._outcomes if not succeeded) / len(self._outcomes)
+
+    def stats(self) -> Dict:
+        p50 = self.latency.percentile(0.5)
+        p90 = self.latency.percentile(0.9)
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "error_rate": round(self.error_rate(), 3),
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p90": round(p90, 3) if p90 is not None else None,
+            "circuit": self.circuit.stats(),
+        }
+
+
+class GeminiProvider(LLMProvider):
+    """Gemini generateContent with the caller's API key"""
+
+    name = "gemini"
+
+    def generation_config(self, structured: bool) -> Dict:
+        config = {"temperature": settings.GEMINI_TEMPERATURE, "maxOutputTokens": settings.GEMINI_MAX_TOKENS}
+        if structured:
+            # Schema-constrained JSON, validated directly into the response models
+            config.update(extraction_generation_config())
+        return config
+
+    def _request(self, prompt: str, generation_config: Dict, api_key: str) -> Tuple[str, Dict, Dict]:
+        if not api_key:
+            raise ProviderError("gemini: no API key")
+        url = f"{settings.GEMINI_API_BASE}/models/{self.model}:generateContent?key={api_key}"
+        payload = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": generation_config
+        }
+        return url, {}, payload
+
+    def _reply(self, data: Dict, usage: Dict) -> str:
+        metadata = data.get("usageMetadata") or {}
+        usage["prompt_tokens"] = metadata.get("promptTokenCount")
+        usage["response_tokens"] = metadata.get("candidatesTokenCount")
+        return data["candidates"][0]["content"]["parts"][0]["text"].strip()
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    /chat/completions of OpenAI or any compatible server (llama.cpp, vLLM, Ollama) with the
+    server's own key (OPENAI_API_KEY; may be empty for a local server)
+    """
+
+    name = "openai"
+
+    def generation_config(self, structured: bool) -> Dict:
+        config = {"temperature": settings.OPENAI_TEMPERATURE, "max_tokens": settings.OPENAI_MAX_TOKENS}
+        if structured:
+            # JSON mode only; the reply is validated against the response models like Gemini's
+            config["response_format"] = {"type": "json_object"}
+        return config
+
+    def _request(self, prompt: str, generation_config: Dict, api_key: str) -> Tuple[str, Dict, Dict]:
+        headers = {"Authorization": f"Bearer {settings.OPENAI_API_KEY}"} if settings.OPENAI_API_KEY else {}
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            **generation_config
+        }
+        return f"{settings.OPENAI_API_BASE}/chat/completions", headers, payload
+
+    def _reply(self, data: Dict, usage: Dict) -> str:
+        counts = data.get("usage") or {}
+        usage["prompt_tokens"] = counts.get("prompt_tokens")
+        usage["response_tokens"] = counts.get("completion_tokens")
+        return (data["choices"][0]["message"]["content"] or "").strip()
+
+
+PROVIDERS = {
+    GeminiProvider.name: lambda window: GeminiProvider(settings.GEMINI_MODEL, window),
+    OpenAICompatibleProvider.name: lambda window: OpenAICompatibleProvider(settings.OPENAI_MODEL, window),
+}
+
+
+class LLMRouter:
+    """
+    Sends each prompt to the provider expected to answer fastest. Providers with an open
+    circuit or a recent error rate above max_error_rate come last; the rest are ordered by
+    recent p50 latency, and one without recent calls goes first so it gets measured. A
+    provider that fails is followed by the next straight away. With hedging, if the first
+    provider has not answered after its p90 latency (at least hedge_min_seconds), the prompt
+    also goes to the next provider and the first reply wins; the other call is cancelled.
+    """
+
+    def __init__(self, providers: List[LLMProvider], hedge: bool, hedge_min_seconds: float, max_error_rate: float):
+        self.logger = logging.getLogger(__name__)
+        self.providers = providers
+        self.hedge = hedge
+        self.hedge_min_seconds = hedge_min_seconds
+        self.max_error_rate = max_error_rate
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    @classmethod
+    def from_settings(cls) -> "LLMRouter":
+        unknown = [name for name in settings.LLM_PROVIDERS if name not in PROVIDERS]
+        if unknown:
+            raise ValueError(f"LLM_PROVIDERS must name providers from {sorted(PROVIDERS)}, got {settings.LLM_PROVIDERS}")
+        return cls(
+            [PROVIDERS[name](settings.LLM_LATENCY_WINDOW) for name in settings.LLM_PROVIDERS],
+            settings.LLM_HEDGE,
+            settings.LLM_HEDGE_MIN_SECONDS,
+            settings.LLM_MAX_ERROR_RATE
+        )
+
+    @property
+    def label(self) -> str:
+        """Providers and models in preference order (part of the LLM cache key)"""
+        return ",".join(provider.label for provider in self.providers)
+
+    def generation_configs(self, structured: bool) -> Dict[str, Dict]:
+        return {provider.name: provider.generation_config(structured) for provider in self.providers}
+
+    def ranked(self) -> List[LLMProvider]:
+        """Providers in the order they are tried for the next prompt"""
+        def key(item):
+            index, provider = item
+            unhealthy = provider.circuit.state == CIRCUIT_OPEN or provider.error_rate() > self.max_error_rate
+            return unhealthy, provider.expected_latency(), index
+
+        return [provider for _, provider in sorted(enumerate(self.providers), key=key)]
+
+    async def complete(
+        self, prompt: str, structured: bool, api_key: str, timeout: Optional[float], usage: Dict
+    ) -> Tuple[LLMProvider, str]:
+        """(provider that answered, reply text); raises the last error if every provider failed"""
+        remaining = self.ranked()
+        pending: Dict[asyncio.Task, Tuple[LLMProvider, Dict]] = {}
+        started = time.monotonic()
+        hedge_task: Optional[asyncio.Task] = None
+        error: Optional[Exception] = None
+
+        def launch() -> asyncio.Task:
+            provider = remaining.pop(0)
+            attempt_usage: Dict = {}
+            task = asyncio.ensure_future(provider.complete(prompt, structured, api_key, timeout, attempt_usage))
+            pending[task] = (provider, attempt_usage)
+            return task
+
+        launch()
+        try:
+            while pending:
+                wait = None
+                if self.hedge and hedge_task is None and remaining:
+                    first = next(iter(pending.values()))[0]
+                    hedge_after = max(self.hedge_min_seconds, first.latency.percentile(0.9) or 0.0)
+                    wait = max(0.0, hedge_after - (time.monotonic() - started))
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedged += 1
+                    hedge_task = launch()
+                    continue
+                for task in done:
+                    provider, attempt_usage = pending.pop(task)
+                    try:
+                        text = task.result()
+                    except Exception as e:
+                        self.logger.warning("LLM provider %s failed: %s", provider.name, str(e) or e.__class__.__name__)
+                        error = e
+                        continue
+                    if task is hedge_task:
+                        self.hedge_wins += 1
+                    usage.update(attempt_usage, model=provider.model, provider=provider.name, hedged=hedge_task is not None)
+                    return provider, text
+                if not pending and remaining:
+                    self.failovers += 1
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    def stats(self) -> Dict:
+        return {
+            "order": [provider.name for provider in self.ranked()],
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "providers": {provider.name: provider.stats() for provider in self.providers},
+        }
@@ -0,0 +1,229 @@
+"""Local extraction tier: scores regex candidates with a small offline-trained linear model"""
+import bisect
+import json
+import logging
+import math
+import re
+from typing import Dict, List, Optional
+
+from app.models.document import SOURCE_OCR, Document
+from app.services.universal_extraction_service import UniversalExtractionService
+
+NUTRIENT_FEATURES = (
+    "bias",
+    "pattern_rank",  # 1 / (1 + index of the pattern); earlier patterns are more specific
+    "in_range",  # value within the plausible per-100g range
+    "has_unit",  # match carries g/mg/kJ/kcal
+    "per_100g",  # "100 g"/"100 ml" close to the match
+    "agreement",  # share of other matching patterns that found the same value
+    "ocr",  # match lies on an OCR page
+    "ocr_confidence",  # that page's OCR confidence / 100 (0 if unknown)
+    "unit_pair",  # energy given as both kJ and kcal
+)
+ALLERGEN_FEATURES = (
+    "bias",
+    "table_marker",  # a numbered "+"/"-" marker directly precedes the keyword
+    "marker_conflict",  # both "+" and "-" markers found for this allergen
+    "mention_only",  # keyword present without any marker (ingredient lists, "free from" notes)
+)
+
+# Hand-set starting point; tools/train_local_model.py fits these on labelled documents
+DEFAULT_WEIGHTS = {
+    "nutrient": {
+        "bias": -2.0, "pattern_rank": 1.0, "in_range": 2.0, "has_unit": 1.0, "per_100g": 0.8,
+        "agreement": 1.5, "ocr": -0.5, "ocr_confidence": 0.5, "unit_pair": 0.5,
+    },
+    "allergen": {"bias": 2.0, "table_marker": 1.5, "marker_conflict": -3.0, "mention_only": -2.5},
+    # Confidence (as a logit) that a nutrient with no candidates really is absent
+    "missing_nutrient_logit": -1.0,
+}
+
+_MARKER = re.compile(r'\d+\s*([+-])\s+')
+_MARKER_WINDOW = 25  # characters before an allergen keyword searched for its marker
+_UNIT = re.compile(r'\d\s*(?:kj|kcal|mg|g)\b', re.IGNORECASE)
+_PER_100 = re.compile(r'100\s*(?:g|ml)\b', re.IGNORECASE)
+
+
+def _sigmoid(x: float) -> float:
+    return 1.0 / (1.0 + math.exp(-x)) if x >= 0 else math.exp(x) / (1.0 + math.exp(x))
+
+
+class LocalResult:
+    """Allergens and nutrients from a local model with per-field and overall confidence"""
+
+    __slots__ = ("allergens", "nutrients", "confidence", "field_confidence")
+
+    def __init__(self, allergens: Dict, nutrients: Dict, field_confidence: Dict[str, float]):
+        self.allergens = allergens
+        self.nutrients = nutrients
+        self.field_confidence = field_confidence
+        # A document is only as reliable as its weakest field
+        self.confidence = min(field_confidence.values()) if field_confidence else 0.0
+
+
+class LocalExtractor:
+    """Base class for in-process, network-free extraction models"""
+
+    name = "base"
+
+    def extract(self, text: str, document: Optional[Document] = None) -> LocalResult:
+        raise NotImplementedError
+
+
+class Candidate:
+    """One possible value for a nutrient and its features"""
+
+    __slots__ = ("formatted", "start", "features")
+
+    def __init__(self, formatted: str, start: int, features: Dict[str, float]):
+        self.formatted = formatted
+        self.start = start
+        self.features = features
+
+
+class LinearCandidateExtractor(LocalExtractor):
+    """
+    Generates every match of the fallback nutrient patterns as a candidate, scores
+    each with a logistic model over match features and keeps the best per nutrient.
+    Allergens are decided by the numbered "+"/"-" marker nearest to each keyword.
+    """
+
+    name = "linear"
+    MAX_MATCHES_PER_PATTERN = 5
+
+    def __init__(self, weights: Optional[Dict] = None):
+        self.logger = logging.getLogger(__name__)
+        self.weights = weights or DEFAULT_WEIGHTS
+        self._allergen_keywords = {
+            allergen: re.compile("|".join(re.escape(keyword) for keyword in keywords), re.IGNORECASE)
+            for allergen, keywords in UniversalExtractionService.ALLERGEN_KEYWORDS.items()
+        }
+
+    @classmethod
+    def load(cls, path: str) -> "LinearCandidateExtractor":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def score(self, group: str, features: Dict[str, float]) -> float:
+        weights = self.weights[group]
+        return _sigmoid(sum(weights.get(name, 0.0) * value for name, value in features.items()))
+
+    def nutrient_candidates(self, text: str, document: Optional[Document] = None) -> Dict[str, List[Candidate]]:
+        """All candidates per nutrient with their features (also used for offline training)"""
+        page_starts = [span.start for span in document.pages] if document is not None else []
+        candidates = {}
+
+        for nutrient, pattern_list in UniversalExtractionService._nutrient_patterns().items():
+            found = []  # (pattern index, match, value, numeric value)
+            for index, pattern in enumerate(pattern_list):
+                for count, match in enumerate(pattern.finditer(text)):
+                    if count >= self.MAX_MATCHES_PER_PATTERN:
+                        break
+                    groups = match.groups()
+                    value = (groups[0] or groups[1]) if len(groups) > 1 else groups[0]
+                    if not value:
+                        continue
+                    try:
+                        found.append((index, match, value, float(value.replace(',', '.'))))
+                    except ValueError:
+                        continue
+
+            patterns_by_value: Dict[float, set] = {}
+            for index, _, _, number in found:
+                patterns_by_value.setdefault(number, set()).add(index)
+            matched_patterns = len({index for index, _, _, _ in found})
+
+            low = UniversalExtractionService.NUTRIENT_MIN_VALUES[nutrient]
+            high = UniversalExtractionService.NUTRIENT_MAX_VALUES[nutrient]
+            nutrient_candidates = []
+            for index, match, value, number in found:
+                groups = match.groups()
+                pair = len(groups) >= 2 and bool(groups[0]) and bool(groups[1])
+                features = {
+                    "bias": 1.0,
+                    "pattern_rank": 1.0 / (1 + index),
+                    "in_range": float(low <= number <= high),
+                    "has_unit": float(bool(_UNIT.search(match.group(0)))),
+                    "per_100g": float(bool(_PER_100.search(text, max(0, match.start() - 80), match.end() + 20))),
+                    "agreement": (len(patterns_by_value[number]) - 1) / max(1, matched_patterns - 1),
+                    "ocr": 0.0,
+                    "ocr_confidence": 0.0,
+                    "unit_pair": float(pair),
+                }
+                if page_starts:
+                    span = document.pages[max(0, bisect.bisect_right(page_starts, match.start()) - 1)]
+                    if span.source == SOURCE_OCR:
+                        features["ocr"] = 1.0
+                        features["ocr_confidence"] = (span.confidence or 0.0) / 100
+                nutrient_candidates.append(Candidate(self._format(nutrient, match, value, number, pair), match.start(), features))
+            candidates[nutrient] = nutrient_candidates
+
+        return candidates
+
+    @staticmethod
+    def _format(nutrient: str, match: re.Match, value: str, number: float, pair: bool) -> str:
+        if nutrient == "energy" and len(match.groups()) >= 2 and not pair:
+            # Only one of the kJ/kcal groups matched
+            return f"{value} {'kJ' if match.group(1) else 'kcal'}"
+        return UniversalExtractionService._format_nutrient(nutrient, match, value, number)
+
+    def allergen_evidence(self, text: str) -> Dict[str, tuple]:
+        """(predicted value, features) per allergen (also used for offline training)"""
+        evidence = {}
+        for allergen, keyword in self._allergen_keywords.items():
+            signs = set()
+            mentioned = False
+            for match in keyword.finditer(text):
+                mentioned = True
+                window_start = max(0, match.start() - _MARKER_WINDOW)
+                markers = list(_MARKER.finditer(text, window_start, match.start()))
+                if markers:
+                    signs.add(markers[-1].group(1))
+            features = {
+                "bias": 1.0,
+                "table_marker": float(bool(signs)),
+                "marker_conflict": float(len(signs) > 1),
+                "mention_only": float(mentioned and not signs),
+            }
+            # Conflicting markers resolve to "contains"; unmarked mentions to the conservative False
+            evidence[allergen] = ("+" in signs, features)
+        return evidence
+
+    def extract(self, text: str, document: Optional[Document] = None) -> LocalResult:
+        nutrients = {}
+        confidence = {}
+        missing = _sigmoid(self.weights["missing_nutrient_logit"])
+        for nutrient, candidates in self.nutrient_candidates(text, document).items():
+            if not candidates:
+                nutrients[nutrient] = "N/A"
+                confidence[nutrient] = missing
+                continue
+            scored = [(self.score("nutrient", candidate.features), candidate) for candidate in candidates]
+            best_score, best = max(scored, key=lambda item: (item[0], -item[1].start))
+            nutrients[nutrient] = best.formatted
+            confidence[nutrient] = best_score
+
+        allergens = {}
+        for allergen, (value, features) in self.allergen_evidence(text).items():
+            allergens[allergen] = value
+            confidence[allergen] = self.score("allergen", features)
+
+        return LocalResult(allergens, nutrients, confidence)
+
+
+LOCAL_EXTRACTORS = {
+    LinearCandidateExtractor.name: LinearCandidateExtractor,
+}
+
+
+def create_local_extractor(name: str, model_path: str = "") -> Optional[LocalExtractor]:
+    """Configured local model, or None when disabled or unknown"""
+    if not name:
+        return None
+    extractor_cls = LOCAL_EXTRACTORS.get(name)
+    if extractor_cls is None:
+        logging.getLogger(__name__).warning("Unknown local model '%s', local extraction disabled", name)
+        return None
+    if model_path:
+        return extractor_cls.load(model_path)
+    return extractor_cls()
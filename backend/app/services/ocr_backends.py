@@ -0,0 +1,129 @@
+"""OCR engines used by PDFProcessor"""
+import logging
+import threading
+from typing import TYPE_CHECKING, Iterable, Optional, Tuple
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# More comprehensive character set for better OCR quality
+OCR_CHAR_WHITELIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyzÁÉÍÓÚÖÜŐŰáéíóúöüőű.,:;()[]{}%+-/gkjml '
+
+
+class OCRBackend:
+    """Base class for OCR engines: turns a PIL image into text"""
+
+    name = "base"
+    # Engines are kept per thread, so warming up one thread does not warm up the others
+    per_thread = False
+
+    def __init__(self, psm: int = 6, oem: int = 3, whitelist: str = OCR_CHAR_WHITELIST):
+        self.psm = psm
+        self.oem = oem
+        self.whitelist = whitelist
+
+    def image_to_string(self, image: "Image.Image", lang: Optional[str] = None) -> str:
+        """Recognise text in image; lang=None uses the engine default"""
+        raise NotImplementedError
+
+    def recognize(self, image: "Image.Image", lang: Optional[str] = None) -> Tuple[str, Optional[float]]:
+        """Text and mean word confidence (0-100); engines that cannot report it cheaply return None"""
+        return self.image_to_string(image, lang=lang), None
+
+    def warm_up(self, languages: Iterable[str]) -> None:
+        """Run the engine once per language so language data is loaded before the first request"""
+        from PIL import Image
+
+        blank = Image.new('L', (64, 64), color=255)
+        for lang in languages:
+            try:
+                self.image_to_string(blank, lang=lang)
+            except Exception as e:
+                logger.warning("%s warm-up failed for language %s: %s", self.name, lang, e)
+
+
+class PytesseractBackend(OCRBackend):
+    """Runs the tesseract CLI through pytesseract (one subprocess per call)"""
+
+    name = "pytesseract"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config = f"--oem {self.oem} --psm {self.psm} -c tessedit_char_whitelist={self.whitelist}"
+
+    def image_to_string(self, image: "Image.Image", lang: Optional[str] = None) -> str:
+        import pytesseract
+
+        if lang:
+            return pytesseract.image_to_string(image, lang=lang, config=self.config)
+        return pytesseract.image_to_string(image, config=self.config)
+
+
+class TesserocrBackend(OCRBackend):
+    """
+    In-process Tesseract via tesserocr. Keeps one initialised engine per thread and
+    language, so language data is loaded once per worker and images are passed as
+    in-memory buffers instead of temp files and a forked process.
+    """
+
+    name = "tesserocr"
+    default_lang = "eng"
+    per_thread = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        import tesserocr  # noqa: F401 - fail early if the extension is not installed
+        self._local = threading.local()
+
+    def _get_api(self, lang: str):
+        apis = getattr(self._local, "apis", None)
+        if apis is None:
+            apis = self._local.apis = {}
+
+        api = apis.get(lang)
+        if api is None:
+            import tesserocr
+
+            api = tesserocr.PyTessBaseAPI(lang=lang, psm=self.psm, oem=self.oem)
+            api.SetVariable("tessedit_char_whitelist", self.whitelist)
+            apis[lang] = api
+        return api
+
+    def image_to_string(self, image: "Image.Image", lang: Optional[str] = None) -> str:
+        api = self._get_api(lang or self.default_lang)
+        api.SetImage(image)
+        try:
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+
+    def recognize(self, image: "Image.Image", lang: Optional[str] = None) -> Tuple[str, Optional[float]]:
+        api = self._get_api(lang or self.default_lang)
+        api.SetImage(image)
+        try:
+            # MeanTextConf reuses the recognition done by GetUTF8Text
+            return api.GetUTF8Text(), float(api.MeanTextConf())
+        finally:
+            api.Clear()
+
+
+OCR_BACKENDS = {
+    PytesseractBackend.name: PytesseractBackend,
+    TesserocrBackend.name: TesserocrBackend,
+}
+
+
+def create_ocr_backend(name: str) -> OCRBackend:
+    """Create the configured OCR backend, falling back to pytesseract if it is unavailable"""
+    backend_cls = OCR_BACKENDS.get(name)
+    if backend_cls is None:
+        logger.warning("Unknown OCR backend '%s', using %s", name, PytesseractBackend.name)
+        return PytesseractBackend()
+
+    try:
+        return backend_cls()
+    except ImportError as e:
+        logger.warning("OCR backend '%s' unavailable (%s), using %s", name, e, PytesseractBackend.name)
+        return PytesseractBackend()
@@ -0,0 +1,125 @@
+"""Per-page extraction results keyed by page content fingerprints"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+PageResult = Tuple[str, Optional[float]]  # (text, OCR confidence)
+
+
+def page_fingerprint(page) -> str:
+    """
+    SHA-256 over what a PyPDF2 page renders from: page size, content streams and
+    the XObjects (images, forms) it draws. An unchanged page in a revised PDF keeps
+    its fingerprint even though object numbers and the rest of the file differ.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr([float(value) for value in page.mediabox]).encode())
+    digest.update(str(page.get("/Rotate", 0)).encode())
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    _hash_xobjects(digest, page.get("/Resources"), set())
+    return digest.hexdigest()
+
+
+def _hash_xobjects(digest, resources, seen: set) -> None:
+    if resources is None:
+        return
+    xobjects = resources.get_object().get("/XObject")
+    if xobjects is None:
+        return
+    xobjects = xobjects.get_object()
+    for name in sorted(xobjects):
+        reference = xobjects[name]
+        key = getattr(reference, "idnum", None)
+        if key is not None:
+            # Forms and images shared between pages or nested forms are hashed once per page
+            if key in seen:
+                continue
+            seen.add(key)
+        xobject = reference.get_object()
+        digest.update(name.encode())
+        digest.update(xobject.get_data())
+        if xobject.get("/Subtype") == "/Form":
+            _hash_xobjects(digest, xobject.get("/Resources"), seen)
+
+
+def page_fingerprints(pdf_data: bytes) -> List[str]:
+    """Fingerprint of every page, in page order"""
+    import io
+
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
+    return [page_fingerprint(page) for page in reader.pages]
+
+
+class PageResultCache:
+    """
+    Thread-safe LRU of per-page results with a TTL, keyed by page fingerprint.
+    key_prefix names everything else the result depends on (e.g. OCR engine and
+    languages). An optional shared store (SQLiteCacheStore) is consulted on a
+    local miss, so pages OCR'd by one worker are reused by the others.
+    """
+
+    def __init__(self, max_size: int, ttl: float, key_prefix: str = "", shared_store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.shared_store = shared_store
+        self._entries: "OrderedDict[str, Tuple[float, PageResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, fingerprint: str) -> Optional[PageResult]:
+        key = self.key_prefix + fingerprint
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        value = self.shared_store.get(key) if self.shared_store is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+        value = (value[0], value[1])
+        self._put_local(key, value)
+        return value
+
+    def put(self, fingerprint: str, text: str, confidence: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        key = self.key_prefix + fingerprint
+        self._put_local(key, (text, confidence))
+        if self.shared_store is not None:
+            self.shared_store.set(key, [text, confidence], self.ttl)
+
+    def _put_local(self, key: str, value: PageResult) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "shared": self.shared_store is not None,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0
+        }
@@ -0,0 +1,128 @@
+"""Scanned pages as their embedded image, decoded once, instead of rendering the page"""
+import io
+import re
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# A scanner page draws one image over the page and nothing else: "q w 0 0 h x y cm /Im0 Do Q"
+_SCAN_CONTENT = re.compile(
+    rb"\s*(?:q\s+)?(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+-?[\d.]+\s+-?[\d.]+\s+cm\s*"
+    rb"/([^\s/\[\]()<>]+)\s*Do\s*(?:Q\s*)?"
+)
+# The image must cover at least this share of the page, or the page is rendered
+MIN_COVERAGE = 0.9
+
+_GRAY = ("/DeviceGray", "/CalGray")
+_RGB = ("/DeviceRGB", "/CalRGB")
+
+
+def page_scan_image(page):
+    """
+    The image XObject of a page that consists of one upright image covering the page,
+    in a format that can be decoded directly (JPEG, CCITT fax, or Flate-compressed gray
+    or RGB samples); None if the page has to be rendered.
+    """
+    contents = page.get_contents()
+    match = _SCAN_CONTENT.fullmatch(contents.get_data()) if contents is not None else None
+    if match is None:
+        return None
+    a, b, c, d = (float(value) for value in match.groups()[:4])
+    box = page.mediabox
+    page_area = abs(float(box.width) * float(box.height)) or 1.0
+    if b or c or a <= 0 or d <= 0 or a * d < MIN_COVERAGE * page_area:
+        # Rotated or mirrored placement, or a small image on an otherwise blank page
+        return None
+
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is None:
+        return None
+    reference = xobjects.get_object().get("/" + match.group(5).decode("latin-1"))
+    if reference is None:
+        return None
+    xobject = reference.get_object()
+    if xobject.get("/Subtype") != "/Image" or _image_format(xobject) is None:
+        return None
+    return xobject
+
+
+def decode_scan_image(page, xobject, dpi: int = 300) -> "Image.Image":
+    """
+    The page's image, upright, in grayscale where the format allows it. JPEGs are
+    decoded straight to grayscale and, when scanned above dpi, at a reduced DCT scale
+    (never below dpi), so neither the full-colour nor the full-size bitmap is built.
+    """
+    from PIL import Image
+
+    image_format = _image_format(xobject)
+    if image_format == "jpeg":
+        image = Image.open(io.BytesIO(xobject.get_data()))
+        box = page.mediabox
+        target = (int(abs(float(box.width)) * dpi / 72), int(abs(float(box.height)) * dpi / 72))
+        if image.mode in ("L", "RGB"):
+            image.draft("L", target)
+        else:
+            image.draft(None, target)
+        image.load()
+    elif image_format == "ccitt":
+        # PyPDF2 wraps CCITT data in a TIFF header
+        image = Image.open(io.BytesIO(xobject.get_data()))
+        image.load()
+    else:
+        mode, bits = image_format
+        size = (int(xobject["/Width"]), int(xobject["/Height"]))
+        image = Image.frombytes("1" if bits == 1 else mode, size, xobject.get_data())
+
+    rotate = int(page.get("/Rotate", 0) or 0) % 360
+    if rotate:
+        # /Rotate turns the page clockwise; PIL's transposes are counter-clockwise
+        image = image.transpose({
+            90: Image.Transpose.ROTATE_270,
+            180: Image.Transpose.ROTATE_180,
+            270: Image.Transpose.ROTATE_90,
+        }[rotate])
+    return image
+
+
+def _image_format(xobject):
+    """"jpeg", "ccitt", (PIL mode, bits per component) for raw samples, or None if unsupported"""
+    if xobject.get("/ImageMask") or "/Decode" in xobject or "/SMask" in xobject or "/Mask" in xobject:
+        # Inverted, masked or transparent images render differently from their samples
+        return None
+    filters = xobject.get("/Filter")
+    filters = [filters] if isinstance(filters, str) else list(filters or [])
+    components = _components(xobject.get("/ColorSpace"))
+    last = filters[-1] if filters else None
+    if any(name not in ("/FlateDecode", "/DCTDecode", "/CCITTFaxDecode") for name in filters):
+        return None
+    if last == "/DCTDecode":
+        # CMYK JPEGs are often stored inverted (Adobe); let poppler handle them
+        return "jpeg" if components in (1, 3) else None
+    if last == "/CCITTFaxDecode":
+        return "ccitt"
+    bits = int(xobject.get("/BitsPerComponent", 8))
+    if components == 1 and bits in (1, 8):
+        return "L", bits
+    if components == 3 and bits == 8:
+        return "RGB", bits
+    return None
+
+
+def _components(color_space) -> Optional[int]:
+    """Number of colour components of a gray or RGB colour space; None for anything else"""
+    if color_space is None:
+        return None
+    color_space = color_space.get_object()
+    if isinstance(color_space, str):
+        return 1 if color_space in _GRAY else 3 if color_space in _RGB else None
+    family = color_space[0]
+    if family == "/ICCBased":
+        components = int(color_space[1].get_object().get("/N", 0))
+        return components if components in (1, 3) else None
+    if family in _GRAY:
+        return 1
+    if family in _RGB:
+        return 3
+    return None
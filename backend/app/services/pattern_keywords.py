@@ -0,0 +1,111 @@
+"""Literal keywords a regex needs, for skipping regex fallback patterns that cannot match a document"""
+import logging
+import re
+from typing import FrozenSet, List, Optional
+
+# The regex parser is private and has moved before (sre_parse became re._parser in 3.11).
+# Without it no keywords are found and every pattern runs, which gives the same result.
+try:
+    from re import _constants as _sre_constants, _parser as _sre_parser
+except ImportError:
+    try:  # Python < 3.11
+        import sre_constants as _sre_constants
+        import sre_parse as _sre_parser
+    except ImportError:
+        _sre_constants = _sre_parser = None
+
+logger = logging.getLogger(__name__)
+
+# Alternatives a pattern keyword is expanded to at most, e.g. "(?:só|salt|sodium)" is 3
+MAX_KEYWORD_VARIANTS = 64
+
+# Characters that re.IGNORECASE matches to a letter they do not lower-case to
+_IGNORECASE_EXTRAS = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s"})
+
+if _sre_constants is not None:
+    _LITERAL = _sre_constants.LITERAL
+    _SUBPATTERN = _sre_constants.SUBPATTERN
+    _BRANCH = _sre_constants.BRANCH
+    _IN = _sre_constants.IN
+    _REPEATS = (_sre_constants.MAX_REPEAT, _sre_constants.MIN_REPEAT)
+
+
+def fold_case(text: str) -> str:
+    """
+    Lower-cased text for keyword tests that agree with re.IGNORECASE: also maps the
+    characters the regex engine matches to i and s (dotted/dotless I, long s)
+    """
+    return text.translate(_IGNORECASE_EXTRAS).lower()
+
+
+def required_keywords(pattern: str) -> Optional[FrozenSet[str]]:
+    """
+    Lower-case literals of which every match of pattern contains at least one, e.g.
+    {"szénhidrát", "carbohydrate", ...} for "(?:szénhidrát|carbohydrate|...)[:\\s]+..."; a
+    pattern cannot match a text (see fold_case) that contains none of them. None if the
+    pattern requires no literal text, or if the regex parser is unavailable or has changed.
+    """
+    if _sre_parser is None:
+        return None
+    try:
+        return _required(_sre_parser.parse(pattern, re.IGNORECASE))
+    except Exception as e:
+        # Parser internals changed (tests/test_fallback_routing.py pins the results): run the pattern
+        logger.warning("No keywords for fallback pattern %r: %s", pattern, e)
+        return None
+
+
+def _required(items) -> Optional[FrozenSet[str]]:
+    """Most selective literal requirement of a parsed (sub)pattern"""
+    candidates: List[FrozenSet[str]] = []
+    runs = frozenset([""])  # texts the literal part matched so far can be
+    for op, av in items:
+        exact = _exact((op, av))
+        if exact is not None and len(runs) * len(exact) <= MAX_KEYWORD_VARIANTS:
+            runs = frozenset(run + text for run in runs for text in exact)
+            continue
+        if "" not in runs:
+            candidates.append(frozenset(run.lower() for run in runs))
+        runs = frozenset([""])
+        inner = None
+        if op is _SUBPATTERN and not av[1] and not av[2]:  # (?:...) or (...) without inline flags
+            inner = _required(av[3])
+        elif op is _BRANCH:
+            alternatives = [_required(branch) for branch in av[1]]
+            if all(alternatives):
+                inner = frozenset().union(*alternatives)
+        elif op in _REPEATS and av[0] >= 1:
+            inner = _required(av[2])
+        if inner:
+            candidates.append(inner)
+    if "" not in runs:
+        candidates.append(frozenset(run.lower() for run in runs))
+    if not candidates:
+        return None
+    # Longest shortest literal: the one least likely to occur by chance
+    return max(candidates, key=lambda literals: min(len(literal) for literal in literals))
+
+
+def _exact(item) -> Optional[FrozenSet[str]]:
+    """Every text a parsed item can match, if it is made of literals and alternatives only"""
+    op, av = item
+    if op is _LITERAL:
+        return frozenset([chr(av)])
+    if op is _IN and all(member_op is _LITERAL for member_op, _ in av):
+        return frozenset(chr(value) for _, value in av)
+    if op is _BRANCH:
+        texts = [_exact_sequence(branch) for branch in av[1]]
+        return None if any(text is None for text in texts) else frozenset().union(*texts)
+    if op is _SUBPATTERN and not av[1] and not av[2]:
+        return _exact_sequence(av[3])
+    return None
+
+
+def _exact_sequence(items) -> Optional[FrozenSet[str]]:
+    texts = frozenset([""])
+    for item in items:
+        exact = _exact(item)
+        if exact is None or len(texts) * len(exact) > MAX_KEYWORD_VARIANTS:
+            return None
+        texts = frozenset(text + part for text in texts for part in exact)
+    return texts
@@ -3,72 +3,251 @@
 
 import asyncio
 import base64
-import PyPDF2
-import pdf2image
-import pytesseract
-from PIL import Image, ImageEnhance
+import contextvars
 import io
 import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.deadline import Deadline
+from app.core.profiling import profiled
+from app.models.document import SOURCE_DIRECT, SOURCE_OCR, Document
+from app.services.admission import AdmissionRejected
+from app.services.ocr_backends import create_ocr_backend
+from app.services.page_cache import PageResultCache, page_fingerprints
+from app.services.page_images import decode_scan_image, page_scan_image
+from app.services.sandbox import ParseSandbox, in_worker, report_progress
+from app.services.scheduler import CostScheduler
+from app.services.triage import (
+    ROUTE_HYBRID,
+    ROUTE_OCR,
+    ROUTE_REJECT,
+    TEXT_PAGE_SECONDS,
+    Triage,
+    UnprocessableDocumentError,
+    triage_pdf,
+)
+
+# PyPDF2, pdf2image, pytesseract and PIL are imported lazily inside the methods
+# that need them, so a cold start (e.g. on Vercel) does not pay for the OCR stack
+# until the first OCR call or an explicit warm_up().
+if TYPE_CHECKING:
+    from PIL import Image
 
 class PDFProcessor:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        # OCR settings for better quality - more comprehensive character set
-        self.ocr_config = '--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyzÁÉÍÓÚÖÜŐŰáéíóúöüőű.,:;()[]{}%+-/gkjml '
+        # OCR engine (pytesseract subprocess by default, in-process tesserocr if configured)
+        self.ocr_backend = create_ocr_backend(settings.OCR_BACKEND)
+        # Dedicated OCR pool sized per worker process (see Settings.ocr_threads_per_worker)
+        self.ocr_threads = settings.ocr_threads_per_worker()
+        self.ocr_executor = ThreadPoolExecutor(max_workers=self.ocr_threads, thread_name_prefix="ocr")
+        # Parallelism comes from the pool; keep Tesseract single-threaded to avoid oversubscription
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+        # Queued documents start cheapest first (by triage estimate) instead of in arrival order
+        self.ocr_scheduler = CostScheduler(self.ocr_threads, settings.SCHEDULER_AGING)
+        self.text_scheduler = CostScheduler(
+            settings.SCHEDULER_TEXT_SLOTS or os.cpu_count() or 1, settings.SCHEDULER_AGING
+        )
+        # OCR text per page fingerprint; the prefix covers the settings that change OCR output
+        self.page_cache = PageResultCache(
+            settings.PAGE_CACHE_SIZE,
+            settings.PAGE_CACHE_TTL,
+            key_prefix=(
+                f"ocr:{settings.OCR_BACKEND}:{'|'.join(settings.OCR_LANGUAGES)}:"
+                f"{settings.OCR_DPI}:{int(settings.OCR_EMBEDDED_IMAGES)}:"
+            ),
+            shared_store=self._create_shared_store()
+        )
+        # Pages OCR'd from their embedded scan image vs. rendered by poppler
+        self.page_image_sources = Counter()
+        # Worker processes for parsing, rendering and OCR (PDF_SANDBOX); not nested inside a worker
+        self.sandbox = ParseSandbox.from_settings(self.ocr_threads) if settings.PDF_SANDBOX and not in_worker() else None
+    
+    def _create_shared_store(self):
+        if settings.PAGE_CACHE_SIZE <= 0:
+            return None
+        from app.services.shared_cache import create_shared_store
+        
+        return create_shared_store()
+    
+    async def extract_text_from_pdf(
+        self,
+        pdf_data: bytes,
+        on_progress: Optional[Callable[[str, Dict], None]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> str:
+        """Asynchronously extracts text from PDF (text or scanned); see extract_document"""
+        document = await self.extract_document(pdf_data, on_progress=on_progress, deadline=deadline)
+        return document.text
     
-    async def extract_text_from_pdf(self, pdf_data: bytes) -> str:
+    async def triage(self, pdf_data: bytes) -> Triage:
+        """triage_pdf off the event loop"""
+        loop = asyncio.get_event_loop()
+        started = time.perf_counter()
+        if self.sandbox:
+            triage = await self.sandbox.run(triage_pdf, pdf_data)
+        else:
+            triage = await loop.run_in_executor(None, contextvars.copy_context().run, profiled(triage_pdf), pdf_data)
+        triage.seconds = time.perf_counter() - started
+        return triage
+    
+    async def _count_unreadable_pages(
+        self, pdf_data: bytes, triage: Triage, reserve_ocr: Optional[Callable[[Optional[int]], None]]
+    ) -> None:
         """
-        Asynchronously extracts text from PDF (text or scanned) with improved processing
+        Page count from poppler for a PDF whose structure triage could not read, so all the
+        pages OCR will process are charged (reserve_ocr) and the job is scheduled by its size
         """
+        import pdf2image
+
+        loop = asyncio.get_event_loop()
         try:
-            self.logger.info("Starting PDF text extraction...")
+            pages = int((await loop.run_in_executor(None, pdf2image.pdfinfo_from_bytes, pdf_data))["Pages"])
+        except Exception as e:
+            self.logger.warning("Page count of unreadable PDF unavailable (%s), holding the OCR budget", e)
+            if reserve_ocr:
+                reserve_ocr(None)
+            return
+        if settings.TRIAGE_MAX_PAGES and pages > settings.TRIAGE_MAX_PAGES:
+            raise UnprocessableDocumentError(f"more than {settings.TRIAGE_MAX_PAGES} pages")
+        if reserve_ocr and pages > triage.ocr_pages:
+            reserve_ocr(pages - triage.ocr_pages)
+        triage.pages = pages
+        triage.ocr_page_numbers = list(range(1, pages + 1))
+        triage.pages_known = True
+    
+    async def extract_document(
+        self,
+        pdf_data: bytes,
+        on_progress: Optional[Callable[[str, Dict], None]] = None,
+        deadline: Optional[Deadline] = None,
+        triage: Optional[Triage] = None,
+        reserve_ocr: Optional[Callable[[Optional[int]], None]] = None
+    ) -> Document:
+        """
+        Extracts cleaned per-page text from PDF (text or scanned) with improved processing.
+        on_progress, if given, is called with ("triage", ...), ("direct_text", ...) and
+        ("ocr_page", ...) events; it may be called from an executor thread. With a deadline,
+        OCR stops taking new pages once the remaining budget is low. triage (computed here
+        if not given) routes scans straight to OCR and limits OCR to the scanned pages of
+        hybrid documents; rejected documents raise UnprocessableDocumentError. reserve_ocr,
+        if given, is called with the number of pages before OCR that triage did not charge
+        for (a text layer too poor to use, or an unreadable structure whose real page count
+        only poppler knows; None if not even poppler does) and may raise to refuse it, e.g.
+        AdmissionRejected.
+        """
+        if triage is None:
+            triage = await self.triage(pdf_data)
+        if triage.route == ROUTE_REJECT:
+            raise UnprocessableDocumentError(triage.reason)
+        if on_progress:
+            on_progress("triage", triage.as_dict())
+        
+        try:
+            self.logger.info("Starting PDF text extraction (%s route, %s pages)...", triage.route, triage.pages)
             
-            # Check if data looks like a PDF
-            if not pdf_data.startswith(b'%PDF'):
-                self.logger.warning("Data doesn't appear to be a PDF file")
-                raise Exception("Not a valid PDF file")
+            if triage.route == ROUTE_OCR:
+                if not triage.pages_known:
+                    await self._count_unreadable_pages(pdf_data, triage, reserve_ocr)
+                # No text layer anywhere: skip the direct pass
+                if on_progress:
+                    on_progress("direct_text", {"chars": 0, "needs_ocr": True})
+                ocr_document = await self._extract_text_with_ocr(
+                    pdf_data, on_progress=on_progress, deadline=deadline, triage=triage
+                )
+                return ocr_document.map_pages(self._clean_text)
             
             # Attempt to extract text directly from PDF
-            text = await self._extract_direct_text(pdf_data)
+            async with self.text_scheduler.slot(triage.pages * TEXT_PAGE_SECONDS, triage.route):
+                direct_pages = await self._extract_direct_text(pdf_data)
+            text = "\n".join(direct_pages)
+            quality_good = self._is_text_quality_good(text)
+            
+            if on_progress:
+                on_progress("direct_text", {"chars": len(text), "needs_ocr": not quality_good})
             
             # Check quality of extracted text
-            if self._is_text_quality_good(text):
-                self.logger.info(f"Direct text extraction successful: {len(text)} characters")
-                return self._clean_text(text)
+            if quality_good:
+                self.logger.info("Direct text extraction successful: %s characters", len(text))
+                return Document.from_texts(direct_pages, SOURCE_DIRECT).map_pages(self._clean_text)
             
             self.logger.info("Direct extraction insufficient, trying OCR...")
             
-            # If text is insufficient or quality is poor, try OCR
-            ocr_text = await self._extract_text_with_ocr(pdf_data)
+            # If text is insufficient or quality is poor, try OCR (only the scanned pages of a hybrid PDF)
+            ocr_pages = triage.ocr_page_numbers if triage.route == ROUTE_HYBRID else None
+            if ocr_pages is None and reserve_ocr:
+                reserve_ocr(triage.pages)
+            ocr_document = await self._extract_text_with_ocr(
+                pdf_data, on_progress=on_progress, deadline=deadline, pages=ocr_pages, triage=triage
+            )
             
-            # Combine results if possible
-            if text and ocr_text:
-                combined_text = f"{text}\n{ocr_text}"
-                self.logger.info(f"Combined text extraction: {len(combined_text)} characters")
-                return self._clean_text(combined_text)
+            # Combine results if possible; without OCR text the poor direct text is not used
+            document = Document()
+            if ocr_pages and len(ocr_document):
+                # OCR text replaces the direct text of the scanned pages, in page order
+                ocr_spans = {span.page: span for span in ocr_document}
+                for number, page_text in enumerate(direct_pages, start=1):
+                    span = ocr_spans.get(number)
+                    if span is None:
+                        document.add_page(self._clean_text(page_text), number, SOURCE_DIRECT)
+                    else:
+                        document.add_page(
+                            self._clean_text(ocr_document.page_text(span)), number, SOURCE_OCR, span.confidence
+                        )
+                self.logger.info("Combined text extraction: %s characters", len(document))
+            elif len(ocr_document):
+                for number, page_text in enumerate(direct_pages, start=1):
+                    document.add_page(self._clean_text(page_text), number, SOURCE_DIRECT)
+                for span in ocr_document:
+                    document.add_page(
+                        self._clean_text(ocr_document.page_text(span)), span.page, SOURCE_OCR, span.confidence
+                    )
+                self.logger.info("Combined text extraction: %s characters", len(document))
             
-            return self._clean_text(ocr_text) if ocr_text else ""
+            return document
             
+        except (UnprocessableDocumentError, AdmissionRejected, MemoryError):
+            raise
         except Exception as e:
-            self.logger.error(f"Error extracting text from PDF: {e}")
+            self.logger.error("Error extracting text from PDF: %s", e)
             raise Exception(f"Error extracting text from PDF: {str(e)}")
     
-    async def _extract_direct_text(self, pdf_data: bytes) -> str:
-        """Extracts text from text-based PDF"""
-        loop = asyncio.get_event_loop()
-        
-        def extract_text():
-            text = ""
-            try:
-                with io.BytesIO(pdf_data) as pdf_file:
-                    pdf_reader = PyPDF2.PdfReader(pdf_file)
-                    for page in pdf_reader.pages:
-                        text += page.extract_text() + "\n"
-            except Exception as e:
-                print(f"Direct text extraction failed: {e}")
-            return text
+    def document_from_texts(self, pages: List[str]) -> Document:
+        """Document for page texts extracted elsewhere, cleaned like a PDF's text layer"""
+        return Document.from_texts(pages, SOURCE_DIRECT).map_pages(self._clean_text)
+    
+    async def _extract_direct_text(self, pdf_data: bytes) -> List[str]:
+        """Extracts text from text-based PDF, one string per page"""
+        if self.sandbox:
+            return await self.sandbox.run(_isolated_direct_text, pdf_data)
         
-        return await loop.run_in_executor(None, extract_text)
+        loop = asyncio.get_event_loop()
+        # copy_context keeps the request id on log records from the worker thread
+        return await loop.run_in_executor(
+            None, contextvars.copy_context().run, profiled(self._direct_page_texts), pdf_data
+        )
+    
+    def _direct_page_texts(self, pdf_data: bytes) -> List[str]:
+        import PyPDF2
+
+        pages = []
+        try:
+            with io.BytesIO(pdf_data) as pdf_file:
+                pdf_reader = PyPDF2.PdfReader(pdf_file)
+                for page in pdf_reader.pages:
+                    pages.append(page.extract_text())
+        except MemoryError:
+            # Over the sandbox's memory limit: let the worker report it instead of returning no text
+            raise
+        except Exception as e:
+            self.logger.warning("Direct text extraction failed: %s", e)
+        return pages
     
     def _is_text_quality_good(self, text: str) -> bool:
         """Validates extracted text quality"""
@@ -138,54 +317,217 @@ class PDFProcessor:
         
         return cleaned_text
     
-    async def _extract_text_with_ocr(self, pdf_data: bytes) -> str:
-        """Extracts text from scanned PDF using improved OCR"""
-        loop = asyncio.get_event_loop()
-        
-        def perform_ocr():
-            text = ""
-            try:
-                self.logger.info("Starting OCR processing...")
-                
-                # Convert PDF to images with high resolution
-                images = pdf2image.convert_from_bytes(
-                    pdf_data, 
-                    dpi=300,  # High resolution for better OCR
-                    first_page=None,
-                    last_page=None,
-                    fmt='jpeg',
-                    jpegopt={'quality': 95, 'optimize': True}
+    async def _extract_text_with_ocr(
+        self,
+        pdf_data: bytes,
+        on_progress: Optional[Callable[[str, Dict], None]] = None,
+        deadline: Optional[Deadline] = None,
+        pages: Optional[List[int]] = None,
+        triage: Optional[Triage] = None
+    ) -> Document:
+        """
+        Extracts text from scanned PDF using improved OCR, one OCR page span per rendered page.
+        pages limits OCR to those 1-based page numbers (default: all pages). The job waits
+        for an OCR thread in order of its estimated cost (pages to OCR, from triage). The time
+        the OCR itself took is added to triage.ocr_seconds, for the admission estimates.
+        """
+        page_count = len(pages) if pages is not None else (triage.pages if triage else 1)
+        cost = page_count * settings.OCR_PAGE_SECONDS
+        async with self.ocr_scheduler.slot(cost, triage.route if triage else ROUTE_OCR):
+            started = time.perf_counter()
+            if self.sandbox:
+                document, reasons = await self.sandbox.run(
+                    _isolated_ocr, pdf_data, pages, deadline.remaining() if deadline else None,
+                    on_progress=on_progress
                 )
+                for reason in reasons:
+                    deadline.degrade(reason)
+            else:
+                loop = asyncio.get_event_loop()
+                document = await loop.run_in_executor(
+                    self.ocr_executor, contextvars.copy_context().run, profiled(self._ocr_document),
+                    pdf_data, pages, on_progress, deadline
+                )
+            if triage:
+                triage.ocr_seconds += time.perf_counter() - started
+                triage.ocr_pages_done += len(document.pages)
+            return document
+    
+    def _ocr_document(
+        self,
+        pdf_data: bytes,
+        pages: Optional[List[int]],
+        on_progress: Optional[Callable[[str, Dict], None]],
+        deadline: Optional[Deadline]
+    ) -> Document:
+        # page number -> (text, confidence); pages unchanged since an earlier upload come from the cache
+        results: Dict[int, Tuple[str, Optional[float]]] = {}
+        try:
+            self.logger.info("Starting OCR processing...")
+            
+            fingerprints = self._page_fingerprints(pdf_data)
+            wanted = pages if pages is not None else range(1, len(fingerprints) + 1)
+            for number in wanted:
+                if number <= len(fingerprints):
+                    cached = self.page_cache.get(fingerprints[number - 1])
+                    if cached is not None:
+                        results[number] = cached
+            pending = pages
+            if results:
+                self.logger.info("Reusing OCR text of %s/%s unchanged pages", len(results), len(wanted))
+                pending = [number for number in wanted if number not in results]
+                if on_progress:
+                    for number, (cached_text, _) in sorted(results.items()):
+                        on_progress("ocr_page", {
+                            "page": number, "pages": len(fingerprints), "chars": len(cached_text), "cached": True
+                        })
+            
+            if pending != []:
+                self._ocr_pages(pdf_data, pending, fingerprints, results, on_progress, deadline)
                 
-                self.logger.info(f"Converted PDF to {len(images)} images")
-                
-                for i, image in enumerate(images):
-                    self.logger.info(f"Processing page {i + 1}/{len(images)}")
-                    
-                    # Enhance image for better OCR
-                    enhanced_image = self._enhance_image_for_ocr(image)
-                    
-                    # Extract text using Tesseract
-                    page_text = self._extract_text_from_image(enhanced_image)
-                    
-                    if page_text:
-                        # Clean and improve extracted text
-                        cleaned_text = self._clean_ocr_text(page_text)
-                        text += cleaned_text + "\n"
-                        self.logger.info(f"Page {i + 1}: extracted {len(cleaned_text)} characters")
-                    else:
-                        self.logger.warning(f"Page {i + 1}: no text extracted")
-                    
-            except Exception as e:
-                self.logger.error(f"OCR extraction failed: {e}")
+        except MemoryError:
+            raise
+        except Exception as e:
+            self.logger.error("OCR extraction failed: %s", e)
+        
+        document = Document()
+        for number in sorted(results):
+            page_text, confidence = results[number]
+            document.add_page(page_text, number, SOURCE_OCR, confidence)
+        self.logger.info("OCR completed: %s total characters", len(document))
+        return document
+    
+    def _ocr_pages(
+        self,
+        pdf_data: bytes,
+        pages: Optional[List[int]],
+        fingerprints: List[str],
+        results: Dict[int, Tuple[str, Optional[float]]],
+        on_progress: Optional[Callable[[str, Dict], None]],
+        deadline: Optional[Deadline]
+    ) -> None:
+        """OCR the given page numbers (all pages if None) into results and the page cache"""
+        page_count, images = self._iter_page_images(pdf_data, deadline is not None, pages)
+        page_seconds = settings.OCR_PAGE_SECONDS
+        ocr_started = time.monotonic()
+        
+        for i, (number, image) in enumerate(images):
+            # Leave the LLM stage its minimum budget; the pages done so far are still used
+            if deadline and deadline.remaining() < page_seconds + settings.DEADLINE_LLM_MIN_SECONDS:
+                self.logger.warning("Deadline near, OCR stopped before page %s/%s", number, page_count)
+                deadline.degrade("ocr_incomplete")
+                break
+            
+            self.logger.info("Processing page %s/%s", number, page_count)
+            
+            # Enhance image for better OCR
+            enhanced_image = self._enhance_image_for_ocr(image)
+            
+            # Extract text using Tesseract
+            page_text, confidence = self._extract_text_from_image(enhanced_image)
+            
+            cleaned_text = ""
+            if page_text:
+                # Clean and improve extracted text
+                cleaned_text = self._clean_ocr_text(page_text)
+                self.logger.info("Page %s: extracted %s characters", number, len(cleaned_text))
+            else:
+                self.logger.warning("Page %s: no text extracted", number)
+            results[number] = (cleaned_text, confidence)
+            # Empty pages are not cached: they may be OCR failures worth retrying
+            if cleaned_text and number <= len(fingerprints):
+                self.page_cache.put(fingerprints[number - 1], cleaned_text, confidence)
             
-            self.logger.info(f"OCR completed: {len(text)} total characters")
-            return text
+            if on_progress:
+                on_progress("ocr_page", {"page": number, "pages": page_count, "chars": len(cleaned_text)})
+            
+            page_seconds = (time.monotonic() - ocr_started) / (i + 1)
+    
+    def _page_fingerprints(self, pdf_data: bytes) -> List[str]:
+        """Content fingerprint per page for the page cache; empty if disabled or the PDF cannot be parsed"""
+        if not self.page_cache.enabled:
+            return []
+        try:
+            return page_fingerprints(pdf_data)
+        except MemoryError:
+            raise
+        except Exception as e:
+            self.logger.warning("Page fingerprinting failed: %s", e)
+            return []
+    
+    def _iter_page_images(
+        self,
+        pdf_data: bytes,
+        per_page: bool,
+        pages: Optional[List[int]] = None
+    ) -> Tuple[int, Iterator[Tuple[int, "Image.Image"]]]:
+        """
+        Page count and (page number, image) pairs at OCR resolution, for the given
+        page numbers or all pages. A page that is one embedded scan image yields that
+        image, decoded once; other pages are rendered by poppler. With per_page (or a
+        page subset), pages are rendered one at a time so OCR can stop early without
+        rendering the rest.
+        """
+        import pdf2image
+
+        options = {"dpi": settings.OCR_DPI, "fmt": "jpeg", "jpegopt": {"quality": 95, "optimize": True}}
+        scans = self._scan_images(pdf_data) if settings.OCR_EMBEDDED_IMAGES else None
+        
+        if not per_page and pages is None and not (scans and any(scans)):
+            images = pdf2image.convert_from_bytes(pdf_data, **options)
+            self.logger.info("Converted PDF to %s images", len(images))
+            self.page_image_sources["rendered"] += len(images)
+            return len(images), enumerate(images, start=1)
+        
+        page_count = len(scans) if scans is not None else pdf2image.pdfinfo_from_bytes(pdf_data)["Pages"]
         
-        return await loop.run_in_executor(None, perform_ocr)
+        def render():
+            for page in (pages if pages is not None else range(1, page_count + 1)):
+                scan = scans[page - 1] if scans and page <= len(scans) else None
+                if scan is not None:
+                    try:
+                        image = decode_scan_image(*scan, dpi=options["dpi"])
+                        self.page_image_sources["embedded"] += 1
+                        yield page, image
+                        continue
+                    except MemoryError:
+                        raise
+                    except Exception as e:
+                        self.logger.warning("Page %s: embedded image not decodable (%s), rendering", page, e)
+                for image in pdf2image.convert_from_bytes(pdf_data, first_page=page, last_page=page, **options):
+                    self.page_image_sources["rendered"] += 1
+                    yield page, image
+        
+        return page_count, render()
     
-    def _enhance_image_for_ocr(self, image: Image.Image) -> Image.Image:
+    def _scan_images(self, pdf_data: bytes) -> Optional[List[Optional[tuple]]]:
+        """Per page, (page, image XObject) if the page is one embedded scan image, else None; None if unparsable"""
+        import PyPDF2
+
+        try:
+            reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
+            if reader.is_encrypted:
+                reader.decrypt("")
+            scans = []
+            for page in reader.pages:
+                try:
+                    xobject = page_scan_image(page)
+                except MemoryError:
+                    raise
+                except Exception:
+                    xobject = None
+                scans.append((page, xobject) if xobject is not None else None)
+            return scans
+        except MemoryError:
+            raise
+        except Exception as e:
+            self.logger.warning("Embedded image lookup failed, rendering all pages: %s", e)
+            return None
+    
+    def _enhance_image_for_ocr(self, image: "Image.Image") -> "Image.Image":
         """Enhances image for better OCR"""
+        from PIL import Image, ImageEnhance
+
         try:
             # Increase resolution
             width, height = image.size
@@ -208,38 +550,75 @@ class PDFProcessor:
             
             return image
             
+        except MemoryError:
+            raise
         except Exception as e:
-            self.logger.error(f"Image enhancement failed: {e}")
+            self.logger.error("Image enhancement failed: %s", e)
             return image
     
-    def _extract_text_from_image(self, image: Image.Image) -> str:
-        """Extracts text from image using Tesseract"""
+    def _extract_text_from_image(self, image: "Image.Image") -> Tuple[str, Optional[float]]:
+        """Extracts text and mean confidence (if the engine reports it) from image using Tesseract"""
         try:
             # Try different languages and settings
-            languages_to_try = ['hun+eng', 'hun', 'eng']
+            languages_to_try = settings.OCR_LANGUAGES
             
             for lang in languages_to_try:
                 try:
-                    text = pytesseract.image_to_string(
-                        image, 
-                        lang=lang,
-                        config=self.ocr_config
-                    )
+                    text, confidence = self.ocr_backend.recognize(image, lang=lang)
                     if text and len(text.strip()) > 10:
-                        self.logger.info(f"OCR successful with language: {lang}")
-                        return text
+                        self.logger.info("OCR successful with language: %s", lang)
+                        return text, confidence
+                except MemoryError:
+                    raise
                 except Exception as e:
-                    self.logger.debug(f"OCR failed with language {lang}: {e}")
+                    self.logger.debug("OCR failed with language %s: %s", lang, e)
                     continue
             
             # If all languages failed, try without language specification
-            text = pytesseract.image_to_string(image, config=self.ocr_config)
-            return text
+            return self.ocr_backend.recognize(image)
             
+        except MemoryError:
+            raise
         except Exception as e:
-            self.logger.error(f"Tesseract extraction failed: {e}")
-            return ""
+            self.logger.error("Tesseract extraction failed: %s", e)
+            return "", None
     
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Imports the PDF/OCR stack and runs Tesseract once per configured language,
+        so the first scanned upload does not pay for module imports and tessdata loading
+        """
+        timings = {}
+
+        start = time.perf_counter()
+        import PyPDF2  # noqa: F401
+        import pdf2image  # noqa: F401
+        import pytesseract  # noqa: F401
+        from PIL import Image  # noqa: F401
+        timings["imports"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if self.ocr_backend.per_thread:
+            # One warm-up in every OCR thread, where requests will find the engines later
+            barrier = threading.Barrier(self.ocr_threads)
+            futures = [self.ocr_executor.submit(self._warm_up_ocr_thread, barrier) for _ in range(self.ocr_threads)]
+            for future in futures:
+                future.result()
+        else:
+            self.ocr_backend.warm_up(settings.OCR_LANGUAGES)
+        timings["tesseract"] = time.perf_counter() - start
+
+        return timings
+
+    def _warm_up_ocr_thread(self, barrier: threading.Barrier) -> None:
+        """Runs in an OCR thread; the barrier keeps it busy until every thread has taken one"""
+        try:
+            barrier.wait(timeout=30)
+        except threading.BrokenBarrierError:
+            # Some threads are busy with requests already; they load their engines then
+            pass
+        self.ocr_backend.warm_up(settings.OCR_LANGUAGES)
+
     async def process_base64_pdf(self, base64_string: str) -> bytes:
         """Converts base64 string to bytes"""
         try:
@@ -295,3 +674,29 @@ class PDFProcessor:
             cleaned_text = cleaned_text.replace(wrong, correct)
         
         return cleaned_text
+
+
+# Entry points for sandbox worker processes (PDF_SANDBOX): each worker builds its own processor once
+_worker_pdf_processor: Optional[PDFProcessor] = None
+
+
+def _worker_processor() -> PDFProcessor:
+    global _worker_pdf_processor
+    if _worker_pdf_processor is None:
+        _worker_pdf_processor = PDFProcessor()
+    return _worker_pdf_processor
+
+
+def _isolated_direct_text(pdf_data: bytes) -> List[str]:
+    return _worker_processor()._direct_page_texts(pdf_data)
+
+
+def _isolated_ocr(
+    pdf_data: bytes,
+    pages: Optional[List[int]],
+    remaining: Optional[float]
+) -> Tuple[Document, List[str]]:
+    """OCR document and the deadline degradation reasons, for a deadline with remaining seconds left"""
+    deadline = Deadline(remaining) if remaining is not None else None
+    document = _worker_processor()._ocr_document(pdf_data, pages, report_progress, deadline)
+    return document, deadline.reasons if deadline else []
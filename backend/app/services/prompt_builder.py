@@ -0,0 +1,190 @@
+"""Prompt construction for Gemini extraction with input-size accounting"""
+import logging
+import math
+import re
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+from app.models.document import Document
+
+# Rough characters per token for Latin-script text; reported usage shows the real counts
+CHARS_PER_TOKEN = 4.0
+
+TEXT_PLACEHOLDER = "{text}"
+
+DEFAULT_TEMPLATE = """Extract allergens and nutritional values from the following text. Return ONLY valid JSON.
+
+ALLERGEN EXTRACTION:
+- Use true/false boolean values
+- Mark TRUE for: "+", "I", "X", "Igen", "tartalmaz", "contains", "may contain"
+- Mark FALSE for: "-", "N", "Nem", "mentes", "free from", "allergen-free"
+
+ALLERGEN PATTERNS:
+- +/I/X/Igen/tartalmaz = TRUE
+- -/N/Nem/mentes = FALSE
+
+NUTRITION EXTRACTION:
+- Extract ALL nutrients: Energy, Fat, Carbohydrate, Sugar, Protein, Sodium
+- NEVER return "N/A" unless truly not found (99% of products have these)
+- Look for values in ANY format: "6,9 g", "6.9 g", "6,9", "0,9 g", "0.9 g"
+- FAT: Find "Zsír", "Fat", "lipides", "grasas" - extract value like "6,9 g" or "0,9 g"
+- CARBOHYDRATE: Find "Szénhidrát", "Carbohydrate" - extract value
+- SUGAR: Look for "amelyből cukrok", "cukor", "sugar" - ALWAYS extract if present
+- PROTEIN: Look for "Fehérje", "Protein" - extract value
+- 
+- Ignore only sub-lines like "- ebből telített zsírsavak"
+
+REQUIRED ALLERGENS TO EXTRACT:
+- Gluten (wheat, barley, rye, oats, glutén, búza, gluténtartalmú)
+- Egg (eggs, egg products, tojás)
+- Crustaceans (shellfish, shrimp, crab, lobster, rák, rákfélék)
+- Fish (any fish species, hal)
+- Peanut (peanuts, groundnuts, mogyoró, földimogyoró)
+- Soy (soybeans, soy products, szója, szójabab)
+- Milk (dairy, lactose, milk products, tej, laktóz)
+- Tree nuts (almonds, walnuts, hazelnuts, etc., dió, diófélék, csonthéjasok)
+- Celery (celery root, celery leaves, zeller)
+- Mustard (mustard seeds, mustard powder, mustár)
+
+TEXT TO ANALYZE:
+{text}
+
+Return ONLY this JSON format:
+{
+  "allergens": {
+    "gluten": true/false,
+    "egg": true/false,
+    "crustaceans": true/false,
+    "fish": true/false,
+    "peanut": true/false,
+    "soy": true/false,
+    "milk": true/false,
+    "tree_nuts": true/false,
+    "celery": true/false,
+    "mustard": true/false
+  },
+  "nutrients": {
+    "energy": "value unit" or "N/A",
+    "fat": "value unit" or "N/A",
+    "carbohydrate": "value unit" or "N/A",
+    "sugar": "value unit" or "N/A",
+    "protein": "value unit" or "N/A",
+    "sodium": "value unit" or "N/A"
+  }
+}"""
+
+# Terms that mark the parts of a long document worth sending when it has to be cut
+RELEVANT_TERMS = re.compile(
+    r'energia|energy|kcal|kj|zsír|zsir|fat|szénhidrát|carbohydrate|cukor|sugar|fehérje|protein|'
+    r'nátrium|sodium|salt|\bsó\b|allerg|glutén|gluten|tojás|egg|tej|milk|laktóz|szója|soy|'
+    r'mogyoró|peanut|dió|nuts|zeller|celery|mustár|mustard|\bhal\b|fish|rák|crustacean',
+    re.IGNORECASE
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class BuiltPrompt:
+    """A prompt ready to send, with its estimated size"""
+
+    __slots__ = ("prompt", "estimated_tokens", "input_chars", "truncated")
+
+    def __init__(self, prompt: str, estimated_tokens: int, input_chars: int, truncated: bool):
+        self.prompt = prompt
+        self.estimated_tokens = estimated_tokens
+        self.input_chars = input_chars  # document characters included in the prompt
+        self.truncated = truncated
+
+
+class PromptBuilder:
+    """
+    Fills a template's {text} slot with document text. The static parts are split
+    once at construction, so building a prompt is one concatenation. Input longer
+    than max_input_tokens is cut to the most relevant pages, or to the window with
+    the most nutrition/allergen terms when pages alone do not fit.
+    """
+
+    def __init__(self, template: str = DEFAULT_TEMPLATE, max_input_tokens: int = 8000):
+        if template.count(TEXT_PLACEHOLDER) != 1:
+            raise ValueError(f"Prompt template must contain {TEXT_PLACEHOLDER} exactly once")
+        self.logger = logging.getLogger(__name__)
+        self.prefix, self.suffix = template.split(TEXT_PLACEHOLDER)
+        self.static_tokens = estimate_tokens(self.prefix) + estimate_tokens(self.suffix)
+        self.max_input_tokens = max_input_tokens
+        self.max_input_chars = int(max_input_tokens * CHARS_PER_TOKEN)
+
+    @classmethod
+    def from_settings(cls) -> "PromptBuilder":
+        template = DEFAULT_TEMPLATE
+        if settings.PROMPT_TEMPLATE_PATH:
+            with open(settings.PROMPT_TEMPLATE_PATH, encoding="utf-8") as f:
+                template = f.read()
+        return cls(template, settings.GEMINI_MAX_INPUT_TOKENS)
+
+    def build(self, text: str, document: Optional[Document] = None) -> BuiltPrompt:
+        """Prompt for text; document (the same text split into pages) enables page-level selection"""
+        text, truncated = self.fit(text, document)
+        if truncated:
+            self.logger.warning("Prompt input cut to %s chars (budget %s tokens)", len(text), self.max_input_tokens)
+        return BuiltPrompt(
+            self.prefix + text + self.suffix,
+            self.static_tokens + estimate_tokens(text),
+            len(text),
+            truncated
+        )
+
+    def fit(self, text: str, document: Optional[Document] = None) -> Tuple[str, bool]:
+        """text cut to the input budget; returns (text, truncated)"""
+        budget = self.max_input_chars
+        if len(text) <= budget:
+            return text, False
+
+        if document is not None and len(document.pages) > 1:
+            selected = self._select_pages(document, budget)
+            if selected:
+                return selected, True
+
+        return self._window(text, budget), True
+
+    def relevant_text(self, document: Document) -> str:
+        """Text of the pages mentioning any nutrition/allergen term, in document order"""
+        return document.separator.join(
+            document.page_text(span) for span in document.pages
+            if len(span) and RELEVANT_TERMS.search(document.page_text(span))
+        )
+
+    def _select_pages(self, document: Document, budget: int) -> str:
+        """Pages with the most relevant terms that fit in budget, in document order"""
+        spans = [span for span in document.pages if len(span)]
+        ranked = sorted(spans, key=lambda span: (-len(RELEVANT_TERMS.findall(document.page_text(span))), span.start))
+        chosen = []
+        used = 0
+        for span in ranked:
+            cost = len(span) + len(document.separator)
+            if used + cost <= budget:
+                chosen.append(span)
+                used += cost
+        chosen.sort(key=lambda span: span.start)
+        return document.separator.join(document.page_text(span) for span in chosen)
+
+    @staticmethod
+    def _window(text: str, budget: int) -> str:
+        """The budget-sized slice of text containing the most relevant terms"""
+        hits: List[int] = [match.start() for match in RELEVANT_TERMS.finditer(text)]
+        if not hits:
+            return text[:budget]
+
+        # Two pointers over hit positions: most hits within budget characters
+        best_start, best_count = hits[0], 0
+        right = 0
+        for left, start in enumerate(hits):
+            while right < len(hits) and hits[right] < start + budget:
+                right += 1
+            if right - left > best_count:
+                best_start, best_count = start, right - left
+
+        # Labels usually precede their values; keep some text before the first hit
+        start = max(0, min(best_start - budget // 10, len(text) - budget))
+        return text[start:start + budget]
@@ -0,0 +1,284 @@
+"""Isolated PDF processing: parsing, rendering and OCR in resource-limited worker processes"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.logging_config import request_id_var
+from app.core.profiling import RequestProfile, profile_var, run_with_stats
+from app.services.triage import UnprocessableDocumentError
+
+# Set in worker processes; progress events of the running task go to the parent
+_connection = None
+
+
+class SandboxLimitError(UnprocessableDocumentError):
+    """A document exceeded a sandbox limit (time, CPU or memory) and its worker was killed; mapped to 422"""
+
+
+class _WorkerLost(Exception):
+    """The worker process died or was killed while running a task"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def in_worker() -> bool:
+    """True inside a sandbox worker process"""
+    return _connection is not None
+
+
+def report_progress(event: str, data: Dict) -> None:
+    """on_progress for code running in a worker: forwards the event to the parent"""
+    if _connection is not None:
+        _connection.send(("event", (event, data)))
+
+
+def _worker_main(connection, cpu_seconds: int, memory_mb: int) -> None:
+    """Worker loop: run (function, args) tasks one at a time until told to stop"""
+    global _connection
+    _connection = connection
+    if hasattr(os, "setsid"):
+        # Own process group, so poppler/tesseract children are killed with the worker
+        os.setsid()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        import resource
+    except ImportError:  # Windows: wall-clock timeout only
+        resource = None
+    if resource is not None and memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        function, args, request_id, profile = task
+        request_id_var.set(request_id)
+        if resource is not None and cpu_seconds > 0:
+            # RLIMIT_CPU counts the whole process lifetime; allow cpu_seconds more for this task
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            used = int(usage.ru_utime + usage.ru_stime)
+            resource.setrlimit(resource.RLIMIT_CPU, (used + cpu_seconds, resource.RLIM_INFINITY))
+        try:
+            if profile:
+                # The request is being profiled: its stats are merged into the parent's profile
+                result, stats = run_with_stats(function, *args)
+                connection.send(("profile", stats))
+            else:
+                result = function(*args)
+            connection.send(("result", result))
+        except MemoryError:
+            connection.send(("lost", "memory limit exceeded"))
+            return
+        except Exception as e:
+            connection.send(("error", f"{e.__class__.__name__}: {e}"))
+
+
+class _Worker:
+    """One worker process and the pipe to it; used by one task at a time"""
+
+    def __init__(self, context, cpu_seconds: int, memory_mb: int):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child, cpu_seconds, memory_mb), daemon=True, name="pdf-sandbox"
+        )
+        self.process.start()
+        child.close()
+        self.tasks = 0
+
+    def call(
+        self,
+        function: Callable,
+        args: tuple,
+        timeout: float,
+        on_progress: Optional[Callable[[str, Dict], None]],
+        request_id: str,
+        profile: Optional[RequestProfile] = None
+    ) -> Any:
+        """Run function(*args) in the worker, forwarding progress events and profile stats; blocks the calling thread"""
+        self.tasks += 1
+        deadline = time.monotonic() + timeout
+        try:
+            self.connection.send((function, args, request_id, profile is not None))
+            while True:
+                if not self.connection.poll(max(0.0, deadline - time.monotonic())):
+                    raise _WorkerLost("processing time limit exceeded")
+                kind, payload = self.connection.recv()
+                if kind == "event":
+                    if on_progress:
+                        on_progress(*payload)
+                elif kind == "profile":
+                    if profile:
+                        profile.add_stats(payload)
+                elif kind == "result":
+                    return payload
+                elif kind == "lost":
+                    raise _WorkerLost(payload)
+                else:
+                    raise Exception(payload)
+        except (EOFError, OSError):
+            self.process.join(1)
+            raise _WorkerLost(self._exit_reason())
+
+    def _exit_reason(self) -> str:
+        code = self.process.exitcode
+        if code == -getattr(signal, "SIGXCPU", 0):
+            return "CPU time limit exceeded"
+        if code == -signal.SIGKILL:
+            return "worker killed (out of memory?)"
+        return f"worker crashed (exit code {code})"
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self) -> None:
+        """SIGKILL the worker and its process group; does not wait (see reap)"""
+        try:
+            if hasattr(os, "killpg") and self.process.pid:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def reap(self) -> None:
+        """Wait for a killed worker to exit and close the pipe; blocks the calling thread"""
+        self.process.join(1)
+        self.connection.close()
+
+    def stop(self) -> None:
+        """Let the worker exit after its last task"""
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.connection.close()
+
+
+class ParseSandbox:
+    """
+    Pool of worker processes (spawned, so no server state is inherited) that run one
+    document at a time under an address-space limit (RLIMIT_AS), a CPU-time limit per
+    task (RLIMIT_CPU) and a wall-clock timeout. A worker that runs out of time or
+    memory is killed with its process group and replaced; the task raises
+    SandboxLimitError. Workers are replaced after max_tasks documents to return
+    fragmented heap (PIL, tesseract buffers) to the OS. Processes start on first use.
+    """
+
+    def __init__(self, workers: int, max_tasks: int, timeout: float, cpu_seconds: int, memory_mb: int):
+        self.logger = logging.getLogger(__name__)
+        self.workers = max(1, workers)
+        self.max_tasks = max(1, max_tasks)
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: List[_Worker] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Blocking pipe reads, one thread per busy worker
+        self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sandbox")
+        self.busy = 0
+        self.tasks = 0
+        self.started = 0
+        self.recycled = 0
+        self.killed: Counter = Counter()
+
+    @classmethod
+    def from_settings(cls, ocr_threads: int) -> "ParseSandbox":
+        return cls(
+            settings.SANDBOX_WORKERS or ocr_threads + 1,
+            settings.SANDBOX_MAX_TASKS,
+            settings.SANDBOX_TIMEOUT,
+            settings.SANDBOX_CPU_SECONDS,
+            settings.SANDBOX_MEMORY_MB
+        )
+
+    async def run(
+        self,
+        function: Callable,
+        *args,
+        on_progress: Optional[Callable[[str, Dict], None]] = None,
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        function(*args) in a worker process (function and arguments must be picklable).
+        Code in the worker reports progress with report_progress; the events reach
+        on_progress from a sandbox thread.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            worker = None
+            while self._idle and worker is None:
+                candidate = self._idle.pop()
+                if candidate.alive:
+                    worker = candidate
+            if worker is None:
+                worker = await loop.run_in_executor(self._threads, self._start_worker)
+
+            self.busy += 1
+            try:
+                result = await loop.run_in_executor(
+                    self._threads, worker.call, function, args, timeout or self.timeout, on_progress,
+                    request_id_var.get(), profile_var.get()
+                )
+            except _WorkerLost as e:
+                worker.kill()
+                await loop.run_in_executor(self._threads, worker.reap)
+                self.killed[e.reason] += 1
+                self.logger.warning("Sandboxed %s stopped: %s", function.__name__, e.reason)
+                raise SandboxLimitError(e.reason) from None
+            except asyncio.CancelledError:
+                # The request went away while the worker may still be mid-document; the
+                # signal is sent at once, the exit is waited for off the event loop
+                worker.kill()
+                loop.run_in_executor(self._threads, worker.reap)
+                raise
+            except Exception:
+                # The task raised; the worker itself is fine
+                self._idle.append(worker)
+                raise
+            finally:
+                self.busy -= 1
+                self.tasks += 1
+
+            if worker.tasks >= self.max_tasks:
+                worker.stop()
+                self.recycled += 1
+            else:
+                self._idle.append(worker)
+            return result
+
+    def _start_worker(self) -> _Worker:
+        self.started += 1
+        return _Worker(self._context, self.cpu_seconds, self.memory_mb)
+
+    def close(self) -> None:
+        while self._idle:
+            self._idle.pop().stop()
+        self._threads.shutdown(wait=False)
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "idle": len(self._idle),
+            "busy": self.busy,
+            "tasks": self.tasks,
+            "started": self.started,
+            "recycled": self.recycled,
+            "killed": dict(self.killed),
+        }
@@ -0,0 +1,104 @@
+"""Cost-aware ordering of queued PDF work: shortest estimated job first, with aging"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List
+
+
+class _ClassStats:
+    """Queue depth and wait times of one job class (e.g. a triage route)"""
+
+    __slots__ = ("queued", "started", "wait_total", "wait_max", "recent_waits")
+
+    def __init__(self):
+        self.queued = 0
+        self.started = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits = deque(maxlen=256)
+
+    def record_wait(self, seconds: float) -> None:
+        self.started += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        self.recent_waits.append(seconds)
+
+    def as_dict(self) -> Dict:
+        recent = sorted(self.recent_waits)
+        return {
+            "queued": self.queued,
+            "started": self.started,
+            "wait_mean": round(self.wait_total / self.started, 4) if self.started else 0.0,
+            "wait_p95": round(recent[max(0, math.ceil(0.95 * len(recent)) - 1)], 4) if recent else 0.0,
+            "wait_max": round(self.wait_max, 4),
+        }
+
+
+class CostScheduler:
+    """
+    Admits at most `slots` jobs at once (the size of the pool behind it). Waiting jobs
+    start in order of estimated cost (seconds) minus `aging` seconds of credit per second
+    waited, so a text PDF overtakes queued scans, and a scan is overtaken by newer
+    cheaper work for at most about cost / aging seconds. As every waiting job ages at
+    the same rate, the order is fixed at enqueue time: cost + aging * enqueue time.
+    All state lives on the event loop.
+    """
+
+    def __init__(self, slots: int, aging: float = 1.0):
+        self.slots = max(1, slots)
+        self.aging = aging
+        self.running = 0
+        self._queue: List[list] = []  # heap of [priority, sequence, future]
+        self._sequence = itertools.count()
+        self._classes: Dict[str, _ClassStats] = {}
+
+    @asynccontextmanager
+    async def slot(self, cost: float, job_class: str) -> AsyncIterator[None]:
+        """Hold one of the slots for the block, waiting in cost order if all are busy"""
+        stats = self._classes.setdefault(job_class, _ClassStats())
+        enqueued = time.monotonic()
+        if self.running < self.slots and not self._queue:
+            self.running += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, [cost + self.aging * enqueued, next(self._sequence), future])
+            stats.queued += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as the waiter was cancelled: pass it on
+                    self._release()
+                raise
+            finally:
+                stats.queued -= 1
+        stats.record_wait(time.monotonic() - enqueued)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        while self._queue:
+            future = heapq.heappop(self._queue)[2]
+            if not future.done():
+                # The slot passes straight to the next job; running stays the same
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    @property
+    def queued(self) -> int:
+        return sum(stats.queued for stats in self._classes.values())
+
+    def stats(self) -> Dict:
+        return {
+            "slots": self.slots,
+            "running": self.running,
+            "queued": self.queued,
+            "classes": {name: stats.as_dict() for name, stats in self._classes.items()},
+        }
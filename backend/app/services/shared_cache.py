@@ -0,0 +1,90 @@
+"""Cross-process cache tier shared by all workers on one host"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from app.core.config import settings
+
+
+class SQLiteCacheStore:
+    """
+    Key/value store with per-entry expiry in a SQLite database in WAL mode.
+    Every uvicorn worker opens the same file, so a reply cached by one worker
+    is visible to the others. One connection is kept per thread. With max_rows,
+    the rows written longest ago are evicted once the table holds more; between
+    prunes each process may add up to PRUNE_EVERY rows over the cap.
+    """
+
+    PRUNE_EVERY = 256  # writes between removals of expired and excess rows
+
+    def __init__(self, path: str, max_rows: int = 0):
+        self.path = path
+        self.max_rows = max_rows
+        self.logger = logging.getLogger(__name__)
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        """Stored value for key, or None if missing or expired"""
+        try:
+            row = self._connect().execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.logger.warning("Shared cache read failed: %s", e)
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + ttl)
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(conn)
+        except sqlite3.Error as e:
+            self.logger.warning("Shared cache write failed: %s", e)
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        """Remove expired rows, then the oldest rows over max_rows"""
+        conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        if self.max_rows > 0:
+            # INSERT OR REPLACE gives a rewritten key a new rowid, so rowid order is write order
+            evicted = conn.execute(
+                "DELETE FROM cache WHERE rowid <= "
+                "(SELECT rowid FROM cache ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+                (self.max_rows,)
+            ).rowcount
+            if evicted:
+                self.logger.info("Shared cache full, evicted %s oldest rows", evicted)
+
+
+def create_shared_store() -> Optional[SQLiteCacheStore]:
+    """The host-wide store at LLM_CACHE_PATH when LLM_CACHE_BACKEND=sqlite, else None"""
+    if settings.LLM_CACHE_BACKEND != "sqlite":
+        return None
+    try:
+        return SQLiteCacheStore(settings.LLM_CACHE_PATH, settings.LLM_CACHE_SHARED_MAX_ROWS)
+    except Exception as e:
+        logging.getLogger(__name__).warning("Shared cache unavailable (%s), using in-process cache only", e)
+        return None
@@ -1,101 +1,309 @@
 """Simple nutrition extractor - works with any PDF"""
+import asyncio
 import time
 import logging
-from typing import Dict
+from collections import Counter
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.deadline import Deadline
+from app.core.logging_config import log_payload
+from app.models.document import Document
 from app.models.schemas import AllergenData, NutritionData
+from app.services.admission import AdmissionRejected
+from app.services.local_extractor import create_local_extractor
 from app.services.pdf_processor import PDFProcessor
+from app.services.triage import ROUTE_REJECT, Triage, UnprocessableDocumentError
 from app.services.universal_extraction_service import UniversalExtractionService
 
+# Counted next to the triage routes: documents sent as page text (/extract/text), not as PDF
+ROUTE_PROVIDED_TEXT = "provided_text"
+
 class SimpleNutritionExtractor:
     """Extracts allergens and nutrients from PDF documents"""
     
     def __init__(self):
         self.pdf_processor = PDFProcessor()
         self.extraction_service = UniversalExtractionService()
+        self.local_extractor = create_local_extractor(settings.LOCAL_MODEL, settings.LOCAL_MODEL_PATH)
         self.logger = logging.getLogger(__name__)
+        # Documents seen per triage route (reported at /health)
+        self.routes: Counter = Counter()
+    
+    async def triage(self, pdf_data: bytes) -> Triage:
+        """Pre-flight routing decision and cost; raises UnprocessableDocumentError for rejected documents"""
+        triage = await self.pdf_processor.triage(pdf_data)
+        self.routes[triage.route] += 1
+        if triage.route == ROUTE_REJECT:
+            self.logger.warning("Document rejected by triage: %s", triage.reason)
+            raise UnprocessableDocumentError(triage.reason)
+        return triage
+    
+    async def warm_up(self) -> Dict[str, float]:
+        """Preload the OCR stack and compile fallback regexes off the event loop"""
+        loop = asyncio.get_event_loop()
+        timings = await loop.run_in_executor(None, self.pdf_processor.warm_up)
+        timings.update(await loop.run_in_executor(None, self.extraction_service.warm_up))
+        self.logger.info("Warm-up completed: %s", timings)
+        return timings
+    
+    async def extract_from_pdf(
+        self,
+        pdf_data: bytes,
+        gemini_key: str,
+        deadline: Optional[Deadline] = None,
+        triage: Optional[Triage] = None,
+        text_pages: bool = False,
+        reserve_ocr: Optional[Callable[[Optional[int]], None]] = None
+    ) -> Dict:
+        """
+        Extract allergens and nutrients from PDF bytes; text_pages adds the cleaned text per page.
+        reserve_ocr: see PDFProcessor.extract_document (endpoints pass their admission ticket's).
+        """
+        return await self._run_pipeline(
+            pdf_data, gemini_key, deadline=deadline, triage=triage, text_pages=text_pages, reserve_ocr=reserve_ocr
+        )
     
-    async def extract_from_pdf(self, pdf_data: bytes, gemini_key: str) -> Dict:
-        """Extract allergens and nutrients from PDF bytes"""
+    async def extract_from_texts(
+        self,
+        pages: List[str],
+        gemini_key: str,
+        deadline: Optional[Deadline] = None,
+        text_pages: bool = False
+    ) -> Dict:
+        """
+        Extract allergens and nutrients from page texts obtained elsewhere (e.g. a PDF text
+        layer read by the client). No PDF is parsed; the texts are cleaned like a PDF's
+        text layer and go through the same stages and caches as extract_from_pdf.
+        """
+        self.routes[ROUTE_PROVIDED_TEXT] += 1
         start_time = time.time()
+        stage_start = time.perf_counter()
+        document = self.pdf_processor.document_from_texts(pages)
+        timings = {"pdf_text": time.perf_counter() - stage_start}
+        return await self._extract_from_document(
+            document, gemini_key, None, deadline, text_pages, timings, start_time
+        )
+    
+    async def stream_extract(
+        self,
+        pdf_data: bytes,
+        gemini_key: str,
+        deadline: Optional[Deadline] = None,
+        triage: Optional[Triage] = None,
+        text_pages: bool = False,
+        reserve_ocr: Optional[Callable[[Optional[int]], None]] = None
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Run the extraction pipeline and yield (event, data) pairs as stages complete:
+        triage, direct_text, ocr_page (per page), fallback, local, llm and finally result
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        def emit(event: str, data: Dict):
+            # Called from the event loop and from OCR executor threads
+            loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+        
+        task = asyncio.create_task(
+            self._run_pipeline(
+                pdf_data, gemini_key, emit=emit, deadline=deadline, triage=triage, text_pages=text_pages,
+                reserve_ocr=reserve_ocr
+            )
+        )
+        task.add_done_callback(lambda _: loop.call_soon_threadsafe(queue.put_nowait, None))
         
         try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield item
+            yield "result", task.result()
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    async def _run_pipeline(
+        self,
+        pdf_data: bytes,
+        gemini_key: str,
+        emit: Optional[Callable[[str, Dict], None]] = None,
+        deadline: Optional[Deadline] = None,
+        triage: Optional[Triage] = None,
+        text_pages: bool = False,
+        reserve_ocr: Optional[Callable[[Optional[int]], None]] = None
+    ) -> Dict:
+        """
+        Run all extraction stages; emit (if given) receives intermediate results.
+        With a deadline, stages that would overrun it are cut short and the best
+        result so far is returned with degraded=True.
+        """
+        start_time = time.time()
+        # Per-stage wall-clock seconds, returned as "timings"
+        timings = {}
+        
+        try:
+            # Route the document (endpoints triage before admission and pass the result in)
+            if triage is None:
+                triage = await self.triage(pdf_data)
+            timings["triage"] = triage.seconds
+            
             # Extract text from PDF (with OCR support)
-            text = await self.pdf_processor.extract_text_from_pdf(pdf_data)
-            self.logger.info(f"Extracted text: {len(text)} chars")
-            self.logger.info(f"First 500 chars of extracted text: {text[:500]}")
+            stage_start = time.perf_counter()
+            document = await self.pdf_processor.extract_document(
+                pdf_data, on_progress=emit, deadline=deadline, triage=triage, reserve_ocr=reserve_ocr
+            )
+            timings["pdf_text"] = time.perf_counter() - stage_start
+            self.logger.info("Extracted text: %s chars on %s page spans", len(document), len(document.pages))
+            log_payload(self.logger, "First 500 chars of extracted text: %s", document.text[:500])
             
+        except (UnprocessableDocumentError, AdmissionRejected):
+            raise
+        except Exception as e:
+            self.logger.error("Extraction error: %s", e)
+            return self._create_error_response(f"Extraction failed: {str(e)}")
+        
+        return await self._extract_from_document(
+            document, gemini_key, emit, deadline, text_pages, timings, start_time
+        )
+    
+    async def _extract_from_document(
+        self,
+        document: Document,
+        gemini_key: str,
+        emit: Optional[Callable[[str, Dict], None]],
+        deadline: Optional[Deadline],
+        text_pages: bool,
+        timings: Dict[str, float],
+        start_time: float
+    ) -> Dict:
+        """Stages after text extraction: cleaning, regex fallback, local model, Gemini and validation"""
+        try:
             # Clean text
-            clean_text = self.extraction_service.clean_text(text)
-            self.logger.info(f"Cleaned text: {len(clean_text)} chars")
-            self.logger.info(f"First 500 chars of cleaned text: {clean_text[:500]}")
+            stage_start = time.perf_counter()
+            clean_document = self.extraction_service.clean_document(document)
+            clean_text = clean_document.text
+            timings["clean"] = time.perf_counter() - stage_start
+            self.logger.info("Cleaned text: %s chars", len(clean_text))
+            log_payload(self.logger, "First 500 chars of cleaned text: %s", clean_text[:500])
+            
+            # Regex fallback is computed at most once per request
+            fallback_result = None
+            
+            def get_fallback() -> Tuple[Dict, Dict]:
+                nonlocal fallback_result
+                if fallback_result is None:
+                    fallback_start = time.perf_counter()
+                    fallback_result = self.extraction_service.advanced_fallback(clean_text)
+                    timings["fallback"] = time.perf_counter() - fallback_start
+                return fallback_result
+            
+            if emit:
+                # Streaming clients get the cheap regex result before the LLM answers
+                fallback_allergens, fallback_nutrients = get_fallback()
+                emit("fallback", {"allergens": fallback_allergens, "nutrients": fallback_nutrients})
+            
+            # Local model first; Gemini only when it is not confident enough
+            local_result = None
+            if self.local_extractor is not None:
+                stage_start = time.perf_counter()
+                local_result = self.local_extractor.extract(clean_text, clean_document)
+                timings["local"] = time.perf_counter() - stage_start
+                local_accepted = local_result.confidence >= settings.LOCAL_MODEL_THRESHOLD
+                self.logger.info("Local model confidence %.3f (%s)", local_result.confidence,
+                                 "accepted" if local_accepted else "below threshold")
+                if emit:
+                    emit("local", {
+                        "allergens": local_result.allergens,
+                        "nutrients": local_result.nutrients,
+                        "confidence": local_result.confidence,
+                        "accepted": local_accepted
+                    })
+                if not local_accepted:
+                    local_result = None
             
             # Try LLM first for both allergens and nutrients
             allergens, nutrients = {}, {}
             llm_used = False
-            try:
-                llm_allergens, llm_nutrients = await self._try_gemini(clean_text, gemini_key)
-                
-                self.logger.info(f"LLM returned: allergens={llm_allergens}, nutrients={llm_nutrients}")
-                
-                # Validate LLM results
-                if llm_allergens:
-                    # Check for true values (handle both bool True and string "true")
-                    def is_true_value(v):
-                        return v is True or (isinstance(v, str) and v.lower() in ('true', 'yes', '1', 'igen', 'contains'))
-                    
-                    true_count = sum(1 for v in llm_allergens.values() if is_true_value(v))
-                    true_list = [k for k, v in llm_allergens.items() if is_true_value(v)]
-                    self.logger.warning(f"LLM returned {true_count}/10 allergens as TRUE: {true_list}")
+            llm_usage = {}
+            if local_result is not None:
+                allergens, nutrients = local_result.allergens, local_result.nutrients
+            else:
+                try:
+                    stage_start = time.perf_counter()
+                    llm_allergens, llm_nutrients = await self._try_gemini(
+                        clean_text, gemini_key, deadline, document=clean_document, usage=llm_usage
+                    )
+                    timings["llm"] = time.perf_counter() - stage_start
                     
-                    # Check if nutrients are all N/A (LLM didn't extract anything useful)
-                    nutrients_all_na = all(v == "N/A" or v is None or v == "" for v in llm_nutrients.values()) if llm_nutrients else True
+                    self.logger.info("LLM returned: allergens=%s, nutrients=%s", llm_allergens, llm_nutrients)
                     
-                    # If LLM returns all false and all N/A, it failed to parse - use fallback
-                    if true_count == 0 and nutrients_all_na:
-                        self.logger.error("LLM returned ALL FALSE allergies AND ALL N/A nutrients - parsing failed, using fallback")
-                        llm_allergens = None
-                        llm_nutrients = None
-                    # If too many allergens are true (>5), also use fallback (checking for false positives when ALL are true)
-                    elif true_count > 5:
-                        self.logger.warning(f"SUSPICIOUS! LLM says {true_count} allergens present (likely false positive), using regex fallback instead")
-                        llm_allergens = None
-                        llm_nutrients = None
-                    # If all nutrients are N/A, use fallback
-                    elif nutrients_all_na:
-                        self.logger.warning("LLM returned all nutrients as N/A, using regex fallback instead")
-                        llm_allergens = None
-                        llm_nutrients = None
-                
-                if llm_allergens and llm_nutrients:
-                    allergens = llm_allergens
-                    nutrients = llm_nutrients
-                    llm_used = True
-                    self.logger.info("Using LLM results for both allergens and nutrients")
+                    # Validate LLM results
+                    if llm_allergens:
+                        # Check for true values (handle both bool True and string "true")
+                        def is_true_value(v):
+                            return v is True or (isinstance(v, str) and v.lower() in ('true', 'yes', '1', 'igen', 'contains'))
+                        
+                        true_count = sum(1 for v in llm_allergens.values() if is_true_value(v))
+                        true_list = [k for k, v in llm_allergens.items() if is_true_value(v)]
+                        self.logger.warning("LLM returned %s/10 allergens as TRUE: %s", true_count, true_list)
+                        
+                        # Check if nutrients are all N/A (LLM didn't extract anything useful)
+                        nutrients_all_na = all(v == "N/A" or v is None or v == "" for v in llm_nutrients.values()) if llm_nutrients else True
+                        
+                        # If LLM returns all false and all N/A, it failed to parse - use fallback
+                        if true_count == 0 and nutrients_all_na:
+                            self.logger.error("LLM returned ALL FALSE allergies AND ALL N/A nutrients - parsing failed, using fallback")
+                            llm_allergens = None
+                            llm_nutrients = None
+                        # If too many allergens are true (>5), also use fallback (checking for false positives when ALL are true)
+                        elif true_count > 5:
+                            self.logger.warning("SUSPICIOUS! LLM says %s allergens present (likely false positive), using regex fallback instead", true_count)
+                            llm_allergens = None
+                            llm_nutrients = None
+                        # If all nutrients are N/A, use fallback
+                        elif nutrients_all_na:
+                            self.logger.warning("LLM returned all nutrients as N/A, using regex fallback instead")
+                            llm_allergens = None
+                            llm_nutrients = None
                     
-                    # Post-process: Try to extract missing values from fallback
-                    missing_items = []
-                    for key in ["protein", "sodium", "sugar"]:
-                        if nutrients.get(key) == "N/A":
-                            missing_items.append(key)
+                    if emit:
+                        emit("llm", {
+                            "allergens": llm_allergens or {},
+                            "nutrients": llm_nutrients or {},
+                            "accepted": bool(llm_allergens and llm_nutrients)
+                        })
                     
-                    if missing_items:
-                        self.logger.warning(f"LLM returned N/A for {missing_items}, trying to extract from fallback patterns")
-                        try:
-                            # Run fallback just for missing items
-                            _, fallback_nutrients = self.extraction_service.advanced_fallback(clean_text)
-                            for key in missing_items:
-                                if fallback_nutrients.get(key) != "N/A":
-                                    nutrients[key] = fallback_nutrients[key]
-                                    self.logger.warning(f"Found {key} value from fallback: {nutrients[key]}")
-                        except Exception as e:
-                            self.logger.debug(f"Fallback check failed: {e}")
-                else:
-                    # LLM returned empty or suspicious results, use fallback
-                    self.logger.info("LLM returned empty or suspicious results, using fallback")
-                    allergens, nutrients = self.extraction_service.advanced_fallback(clean_text)
-            except Exception as e:
-                self.logger.info(f"LLM failed: {e}, using fallback")
-                allergens, nutrients = self.extraction_service.advanced_fallback(clean_text)
+                    if llm_allergens and llm_nutrients:
+                        allergens = llm_allergens
+                        nutrients = llm_nutrients
+                        llm_used = True
+                        self.logger.info("Using LLM results for both allergens and nutrients")
+                        
+                        # Post-process: Try to extract missing values from fallback
+                        missing_items = []
+                        for key in ["protein", "sodium", "sugar"]:
+                            if nutrients.get(key) == "N/A":
+                                missing_items.append(key)
+                        
+                        if missing_items:
+                            self.logger.warning("LLM returned N/A for %s, trying to extract from fallback patterns", missing_items)
+                            try:
+                                # Run fallback just for missing items
+                                _, fallback_nutrients = get_fallback()
+                                for key in missing_items:
+                                    if fallback_nutrients.get(key) != "N/A":
+                                        nutrients[key] = fallback_nutrients[key]
+                                        self.logger.warning("Found %s value from fallback: %s", key, nutrients[key])
+                            except Exception as e:
+                                self.logger.debug("Fallback check failed: %s", e)
+                    else:
+                        # LLM returned empty or suspicious results, use fallback
+                        self.logger.info("LLM returned empty or suspicious results, using fallback")
+                        allergens, nutrients = get_fallback()
+                except Exception as e:
+                    self.logger.info("LLM failed: %s, using fallback", e)
+                    allergens, nutrients = get_fallback()
             
             # Validate results
             final_allergens = self._validate_allergens(allergens)
@@ -103,25 +311,71 @@ class SimpleNutritionExtractor:
             
             processing_time = time.time() - start_time
             
+            pages = None
+            if text_pages:
+                pages = [
+                    {
+                        "page": span.page,
+                        "source": span.source,
+                        "text": clean_document.page_text(span),
+                        "confidence": span.confidence
+                    }
+                    for span in clean_document
+                ]
+            
             return {
                 "success": True,
                 "allergens": AllergenData(**final_allergens).model_dump(),
                 "nutrients": NutritionData(**final_nutrients).model_dump(),
-                "llm_used": "gemini" if llm_used else "regex_fallback",
+                "llm_used": self._llm_name(llm_usage) if llm_used else "local_model" if local_result is not None else "regex_fallback",
                 "extracted_text": clean_text,
-                "processing_time": processing_time
+                "pages": pages,
+                "processing_time": processing_time,
+                "timings": timings,
+                "degraded": bool(deadline and deadline.degraded),
+                "degraded_reasons": deadline.reasons if deadline and deadline.degraded else None,
+                "llm_usage": llm_usage or None
             }
             
         except Exception as e:
-            self.logger.error(f"Extraction error: {e}")
+            self.logger.error("Extraction error: %s", e)
             return self._create_error_response(f"Extraction failed: {str(e)}")
     
-    async def _try_gemini(self, text: str, gemini_key: str):
-        """Try to use Gemini for nutrient extraction only"""
+    async def _try_gemini(
+        self,
+        text: str,
+        gemini_key: str,
+        deadline: Optional[Deadline] = None,
+        document: Optional[Document] = None,
+        usage: Optional[Dict] = None
+    ):
+        """Try to use Gemini for nutrient extraction only, within the remaining deadline budget"""
+        if deadline is None:
+            timeout = None
+        else:
+            timeout = deadline.remaining()
+            if timeout < settings.DEADLINE_LLM_MIN_SECONDS:
+                self.logger.warning("%.1fs left, skipping Gemini", timeout)
+                deadline.degrade("llm_skipped")
+                return {}, {}
         try:
-            return await self.extraction_service.extract_with_gemini(text, gemini_key)
+            result = await asyncio.wait_for(
+                self.extraction_service.extract_with_gemini(
+                    text, gemini_key, timeout=timeout, document=document, usage=usage
+                ),
+                timeout
+            )
+            if deadline and deadline.expired() and not any(result):
+                deadline.degrade("llm_timeout")
+            return result
+        except asyncio.TimeoutError:
+            # Also raised by the provider's own HTTP timeout when there is no request deadline
+            self.logger.warning("Gemini did not answer in time")
+            if deadline:
+                deadline.degrade("llm_timeout")
+            return {}, {}
         except Exception as e:
-            self.logger.info(f"Gemini extraction failed: {e}")
+            self.logger.info("Gemini extraction failed: %s", e)
             return {}, {}
     
     def _validate_allergens(self, allergens: Dict) -> Dict:
@@ -166,6 +420,10 @@ class SimpleNutritionExtractor:
         
         return validated
     
+    def _llm_name(self, llm_usage: Dict) -> str:
+        """Provider that answered; the preferred one for a cached reply"""
+        return llm_usage.get("provider") or self.extraction_service.llm_router.providers[0].name
+    
     def _create_error_response(self, error_msg: str) -> Dict:
         """Create error response"""
         return {
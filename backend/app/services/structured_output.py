@@ -0,0 +1,47 @@
+"""Schema-constrained Gemini output built from the response models"""
+from functools import lru_cache
+from typing import Dict, Tuple, Type, get_args, get_origin
+
+from pydantic import BaseModel
+
+from app.models.schemas import ExtractionResult
+
+_SCALAR_TYPES = {bool: "BOOLEAN", str: "STRING", int: "INTEGER", float: "NUMBER"}
+
+
+def response_schema(model: Type[BaseModel]) -> Dict:
+    """
+    Gemini responseSchema (OpenAPI subset: no $ref, defaults or titles) for a pydantic model.
+    Every field is required so the reply always has the full shape.
+    """
+    properties = {}
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        if get_origin(annotation) is not None:
+            # Optional[X] -> X
+            annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            schema = response_schema(annotation)
+        else:
+            schema = {"type": _SCALAR_TYPES[annotation]}
+        if field.description:
+            schema["description"] = field.description
+        properties[name] = schema
+
+    names = list(model.model_fields)
+    return {"type": "OBJECT", "properties": properties, "required": names, "propertyOrdering": names}
+
+
+@lru_cache(maxsize=None)
+def extraction_generation_config() -> Dict:
+    """generationConfig additions that make Gemini return ExtractionResult JSON"""
+    return {"responseMimeType": "application/json", "responseSchema": response_schema(ExtractionResult)}
+
+
+def parse_extraction_result(reply: str) -> Tuple[Dict, Dict]:
+    """
+    Validate a structured reply straight from the JSON text into the models
+    (pydantic-core parser, no intermediate json.loads); raises pydantic.ValidationError
+    """
+    result = ExtractionResult.model_validate_json(reply)
+    return result.allergens.model_dump(), result.nutrients.model_dump()
@@ -0,0 +1,183 @@
+"""Pre-flight PDF triage: route and cost from the PDF structure, before any text extraction"""
+import io
+import re
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+ROUTE_TEXT = "text"  # every page has a text layer: direct extraction only
+ROUTE_HYBRID = "hybrid"  # some pages need OCR
+ROUTE_OCR = "ocr"  # no usable text layer: OCR only, the direct pass is skipped
+ROUTE_REJECT = "reject"
+
+# A page with a text layer still needs OCR if an image covers at least this share of it
+# and it shows only a few text strings (e.g. a header over a scanned table)
+SCAN_COVERAGE = 0.5
+SCAN_MAX_TEXT_OPS = 10
+# Direct extraction time per page, for the cost estimate
+TEXT_PAGE_SECONDS = 0.02
+
+_TEXT_SHOW = re.compile(rb"T[jJ]\b")
+_IMAGE_DRAW = re.compile(
+    rb"(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+-?[\d.]+\s+-?[\d.]+\s+cm\s*/([^\s/\[\]()<>]+)\s+Do"
+)
+
+
+class UnprocessableDocumentError(Exception):
+    """The upload is not a PDF the pipeline can read; mapped to 422"""
+
+
+class Triage:
+    """Routing decision and cost estimate for one PDF"""
+
+    __slots__ = (
+        "route", "pages", "ocr_page_numbers", "image_coverage", "encrypted", "size", "reason", "seconds", "pages_known",
+        "ocr_seconds", "ocr_pages_done"
+    )
+
+    def __init__(
+        self,
+        route: str,
+        pages: int = 0,
+        ocr_page_numbers: Optional[List[int]] = None,
+        image_coverage: float = 0.0,
+        encrypted: bool = False,
+        size: int = 0,
+        reason: Optional[str] = None,
+        pages_known: bool = True
+    ):
+        self.route = route
+        self.pages = pages
+        self.ocr_page_numbers = ocr_page_numbers or []  # 1-based pages without a usable text layer
+        self.image_coverage = image_coverage  # mean share of the page area covered by images
+        self.encrypted = encrypted
+        self.size = size
+        self.reason = reason  # why the document was rejected (or could not be inspected)
+        self.seconds = 0.0  # time the triage itself took
+        self.pages_known = pages_known  # False: structure unreadable, pages is a placeholder of 1
+        self.ocr_seconds = 0.0  # time the OCR stage took, without waiting for an OCR thread
+        self.ocr_pages_done = 0  # pages that OCR stage returned
+
+    @property
+    def ocr_pages(self) -> int:
+        return len(self.ocr_page_numbers)
+
+    @property
+    def has_text_layer(self) -> bool:
+        return self.route == ROUTE_TEXT
+
+    @property
+    def estimated_seconds(self) -> float:
+        """Single-thread processing time before the LLM call"""
+        return self.ocr_pages * settings.OCR_PAGE_SECONDS + self.pages * TEXT_PAGE_SECONDS
+
+    def as_dict(self) -> Dict:
+        return {
+            "route": self.route,
+            "pages": self.pages,
+            "ocr_pages": self.ocr_pages,
+            "image_coverage": round(self.image_coverage, 3),
+            "encrypted": self.encrypted,
+            "size": self.size,
+            "estimated_seconds": round(self.estimated_seconds, 2),
+            "reason": self.reason,
+            "seconds": round(self.seconds, 4),
+        }
+
+
+def triage_pdf(pdf_data: bytes) -> Triage:
+    """
+    Classify a PDF from its object structure: page count, per-page text layer (fonts
+    and text-showing operators in the content stream), image coverage (image XObjects
+    and the matrix they are drawn with), encryption and size. No text is extracted
+    and nothing is rendered.
+    """
+    import PyPDF2
+
+    size = len(pdf_data)
+    if not pdf_data.startswith(b"%PDF"):
+        return Triage(ROUTE_REJECT, size=size, reason="not a PDF file")
+    if size > settings.MAX_FILE_SIZE:
+        return Triage(ROUTE_REJECT, size=size, reason="file too large")
+
+    try:
+        reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
+        encrypted = reader.is_encrypted
+        if encrypted and not _decrypt_without_password(reader):
+            return Triage(ROUTE_REJECT, encrypted=True, size=size, reason="password protected")
+        pages = len(reader.pages)
+        if not pages:
+            return Triage(ROUTE_REJECT, size=size, encrypted=encrypted, reason="no pages")
+        if settings.TRIAGE_MAX_PAGES and pages > settings.TRIAGE_MAX_PAGES:
+            return Triage(
+                ROUTE_REJECT, pages, size=size, encrypted=encrypted,
+                reason=f"more than {settings.TRIAGE_MAX_PAGES} pages"
+            )
+
+        ocr_page_numbers = []
+        coverage_total = 0.0
+        for number, page in enumerate(reader.pages, start=1):
+            text_ops, coverage = _inspect_page(page)
+            coverage_total += coverage
+            if not text_ops or (coverage >= SCAN_COVERAGE and text_ops < SCAN_MAX_TEXT_OPS):
+                ocr_page_numbers.append(number)
+    except MemoryError:
+        # Over the sandbox's memory limit: the document is rejected, not sent to OCR
+        raise
+    except Exception as e:
+        # Poppler reads many files PyPDF2 cannot; let OCR try the whole document
+        return Triage(
+            ROUTE_OCR, 1, [1], 1.0, size=size, reason=f"structure unreadable ({e.__class__.__name__})", pages_known=False
+        )
+
+    if not ocr_page_numbers:
+        route = ROUTE_TEXT
+    elif len(ocr_page_numbers) == pages:
+        route = ROUTE_OCR
+    else:
+        route = ROUTE_HYBRID
+    return Triage(route, pages, ocr_page_numbers, coverage_total / pages, encrypted, size)
+
+
+def _decrypt_without_password(reader) -> bool:
+    """Owner-password-only PDFs open with an empty user password"""
+    try:
+        return bool(reader.decrypt(""))
+    except MemoryError:
+        raise
+    except Exception:
+        # Unsupported algorithm or missing crypto dependency
+        return False
+
+
+def _inspect_page(page) -> tuple:
+    """(number of text-showing operators, share of the page covered by images)"""
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else {}
+    contents = page.get_contents()
+    data = contents.get_data() if contents is not None else b""
+
+    text_ops = len(_TEXT_SHOW.findall(data)) if resources.get("/Font") is not None else 0
+    images = set()
+    xobjects = resources.get("/XObject")
+    for name, reference in (xobjects.get_object().items() if xobjects is not None else ()):
+        xobject = reference.get_object()
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            images.add(name[1:].encode())
+        elif subtype == "/Form":
+            # Text drawn from a form XObject (some generators wrap whole pages in one)
+            form_resources = xobject.get("/Resources")
+            if form_resources is not None and form_resources.get_object().get("/Font") is not None:
+                text_ops += len(_TEXT_SHOW.findall(xobject.get_data()))
+    if not images:
+        return text_ops, 0.0
+
+    box = page.mediabox
+    page_area = abs(float(box.width) * float(box.height)) or 1.0
+    drawn = 0.0
+    for a, b, c, d, name in _IMAGE_DRAW.findall(data):
+        if name in images:
+            drawn += abs(float(a) * float(d) - float(b) * float(c))
+    # Images drawn in a way the pattern does not see are assumed to fill the page
+    return text_ops, min(1.0, drawn / page_area) if drawn else 1.0
@@ -1,443 +1,689 @@
+import asyncio
+import hashlib
 import json
-import aiohttp
 import re
+import time
 import logging
-from typing import Dict, Tuple
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logging_config import log_payload
+from app.core.metrics import CircuitOpenError
+from app.models.document import Document
+from app.services.pattern_keywords import fold_case, required_keywords
+from app.services.llm_providers import LLMRouter
+from app.services.prompt_builder import PromptBuilder
+from app.services.structured_output import parse_extraction_result
+
+
+class LLMResponseCache:
+    """
+    Bounded LRU cache of parsed LLM replies (allergens, nutrients) with a TTL.
+    Concurrent calls for the same key share a single upstream request.
+    An optional shared store (e.g. SQLiteCacheStore) is consulted on a local miss,
+    so workers on the same host reuse each other's replies.
+    """
+    
+    def __init__(self, max_size: int, ttl: float, shared_store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_store = shared_store
+        self._entries: "OrderedDict[str, Tuple[float, Tuple[Dict, Dict]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def make_key(model: str, generation_config: Dict, prompt: str) -> str:
+        """Hash of everything that determines the LLM reply"""
+        raw = json.dumps([model, generation_config, prompt], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str):
+        """Cached (allergens, nutrients) for key, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def put(self, key: str, value: Tuple[Dict, Dict]) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    async def get_or_call(self, key: str, call: Callable[[], Awaitable[Tuple[Dict, Dict]]]) -> Tuple[Dict, Dict]:
+        """Return the cached reply for key, join an in-flight call for it, or make the call"""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return self._copy(value)
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return self._copy(await asyncio.shield(inflight))
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The request that owned the call was cancelled; make our own call
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._get_shared(key)
+            if value is not None:
+                self.shared_hits += 1
+            else:
+                self.misses += 1
+                value = await call()
+                # Empty results mean the call failed; do not cache those
+                if value[0] or value[1]:
+                    await self._put_shared(key, value)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an exception nobody waited for is not reported
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(value)
+            if value[0] or value[1]:
+                self.put(key, value)
+        finally:
+            self._inflight.pop(key, None)
+        return self._copy(value)
+    
+    async def _get_shared(self, key: str):
+        if self.shared_store is None:
+            return None
+        value = await asyncio.to_thread(self.shared_store.get, key)
+        return tuple(value) if value else None
+    
+    async def _put_shared(self, key: str, value: Tuple[Dict, Dict]) -> None:
+        if self.shared_store is not None and self.max_size > 0:
+            await asyncio.to_thread(self.shared_store.set, key, list(value), self.ttl)
+    
+    @staticmethod
+    def _copy(value: Tuple[Dict, Dict]) -> Tuple[Dict, Dict]:
+        # Callers patch the returned dicts (e.g. missing nutrients), keep the cached ones intact
+        return dict(value[0]), dict(value[1])
+    
+    def stats(self) -> Dict:
+        lookups = self.hits + self.shared_hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "shared": self.shared_store is not None,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.shared_hits + self.coalesced) / lookups if lookups else 0.0
+        }
+
 
 class UniversalExtractionService:
     """
     Universal extraction service that handles all PDF formats from the assignment
     """
     
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
+    # Comprehensive patterns for all document formats
+    NUTRIENT_PATTERNS = {
+        "energy": [
+            # IMPORTANT: Both units formats FIRST
+            # Format with colon: "Energy/Energia: 1173 kJ/282kcal"
+            r"energy/energia:\s*(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)kcal",
+            r"energia/energy:\s*(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)kcal",
+            # Format: "Energy/Energia 1173 kJ/282kcal" or "Energia/Energy 1173 kJ/282kcal"
+            r"energy/energia\s*(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)kcal",
+            r"energia/energy\s*(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)kcal",
+            # Format with label "value": "Energia/Energy value 224 kJ / 53 kcal"
+            r"energia/energy\s+value\s+(\d+(?:,\d+)?)\s*kj\s*/\s*(\d+(?:,\d+)?)\s*kcal",
+            # Format with multiple spaces: "Energia/Energy value  224 kJ / 53 kcal"
+            r"energia/energy\s+value\s{2,}(\d+(?:,\d+)?)\s*kj\s*/\s*(\d+(?:,\d+)?)\s*kcal",
+            # Format: "Energia 1173 kJ/282kcal"
+            r"(?:energia|energy)\s+(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)kcal",
+            # Format: "Energia: 224 kJ / 53 kcal"
+            r"(?:energia|energy)[:\s]*(\d+(?:,\d+)?)\s*kj\s*/\s*(\d+(?:,\d+)?)\s*kcal",
+            r"(\d+(?:,\d+)?)\s*kj\s*/\s*(\d+(?:,\d+)?)\s*kcal",
+            r"(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)\s*kcal",  # Without space
+            r"(\d+(?:,\d+)?)\s*kj\s*\((\d+(?:,\d+)?)\s*kcal\)",  # Parentheses
+            
+            # Standard formats with labels (single unit)
+            r"(?:energia|energy|énergie|calories|calorías)[:\s]*(\d+(?:,\d+)?)\s*(?:kj|kcal)(?!\s*/)",
+            r"(?:energia|energy|énergie|calories|calorías)\s*\[(?:kj|kcal)\]\s*:\s*(\d+(?:,\d+)?)\s*(?:kj|kcal)",
+            
+            # Direct energy values (more specific)
+            r"(\d+(?:,\d+)?)\s*kj(?!\s*/)",  # kJ only
+            r"(\d+(?:,\d+)?)\s*kcal(?!\s*/)",  # kcal only
+            
+            # Hungarian kcal formats
+            r"energia\s*:\s*(\d+(?:,\d+)?)\s*kcal",
+            r"energia\s+(\d+(?:,\d+)?)\s*kcal",
+            r"energia\s+(\d+(?:,\d+)?)\s*kj",
+            
+            # Hungarian specific formats
+            r"energia\s*\[kj\]\s*:\s*(\d+(?:,\d+)?)\s*kj",
+            r"energia\s*\[kcal\]\s*:\s*(\d+(?:,\d+)?)\s*kcal",
+            r"energia\s*:\s*(\d+(?:,\d+)?)\s*(?:kj|kcal)",
+            
+            # French formats
+            r"énergie\s*:\s*(\d+(?:,\d+)?)\s*(?:kj|kcal)",
+            r"calories\s*:\s*(\d+(?:,\d+)?)\s*kcal",
+            
+            # Table formats
+            r"energia\s*\(kj\)\s*:\s*(\d+(?:,\d+)?)",
+            r"energia\s*\(kcal\)\s*:\s*(\d+(?:,\d+)?)",
+            
+            # Hungarian table format: "Energia  kJ  1553 I N X"
+            r"energia\s+\s*kj\s+(\d+)(?:\s+[INX])?",
+            r"energia\s+\s*kcal\s+(\d+)(?:\s+[INX])?",
+            
+            # OCR error patterns
+            r"energia\s*:\s*(\d+(?:[.,]\d+)?)\s*(?:kj|kcal)",
+            r"energy\s*:\s*(\d+(?:[.,]\d+)?)\s*(?:kj|kcal)"
+        ],
+        "fat": [
+            # Standard formats with labels
+            r"(?:zsír|fat|lipides|gras|grasas)[:\s]+(\d+(?:[,.]\d+)?)\s*g(?!\s*/)",
+            r"(?:zsírtartalom|fat content|contenu en lipides|contenido en grasas)[:\s]+(\d+(?:[,.]\d+)?)\s*g(?!\s*/)",
+            # Hungarian without colon
+            r"zsír\s+(\d+(?:[,.]\d+)?)\s*g",
+            r"fat\s+(\d+(?:[,.]\d+)?)\s*g",
+            
+            # Hungarian table format: "Zsír  g  36 N"
+            r"zsír\s+\s*g\s+(\d+(?:,\d+)?)(?:\s+[INX])?",
+            # Hungarian table format: "Zsír  g  36 N" (alternative)
+            r"zsír\s+\s*g\s+(\d+)(?:\s+[INX])?",
+            # Hungarian table format with comma: "Zsír  g  36,5 N"
+            r"zsír\s+\s*g\s+(\d+,\d+)(?:\s+[INX])?",
+            r"zsír\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[INX]",
+            r"zsír\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[NX]",
+            r"zsír\s*\[g\]\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"zsír\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"zsír\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"zsírtartalom\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # Direct values without labels (for table formats) - REMOVED TOO BROAD
+            # r"(\d{1,2},\d{2})\s*g\s*$",
+            # r"^(\d{1,2},\d{2})\s*g",
+            # r"^\s*(\d{1,2},\d{2})\s*$",
+            # r"(\d{1,3},\d{1,2})\s*g",
+            # r"(\d+,\d+)\s*g"
+            
+            # English formats
+            r"fat/.*?(\d+(?:,\d+)?)\s*g",
+            r"fat\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"total fat\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # French formats
+            r"lipides\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"matières grasses\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # Spanish formats
+            r"grasas\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"lípidos\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # Table formats
+            r"zsír\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
+            r"fat\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
+            
+            # OCR error patterns
+            r"zsir\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            r"fat\s*:\s*(\d+(?:[.,]\d+)?)\s*g"
+        ],
+        "protein": [
+            # Standard formats with labels
+            r"(?:fehérje|protein|protéines|proteínas|proteine)[:\s]+(\d+(?:,\d+)?)\s*g(?!\s*/)",
+            # Hungarian without colon
+            r"fehérje\s+(\d+(?:,\d+)?)\s*g",
+            r"protein\s+(\d+(?:,\d+)?)\s*g",
+            
+            # Hungarian table format: "Fehérje  g 21,6" or "Fehérje  g 12 N" - capture ONLY the number
+            r"fehérje\s+\s*g\s+(\d+(?:,\d+)?)(?!\s*[gG])",
+            r"Fehérje\s+\s*g\s+(\d+(?:,\d+)?)(?!\s*[gG])",
+            r"fehérje\s*\[\s*g\s*\]\s+(\d+(?:,\d+)?)(?=\s*[INX]|\s|$)",
+            r"fehérje\s*\[\s*g\s*\]\s+(\d+(?:,\d+)?)(?=\s*[NX]|\s|$)",
+            r"fehérje\s*\[g\]\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"fehérje\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"fehérje\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"fehérjetartalom\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # English formats
+            r"protein/.*?(\d+(?:,\d+)?)\s*g",
+            r"protein\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"total protein\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # French formats
+            r"protéines\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"protéine\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # Spanish formats
+            r"proteínas\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"proteína\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # Table formats
+            r"fehérje\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
+            r"protein\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
+            
+            # OCR error patterns
+            r"feherje\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            r"protein\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            # OCR patterns for yogurt document
+            r"Fehérje\s*(\d+(?:[.,]\d+)?)\s*g",
+            r"fehérje\s*(\d+(?:[.,]\d+)?)\s*g",
+            # Direct values for table formats - REMOVED TOO BROAD
+            # r"^\s*(\d{1,2},\d{1})\s*g",
+            # r"(\d+,\d+)\s*g"
+        ],
+        "carbohydrate": [
+            # Standard formats with labels
+            r"(?:szénhidrát|carbohydrate|carbohydrates|glucides|hidratos de carbono)[:\s]+(\d+(?:,\d+)?)\s*g(?!\s*/)",
+            # Hungarian without colon
+            r"szénhidrát\s+(\d+(?:,\d+)?)\s*g",
+            r"carbohydrate\s+(\d+(?:,\d+)?)\s*g",
+            # Add pattern for decimal in Hungarian
+            r"szénhidrát\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            
+            # Hungarian table format: "Szénhidrát  g  1 N"
+            r"szénhidrát\s+\s*g\s+(\d+)(?:\s+[INX])?",
+            r"szénhidrát\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[INX]",
+            r"szénhidrát\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[NX]",
+            r"szénhidrát\s*\[g\]\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"szénhidrát\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"szénhidrát\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"szénhidráttartalom\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # English formats
+            r"carbohydrate/.*?(\d+(?:,\d+)?)\s*g",
+            r"carbohydrate\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"total carbohydrate\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"carbohydrates\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # French formats
+            r"glucides\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"hydrates de carbone\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # Spanish formats
+            r"hidratos de carbono\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"carbohidratos\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # Table formats
+            r"szénhidrát\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
+            r"carbohydrate\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
+            
+            # OCR error patterns
+            r"szénhidrat\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            r"carbohydrate\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            # Direct values for table formats - REMOVED TOO BROAD
+            # r"^\s*(\d{1,3},\d{1,2})\s*g",
+            # r"(\d+,\d+)\s*g"
+        ],
+        "sugar": [
+            # Standard formats with labels
+            r"(?:cukor|sugar|sugars|sucres|azúcares)[:\s]+(\d+(?:,\d+)?)\s*g(?!\s*/)",
+            # Hungarian without colon
+            r"cukor\s+(\d+(?:,\d+)?)\s*g",
+            r"sugar\s+(\d+(?:,\d+)?)\s*g",
+            
+            # Hungarian table format: "cukor  g  0,5 N"
+            r"cukor\s+\s*g\s+(\d+,\d+)(?:\s+[INX])?",
+            # "amelyből cukor: X.X g" or "-of which sugars/ X.X g amelyből cukrok"
+            r"amelyből cukor\s*[:\s]+\s*(\d+(?:,\d+)?)\s*g",
+            r"amelyből cukrok\s*[:\s]+\s*(\d+(?:,\d+)?)\s*g",
+            r"-of which sugars/\s*(\d+(?:,\d+)?)\s*g",
+            r"-of which sugar/\s*(\d+(?:,\d+)?)\s*g",
+            # Format: "amelyből cukrok  2,4 g" (with spaces, no colon)
+            r"amelyből cukrok\s+(\d+(?:,\d+)?)\s*g",
+            r"amelyből cukor\s+(\d+(?:,\d+)?)\s*g",
+            r"sugars?\s*:\s*(\d+(?:,\d+)?)\s*g(?!\s*/)",
+            r"sugar\s*:\s*(\d+(?:,\d+)?)\s*g(?!\s*/)",
+            r"cukrok\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[INX]",
+            r"cukor\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[INX]",
+            r"cukor\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"cukrok\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"cukor\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"cukrok\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"cukortartalom\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # English formats
+            r"sugars/\s*(\d+(?:,\d+)?)\s*g",
+            r"sugar/.*?(\d+(?:,\d+)?)\s*g",
+            r"sugar\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"sugars\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"of which sugars\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # French formats
+            r"sucres\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"dont sucres\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # Spanish formats
+            r"azúcares\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"de los cuales azúcares\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # Table formats
+            r"cukor\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
+            r"sugar\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
+            
+            # OCR error patterns
+            r"cukor\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            r"sugar\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            # OCR patterns for yogurt document
+            r"amelyből cukrok\s*[:\s]+\s*(\d+(?:[.,]\d+)?)\s*g",
+            r"amelyből cukrok\s+(\d+(?:[.,]\d+)?)\s*g",
+            r"cukrok\s+(\d+(?:[.,]\d+)?)\s*g",
+            # Handle variations: "amelyből cukrok: 2,4" without "g"
+            r"amelyből cukrok\s*[:\s]+\s*(\d+(?:[.,]\d+)?)",
+            r"ebből cukor\s*[:\s]+\s*(\d+(?:[.,]\d+)?)\s*g"
+        ],
+        "sodium": [
+            # Standard formats with labels
+            r"(?:só|salt|sodium|sel|nátrium|sal)[:\s]+(\d+(?:,\d+)?)\s*g(?!\s*/)",
+            # Handle "-" or "not specified" cases
+            r"(?:só|salt|sodium)[:\s]+[-\u2013]",
+            # Hungarian without colon
+            r"só\s+(\d+(?:,\d+)?)\s*g",
+            r"salt\s+(\d+(?:,\d+)?)\s*g",
+            
+            # Hungarian table format: "Só  g  1,9 N"
+            r"só\s+\s*g\s+(\d+,\d+)(?:\s+[INX])?",
+            r"só\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[INX]",
+            r"só\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[NX]",
+            r"só\s*\[g\]\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"só\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"só\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"nátrium\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"sótartalom\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # English formats
+            r"salt/.*?(\d+(?:[.,]\d+)?)\s*g",
+            r"salt\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            r"sodium\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            r"sodium\s*:\s*(\d+(?:[.,]\d+)?)\s*mg",
+            
+            # French formats
+            r"sel\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"sodium\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # Spanish formats
+            r"sal\s*:\s*(\d+(?:,\d+)?)\s*g",
+            r"sodio\s*:\s*(\d+(?:,\d+)?)\s*g",
+            
+            # Table formats
+            r"só\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
+            r"salt\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
+            
+            # OCR error patterns
+            r"so\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            r"salt\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
+            # Direct values for table formats - REMOVED TOO BROAD
+            # r"^\s*(\d{1},\d{3})\s*g",
+            # r"^\s*(\d{1},\d{2})\s*g",
+            # r"(\d+,\d{3})\s*g"
+        ]
+    }
+
+    # Basic fallback: parse numbered format "06 + Gluten", "03 - Eggs"
+    ALLERGEN_KEYWORDS = {
+        "gluten": ["gluten", "glutén"],
+        "milk": ["milk", "tej", "tejfehérje", "laktóz"],
+        "egg": ["egg", "tojás"],
+        "crustaceans": ["crustacean", "rák", "rákfélék"],
+        "fish": ["fish", "hal"],
+        "peanut": ["peanut", "földimogyoró"],
+        "soy": ["soy", "szója"],
+        "tree_nuts": ["almond", "walnut", "dió", "diófélék"],
+        "celery": ["celery", "zeller"],
+        "mustard": ["mustard", "mustár"]
+    }
+
+    # Reasonable ranges for nutrients per 100g
+    NUTRIENT_MAX_VALUES = {
+        "energy": 5000,  # kJ (increased for high-energy foods)
+        "fat": 100,      # g (increased for high-fat foods)
+        "protein": 100,  # g (increased for high-protein foods)
+        "carbohydrate": 100,  # g
+        "sugar": 100,    # g
+        "sodium": 10     # g (increased for processed foods)
+    }
     
-    def create_comprehensive_prompt(self, text: str) -> str:
-        """Create comprehensive prompt for LLM extraction with better context understanding"""
-        return f"""Extract allergens and nutritional values from the following text. Return ONLY valid JSON.
+    # Also check for suspiciously low values (likely wrong extraction)
+    NUTRIENT_MIN_VALUES = {
+        "energy": 50,    # kJ (minimum reasonable energy)
+        "fat": 0.01,     # g (minimum fat - allow very low fat products)
+        "protein": 0.01,  # g (minimum protein)
+        "carbohydrate": 0.01,  # g (minimum carbohydrate)
+        "sugar": 0.01,   # g (minimum sugar)
+        "sodium": 0.001  # g (minimum sodium)
+    }
 
-ALLERGEN EXTRACTION:
-- Use true/false boolean values
-- Mark TRUE for: "+", "I", "X", "Igen", "tartalmaz", "contains", "may contain"
-- Mark FALSE for: "-", "N", "Nem", "mentes", "free from", "allergen-free"
+    _compiled_nutrient_patterns = None
+    _compiled_allergen_patterns = None
+    _keyed_nutrient_patterns = None
 
-ALLERGEN PATTERNS:
-- +/I/X/Igen/tartalmaz = TRUE
-- -/N/Nem/mentes = FALSE
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.prompt_builder = PromptBuilder.from_settings()
+        self.llm_cache = LLMResponseCache(
+            settings.LLM_CACHE_SIZE,
+            settings.LLM_CACHE_TTL,
+            shared_store=self._create_shared_store()
+        )
+        self.llm_router = LLMRouter.from_settings()
 
-NUTRITION EXTRACTION:
-- Extract ALL nutrients: Energy, Fat, Carbohydrate, Sugar, Protein, Sodium
-- NEVER return "N/A" unless truly not found (99% of products have these)
-- Look for values in ANY format: "6,9 g", "6.9 g", "6,9", "0,9 g", "0.9 g"
-- FAT: Find "Zsír", "Fat", "lipides", "grasas" - extract value like "6,9 g" or "0,9 g"
-- CARBOHYDRATE: Find "Szénhidrát", "Carbohydrate" - extract value
-- SUGAR: Look for "amelyből cukrok", "cukor", "sugar" - ALWAYS extract if present
-- PROTEIN: Look for "Fehérje", "Protein" - extract value
-- 
-- Ignore only sub-lines like "- ebből telített zsírsavak"
+    def _create_shared_store(self):
+        """Cross-process cache tier for multi-worker deployments (LLM_CACHE_BACKEND=sqlite)"""
+        if settings.LLM_CACHE_SIZE <= 0:
+            return None
+        from app.services.shared_cache import create_shared_store
+        
+        return create_shared_store()
+    
+    @classmethod
+    def _nutrient_patterns(cls) -> Dict[str, List[re.Pattern]]:
+        """Compiled NUTRIENT_PATTERNS, built once per process"""
+        if cls._compiled_nutrient_patterns is None:
+            cls._compiled_nutrient_patterns = {
+                nutrient: [re.compile(pattern, re.IGNORECASE) for pattern in pattern_list]
+                for nutrient, pattern_list in cls.NUTRIENT_PATTERNS.items()
+            }
+        return cls._compiled_nutrient_patterns
 
-REQUIRED ALLERGENS TO EXTRACT:
-- Gluten (wheat, barley, rye, oats, glutén, búza, gluténtartalmú)
-- Egg (eggs, egg products, tojás)
-- Crustaceans (shellfish, shrimp, crab, lobster, rák, rákfélék)
-- Fish (any fish species, hal)
-- Peanut (peanuts, groundnuts, mogyoró, földimogyoró)
-- Soy (soybeans, soy products, szója, szójabab)
-- Milk (dairy, lactose, milk products, tej, laktóz)
-- Tree nuts (almonds, walnuts, hazelnuts, etc., dió, diófélék, csonthéjasok)
-- Celery (celery root, celery leaves, zeller)
-- Mustard (mustard seeds, mustard powder, mustár)
+    @classmethod
+    def _allergen_patterns(cls) -> Dict[str, List[Tuple[re.Pattern, re.Pattern]]]:
+        """Compiled "+"/"-" indicator patterns per allergen keyword, built once per process"""
+        if cls._compiled_allergen_patterns is None:
+            cls._compiled_allergen_patterns = {
+                allergen: [
+                    (
+                        re.compile(rf"\d+\s*\+\s+.*?{keyword}", re.IGNORECASE),
+                        re.compile(rf"\d+\s*\-\s+.*?{keyword}", re.IGNORECASE),
+                    )
+                    for keyword in keywords_list
+                ]
+                for allergen, keywords_list in cls.ALLERGEN_KEYWORDS.items()
+            }
+        return cls._compiled_allergen_patterns
 
-TEXT TO ANALYZE:
-{text}
+    @classmethod
+    def _nutrient_patterns_with_keywords(cls) -> Dict[str, List[Tuple[re.Pattern, Optional[FrozenSet[str]]]]]:
+        """Compiled NUTRIENT_PATTERNS with the keywords each needs (see required_keywords), built once per process"""
+        if cls._keyed_nutrient_patterns is None:
+            cls._keyed_nutrient_patterns = {
+                nutrient: [
+                    (pattern, required_keywords(source))
+                    for pattern, source in zip(pattern_list, cls.NUTRIENT_PATTERNS[nutrient])
+                ]
+                for nutrient, pattern_list in cls._nutrient_patterns().items()
+            }
+        return cls._keyed_nutrient_patterns
 
-Return ONLY this JSON format:
-{{
-  "allergens": {{
-    "gluten": true/false,
-    "egg": true/false,
-    "crustaceans": true/false,
-    "fish": true/false,
-    "peanut": true/false,
-    "soy": true/false,
-    "milk": true/false,
-    "tree_nuts": true/false,
-    "celery": true/false,
-    "mustard": true/false
-  }},
-  "nutrients": {{
-    "energy": "value unit" or "N/A",
-    "fat": "value unit" or "N/A",
-    "carbohydrate": "value unit" or "N/A",
-    "sugar": "value unit" or "N/A",
-    "protein": "value unit" or "N/A",
-    "sodium": "value unit" or "N/A"
-  }}
-}}"""
+    def warm_up(self) -> Dict[str, float]:
+        """Compiles the fallback regex patterns ahead of the first request"""
+        start = time.perf_counter()
+        self._nutrient_patterns()
+        self._allergen_patterns()
+        self._nutrient_patterns_with_keywords()
+        return {"regex": time.perf_counter() - start}
+    
+    def create_comprehensive_prompt(self, text: str) -> str:
+        """Create comprehensive prompt for LLM extraction with better context understanding"""
+        return self.prompt_builder.build(text).prompt
 
-    async def extract_with_gemini(self, text: str, api_key: str) -> Tuple[Dict, Dict]:
-        """Extract with Gemini"""
+    async def extract_with_gemini(
+        self,
+        text: str,
+        api_key: str,
+        timeout: Optional[float] = None,
+        document: Optional[Document] = None,
+        usage: Optional[Dict] = None
+    ) -> Tuple[Dict, Dict]:
+        """
+        Extract with the LLM providers (Gemini by default, see LLMRouter); timeout (seconds)
+        caps the HTTP calls below the default 30s.
+        document (text split into pages) lets an over-budget prompt keep whole relevant pages.
+        usage, if given, is filled with the provider, model, estimated and reported token counts.
+        """
+        if not self.llm_router.providers:
+            # LLM_PROVIDERS=[]: regex fallback / local model only
+            return {}, {}
         try:
-            self.logger.info("Using Gemini for extraction...")
-            prompt = self.create_comprehensive_prompt(text)
+            self.logger.info("Using LLM for extraction...")
+            built = self.prompt_builder.build(text, document)
+            # Schema-constrained JSON, validated directly into the response models
+            structured = settings.GEMINI_STRUCTURED_OUTPUT
+            if usage is not None:
+                usage.update(
+                    model=self.llm_router.providers[0].model,
+                    prompt_tokens_estimate=built.estimated_tokens,
+                    input_truncated=built.truncated,
+                    cached=True  # until the call below actually runs
+                )
             
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-                url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-                
-                payload = {
-                    "contents": [{"parts": [{"text": prompt}]}],
-                    "generationConfig": {"temperature": 0.1, "maxOutputTokens": 1000}
-                }
-                
-                async with session.post(url, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        result_text = data["candidates"][0]["content"]["parts"][0]["text"].strip()
-                        self.logger.info(f" Gemini raw response: {result_text}")
-                        
-                        # Clean JSON response (remove markdown formatting)
-                        if result_text.startswith('```json'):
-                            result_text = result_text[7:]  # Remove ```json
-                        if result_text.endswith('```'):
-                            result_text = result_text[:-3]  # Remove ```
-                        result_text = result_text.strip()
-                        
-                        # Try to parse JSON
-                        try:
-                            result = json.loads(result_text)
-                            
-                            # Check if allergens is a list (incorrect LLM response) and convert to dict
-                            allergens_raw = result.get("allergens", {})
-                            nutrients_raw = result.get("nutrients", {})
-                            
-                            if isinstance(allergens_raw, list):
-                                self.logger.warning("LLM returned allergens as list, converting to empty dict")
-                                allergens = {}
-                            else:
-                                allergens = allergens_raw
-                            
-                            if isinstance(nutrients_raw, list):
-                                self.logger.warning("LLM returned nutrients as list, converting to empty dict")
-                                nutrients = {}
-                            else:
-                                nutrients = nutrients_raw
-                            
-                            # Log LLM results
-                            true_allergens = sum(1 for v in allergens.values() if v is True)
-                            self.logger.info(f" Gemini returned {true_allergens} true allergens: {[k for k, v in allergens.items() if v]}")
-                            self.logger.info(" Gemini JSON parsed successfully")
-                            return allergens, nutrients
-                        except json.JSONDecodeError:
-                            self.logger.warning(" Gemini response is not valid JSON, using fallback")
-                            return self.advanced_fallback(result_text)
-                    else:
-                        self.logger.error(f" Gemini API error: {response.status}")
-                        return {}, {}
-                        
+            # Identical prompts (e.g. re-exported versions of one spec) share a cached reply
+            key_prompt = built.prompt
+            if settings.LLM_CACHE_RELEVANT_PAGES and document is not None and len(document.pages) > 1:
+                # A revision that only changed other pages (cover, change log) reuses the reply too
+                relevant = self.prompt_builder.relevant_text(document)
+                if relevant:
+                    key_prompt = self.prompt_builder.prefix + relevant + self.prompt_builder.suffix
+            cache_key = LLMResponseCache.make_key(
+                self.llm_router.label, self.llm_router.generation_configs(structured), key_prompt
+            )
+            return await self.llm_cache.get_or_call(
+                cache_key,
+                lambda: self._call_llm(built.prompt, structured, api_key, timeout, usage)
+            )
+        except CircuitOpenError as e:
+            self.logger.warning("LLM skipped: %s", e)
+            return {}, {}
         except Exception as e:
-            self.logger.error(f"Gemini failed: {e}")
+            self.logger.error("LLM failed: %s", e)
             return {}, {}
     
+    async def _call_llm(
+        self,
+        prompt: str,
+        structured: bool,
+        api_key: str,
+        timeout: Optional[float] = None,
+        usage: Optional[Dict] = None
+    ) -> Tuple[Dict, Dict]:
+        """Send the prompt through the router and parse the reply into (allergens, nutrients)"""
+        if usage is not None:
+            usage["cached"] = False
+        reply_usage: Dict = {}
+        provider, result_text = await self.llm_router.complete(prompt, structured, api_key, timeout, reply_usage)
+        self.logger.info(
+            "%s usage: prompt_tokens=%s response_tokens=%s hedged=%s", provider.name,
+            reply_usage.get("prompt_tokens"), reply_usage.get("response_tokens"), reply_usage.get("hedged")
+        )
+        if usage is not None:
+            usage.update(reply_usage)
+        log_payload(self.logger, " %s raw response: %s", provider.name, result_text)
+        
+        if structured:
+            return self._parse_structured_reply(result_text)
+        return self._parse_reply(result_text)
+    
+    def _parse_reply(self, result_text: str) -> Tuple[Dict, Dict]:
+        """Parse a free-form reply: strip ```json fences, json.loads, regex fallback on non-JSON"""
+        # Clean JSON response (remove markdown formatting)
+        if result_text.startswith('```json'):
+            result_text = result_text[7:]  # Remove ```json
+        if result_text.endswith('```'):
+            result_text = result_text[:-3]  # Remove ```
+        result_text = result_text.strip()
+        
+        # Try to parse JSON
+        try:
+            result = json.loads(result_text)
+            
+            # Check if allergens is a list (incorrect LLM response) and convert to dict
+            allergens_raw = result.get("allergens", {})
+            nutrients_raw = result.get("nutrients", {})
+            
+            if isinstance(allergens_raw, list):
+                self.logger.warning("LLM returned allergens as list, converting to empty dict")
+                allergens = {}
+            else:
+                allergens = allergens_raw
+            
+            if isinstance(nutrients_raw, list):
+                self.logger.warning("LLM returned nutrients as list, converting to empty dict")
+                nutrients = {}
+            else:
+                nutrients = nutrients_raw
+            
+            # Log LLM results
+            true_allergens = sum(1 for v in allergens.values() if v is True)
+            self.logger.info(" LLM returned %s true allergens: %s", true_allergens, [k for k, v in allergens.items() if v])
+            self.logger.info(" LLM JSON parsed successfully")
+            return allergens, nutrients
+        except json.JSONDecodeError:
+            self.logger.warning(" LLM response is not valid JSON, using fallback")
+            return self.advanced_fallback(result_text)
+    
+    def _parse_structured_reply(self, result_text: str) -> Tuple[Dict, Dict]:
+        """Parse a schema-constrained reply; falls back to _parse_reply if it does not validate"""
+        from pydantic import ValidationError
+
+        try:
+            allergens, nutrients = parse_extraction_result(result_text)
+        except ValidationError as e:
+            # e.g. JSON cut off at maxOutputTokens
+            self.logger.warning(" LLM structured reply did not validate (%s errors), parsing as text", e.error_count())
+            return self._parse_reply(result_text)
+        self.logger.info(" LLM returned %s true allergens: %s", sum(allergens.values()), [k for k, v in allergens.items() if v])
+        return allergens, nutrients
+    
     def advanced_fallback(self, text: str) -> Tuple[Dict, Dict]:
         """Advanced fallback with comprehensive patterns for all document types"""
         self.logger.info("Using advanced fallback...")
-        self.logger.debug(f"Text length: {len(text)}, first 200 chars: {text[:200]}")
+        self.logger.debug("Text length: %s", len(text))
+        log_payload(self.logger, "Fallback input, first 200 chars: %s", text[:200])
         
-        # Comprehensive patterns for all document formats
-        patterns = {
-            "energy": [
-                # IMPORTANT: Both units formats FIRST
-                # Format with colon: "Energy/Energia: 1173 kJ/282kcal"
-                r"energy/energia:\s*(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)kcal",
-                r"energia/energy:\s*(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)kcal",
-                # Format: "Energy/Energia 1173 kJ/282kcal" or "Energia/Energy 1173 kJ/282kcal"
-                r"energy/energia\s*(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)kcal",
-                r"energia/energy\s*(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)kcal",
-                # Format with label "value": "Energia/Energy value 224 kJ / 53 kcal"
-                r"energia/energy\s+value\s+(\d+(?:,\d+)?)\s*kj\s*/\s*(\d+(?:,\d+)?)\s*kcal",
-                # Format with multiple spaces: "Energia/Energy value  224 kJ / 53 kcal"
-                r"energia/energy\s+value\s{2,}(\d+(?:,\d+)?)\s*kj\s*/\s*(\d+(?:,\d+)?)\s*kcal",
-                # Format: "Energia 1173 kJ/282kcal"
-                r"(?:energia|energy)\s+(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)kcal",
-                # Format: "Energia: 224 kJ / 53 kcal"
-                r"(?:energia|energy)[:\s]*(\d+(?:,\d+)?)\s*kj\s*/\s*(\d+(?:,\d+)?)\s*kcal",
-                r"(\d+(?:,\d+)?)\s*kj\s*/\s*(\d+(?:,\d+)?)\s*kcal",
-                r"(\d+(?:,\d+)?)\s*kj/(\d+(?:,\d+)?)\s*kcal",  # Without space
-                r"(\d+(?:,\d+)?)\s*kj\s*\((\d+(?:,\d+)?)\s*kcal\)",  # Parentheses
-                
-                # Standard formats with labels (single unit)
-                r"(?:energia|energy|énergie|calories|calorías)[:\s]*(\d+(?:,\d+)?)\s*(?:kj|kcal)(?!\s*/)",
-                r"(?:energia|energy|énergie|calories|calorías)\s*\[(?:kj|kcal)\]\s*:\s*(\d+(?:,\d+)?)\s*(?:kj|kcal)",
-                
-                # Direct energy values (more specific)
-                r"(\d+(?:,\d+)?)\s*kj(?!\s*/)",  # kJ only
-                r"(\d+(?:,\d+)?)\s*kcal(?!\s*/)",  # kcal only
-                
-                # Hungarian kcal formats
-                r"energia\s*:\s*(\d+(?:,\d+)?)\s*kcal",
-                r"energia\s+(\d+(?:,\d+)?)\s*kcal",
-                r"energia\s+(\d+(?:,\d+)?)\s*kj",
-                
-                # Hungarian specific formats
-                r"energia\s*\[kj\]\s*:\s*(\d+(?:,\d+)?)\s*kj",
-                r"energia\s*\[kcal\]\s*:\s*(\d+(?:,\d+)?)\s*kcal",
-                r"energia\s*:\s*(\d+(?:,\d+)?)\s*(?:kj|kcal)",
-                
-                # French formats
-                r"énergie\s*:\s*(\d+(?:,\d+)?)\s*(?:kj|kcal)",
-                r"calories\s*:\s*(\d+(?:,\d+)?)\s*kcal",
-                
-                # Table formats
-                r"energia\s*\(kj\)\s*:\s*(\d+(?:,\d+)?)",
-                r"energia\s*\(kcal\)\s*:\s*(\d+(?:,\d+)?)",
-                
-                # Hungarian table format: "Energia  kJ  1553 I N X"
-                r"energia\s+\s*kj\s+(\d+)(?:\s+[INX])?",
-                r"energia\s+\s*kcal\s+(\d+)(?:\s+[INX])?",
-                
-                # OCR error patterns
-                r"energia\s*:\s*(\d+(?:[.,]\d+)?)\s*(?:kj|kcal)",
-                r"energy\s*:\s*(\d+(?:[.,]\d+)?)\s*(?:kj|kcal)"
-            ],
-            "fat": [
-                # Standard formats with labels
-                r"(?:zsír|fat|lipides|gras|grasas)[:\s]+(\d+(?:[,.]\d+)?)\s*g(?!\s*/)",
-                r"(?:zsírtartalom|fat content|contenu en lipides|contenido en grasas)[:\s]+(\d+(?:[,.]\d+)?)\s*g(?!\s*/)",
-                # Hungarian without colon
-                r"zsír\s+(\d+(?:[,.]\d+)?)\s*g",
-                r"fat\s+(\d+(?:[,.]\d+)?)\s*g",
-                
-                # Hungarian table format: "Zsír  g  36 N"
-                r"zsír\s+\s*g\s+(\d+(?:,\d+)?)(?:\s+[INX])?",
-                # Hungarian table format: "Zsír  g  36 N" (alternative)
-                r"zsír\s+\s*g\s+(\d+)(?:\s+[INX])?",
-                # Hungarian table format with comma: "Zsír  g  36,5 N"
-                r"zsír\s+\s*g\s+(\d+,\d+)(?:\s+[INX])?",
-                r"zsír\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[INX]",
-                r"zsír\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[NX]",
-                r"zsír\s*\[g\]\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"zsír\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"zsír\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"zsírtartalom\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # Direct values without labels (for table formats) - REMOVED TOO BROAD
-                # r"(\d{1,2},\d{2})\s*g\s*$",
-                # r"^(\d{1,2},\d{2})\s*g",
-                # r"^\s*(\d{1,2},\d{2})\s*$",
-                # r"(\d{1,3},\d{1,2})\s*g",
-                # r"(\d+,\d+)\s*g"
-                
-                # English formats
-                r"fat/.*?(\d+(?:,\d+)?)\s*g",
-                r"fat\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"total fat\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # French formats
-                r"lipides\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"matières grasses\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # Spanish formats
-                r"grasas\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"lípidos\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # Table formats
-                r"zsír\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
-                r"fat\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
-                
-                # OCR error patterns
-                r"zsir\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                r"fat\s*:\s*(\d+(?:[.,]\d+)?)\s*g"
-            ],
-            "protein": [
-                # Standard formats with labels
-                r"(?:fehérje|protein|protéines|proteínas|proteine)[:\s]+(\d+(?:,\d+)?)\s*g(?!\s*/)",
-                # Hungarian without colon
-                r"fehérje\s+(\d+(?:,\d+)?)\s*g",
-                r"protein\s+(\d+(?:,\d+)?)\s*g",
-                
-                # Hungarian table format: "Fehérje  g 21,6" or "Fehérje  g 12 N" - capture ONLY the number
-                r"fehérje\s+\s*g\s+(\d+(?:,\d+)?)(?!\s*[gG])",
-                r"Fehérje\s+\s*g\s+(\d+(?:,\d+)?)(?!\s*[gG])",
-                r"fehérje\s*\[\s*g\s*\]\s+(\d+(?:,\d+)?)(?=\s*[INX]|\s|$)",
-                r"fehérje\s*\[\s*g\s*\]\s+(\d+(?:,\d+)?)(?=\s*[NX]|\s|$)",
-                r"fehérje\s*\[g\]\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"fehérje\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"fehérje\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"fehérjetartalom\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # English formats
-                r"protein/.*?(\d+(?:,\d+)?)\s*g",
-                r"protein\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"total protein\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # French formats
-                r"protéines\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"protéine\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # Spanish formats
-                r"proteínas\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"proteína\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # Table formats
-                r"fehérje\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
-                r"protein\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
-                
-                # OCR error patterns
-                r"feherje\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                r"protein\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                # OCR patterns for yogurt document
-                r"Fehérje\s*(\d+(?:[.,]\d+)?)\s*g",
-                r"fehérje\s*(\d+(?:[.,]\d+)?)\s*g",
-                # Direct values for table formats - REMOVED TOO BROAD
-                # r"^\s*(\d{1,2},\d{1})\s*g",
-                # r"(\d+,\d+)\s*g"
-            ],
-            "carbohydrate": [
-                # Standard formats with labels
-                r"(?:szénhidrát|carbohydrate|carbohydrates|glucides|hidratos de carbono)[:\s]+(\d+(?:,\d+)?)\s*g(?!\s*/)",
-                # Hungarian without colon
-                r"szénhidrát\s+(\d+(?:,\d+)?)\s*g",
-                r"carbohydrate\s+(\d+(?:,\d+)?)\s*g",
-                # Add pattern for decimal in Hungarian
-                r"szénhidrát\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                
-                # Hungarian table format: "Szénhidrát  g  1 N"
-                r"szénhidrát\s+\s*g\s+(\d+)(?:\s+[INX])?",
-                r"szénhidrát\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[INX]",
-                r"szénhidrát\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[NX]",
-                r"szénhidrát\s*\[g\]\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"szénhidrát\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"szénhidrát\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"szénhidráttartalom\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # English formats
-                r"carbohydrate/.*?(\d+(?:,\d+)?)\s*g",
-                r"carbohydrate\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"total carbohydrate\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"carbohydrates\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # French formats
-                r"glucides\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"hydrates de carbone\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # Spanish formats
-                r"hidratos de carbono\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"carbohidratos\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # Table formats
-                r"szénhidrát\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
-                r"carbohydrate\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
-                
-                # OCR error patterns
-                r"szénhidrat\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                r"carbohydrate\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                # Direct values for table formats - REMOVED TOO BROAD
-                # r"^\s*(\d{1,3},\d{1,2})\s*g",
-                # r"(\d+,\d+)\s*g"
-            ],
-            "sugar": [
-                # Standard formats with labels
-                r"(?:cukor|sugar|sugars|sucres|azúcares)[:\s]+(\d+(?:,\d+)?)\s*g(?!\s*/)",
-                # Hungarian without colon
-                r"cukor\s+(\d+(?:,\d+)?)\s*g",
-                r"sugar\s+(\d+(?:,\d+)?)\s*g",
-                
-                # Hungarian table format: "cukor  g  0,5 N"
-                r"cukor\s+\s*g\s+(\d+,\d+)(?:\s+[INX])?",
-                # "amelyből cukor: X.X g" or "-of which sugars/ X.X g amelyből cukrok"
-                r"amelyből cukor\s*[:\s]+\s*(\d+(?:,\d+)?)\s*g",
-                r"amelyből cukrok\s*[:\s]+\s*(\d+(?:,\d+)?)\s*g",
-                r"-of which sugars/\s*(\d+(?:,\d+)?)\s*g",
-                r"-of which sugar/\s*(\d+(?:,\d+)?)\s*g",
-                # Format: "amelyből cukrok  2,4 g" (with spaces, no colon)
-                r"amelyből cukrok\s+(\d+(?:,\d+)?)\s*g",
-                r"amelyből cukor\s+(\d+(?:,\d+)?)\s*g",
-                r"sugars?\s*:\s*(\d+(?:,\d+)?)\s*g(?!\s*/)",
-                r"sugar\s*:\s*(\d+(?:,\d+)?)\s*g(?!\s*/)",
-                r"cukrok\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[INX]",
-                r"cukor\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[INX]",
-                r"cukor\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"cukrok\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"cukor\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"cukrok\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"cukortartalom\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # English formats
-                r"sugars/\s*(\d+(?:,\d+)?)\s*g",
-                r"sugar/.*?(\d+(?:,\d+)?)\s*g",
-                r"sugar\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"sugars\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"of which sugars\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # French formats
-                r"sucres\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"dont sucres\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # Spanish formats
-                r"azúcares\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"de los cuales azúcares\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # Table formats
-                r"cukor\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
-                r"sugar\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
-                
-                # OCR error patterns
-                r"cukor\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                r"sugar\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                # OCR patterns for yogurt document
-                r"amelyből cukrok\s*[:\s]+\s*(\d+(?:[.,]\d+)?)\s*g",
-                r"amelyből cukrok\s+(\d+(?:[.,]\d+)?)\s*g",
-                r"cukrok\s+(\d+(?:[.,]\d+)?)\s*g",
-                # Handle variations: "amelyből cukrok: 2,4" without "g"
-                r"amelyből cukrok\s*[:\s]+\s*(\d+(?:[.,]\d+)?)",
-                r"ebből cukor\s*[:\s]+\s*(\d+(?:[.,]\d+)?)\s*g"
-            ],
-            "sodium": [
-                # Standard formats with labels
-                r"(?:só|salt|sodium|sel|nátrium|sal)[:\s]+(\d+(?:,\d+)?)\s*g(?!\s*/)",
-                # Handle "-" or "not specified" cases
-                r"(?:só|salt|sodium)[:\s]+[-\u2013]",
-                # Hungarian without colon
-                r"só\s+(\d+(?:,\d+)?)\s*g",
-                r"salt\s+(\d+(?:,\d+)?)\s*g",
-                
-                # Hungarian table format: "Só  g  1,9 N"
-                r"só\s+\s*g\s+(\d+,\d+)(?:\s+[INX])?",
-                r"só\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[INX]",
-                r"só\s*\[\s*g\s*\]\s*(\d+(?:,\d+)?)\s*[NX]",
-                r"só\s*\[g\]\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"só\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"só\s*g\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"nátrium\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"sótartalom\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # English formats
-                r"salt/.*?(\d+(?:[.,]\d+)?)\s*g",
-                r"salt\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                r"sodium\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                r"sodium\s*:\s*(\d+(?:[.,]\d+)?)\s*mg",
-                
-                # French formats
-                r"sel\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"sodium\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # Spanish formats
-                r"sal\s*:\s*(\d+(?:,\d+)?)\s*g",
-                r"sodio\s*:\s*(\d+(?:,\d+)?)\s*g",
-                
-                # Table formats
-                r"só\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
-                r"salt\s*\(g\)\s*:\s*(\d+(?:,\d+)?)",
-                
-                # OCR error patterns
-                r"so\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                r"salt\s*:\s*(\d+(?:[.,]\d+)?)\s*g",
-                # Direct values for table formats - REMOVED TOO BROAD
-                # r"^\s*(\d{1},\d{3})\s*g",
-                # r"^\s*(\d{1},\d{2})\s*g",
-                # r"(\d+,\d{3})\s*g"
-            ]
-        }
+        # Patterns whose keywords do not occur in the text (e.g. those of other languages)
+        # cannot match; skipping them leaves the first match, and so the result, unchanged
+        prefilter = settings.FALLBACK_KEYWORD_PREFILTER
+        lowered = fold_case(text)
         
         # Initialize nutrients with default values
         nutrients = {
@@ -449,20 +695,23 @@ Return ONLY this JSON format:
             "sodium": "N/A"
         }
         
-        for nutrient, pattern_list in patterns.items():
+        for nutrient, pattern_list in self._nutrient_patterns_with_keywords().items():
             value = None
-            match_text = None
-            for pattern in pattern_list:
-                match = re.search(pattern, text, re.IGNORECASE)
+            for pattern, keywords in pattern_list:
+                if prefilter and keywords and not any(keyword in lowered for keyword in keywords):
+                    continue
+                match = pattern.search(text)
                 if match:
-                    match_text = match.group(0)
                     # Handle different group numbers
                     if len(match.groups()) > 1:
                         # For energy with both kJ and kcal, prefer kJ
                         value = match.group(1) if match.group(1) else match.group(2)
+                    elif not match.groups():
+                        # Dash patterns ("Só: -") declare the nutrient absent: keep N/A
+                        value = None
                     else:
                         value = match.group(1)
-                    self.logger.debug(f"Matched {nutrient} with pattern: {match.group(0)} -> {value}")
+                    self.logger.debug("Matched %s with pattern: %s -> %s", nutrient, match.group(0), value)
                     break
             
             if value:
@@ -471,70 +720,28 @@ Return ONLY this JSON format:
                     # Handle both comma and dot as decimal separators
                     num_value = float(value.replace(',', '.'))
                     
-                        # Reasonable ranges for nutrients per 100g
-                    max_values = {
-                        "energy": 5000,  # kJ (increased for high-energy foods)
-                        "fat": 100,      # g (increased for high-fat foods)
-                        "protein": 100,  # g (increased for high-protein foods)
-                        "carbohydrate": 100,  # g
-                        "sugar": 100,    # g
-                        "sodium": 10     # g (increased for processed foods)
-                    }
-                    
-                    # Also check for suspiciously low values (likely wrong extraction)
-                    min_values = {
-                        "energy": 50,    # kJ (minimum reasonable energy)
-                        "fat": 0.01,     # g (minimum fat - allow very low fat products)
-                        "protein": 0.01,  # g (minimum protein)
-                        "carbohydrate": 0.01,  # g (minimum carbohydrate)
-                        "sugar": 0.01,   # g (minimum sugar)
-                        "sodium": 0.001  # g (minimum sodium)
-                    }
+                    max_values = self.NUTRIENT_MAX_VALUES
+                    min_values = self.NUTRIENT_MIN_VALUES
                     
                     # Skip validation for energy - we'll handle it specially
                     if nutrient != "energy":
                         if num_value > max_values.get(nutrient, 1000):
-                            self.logger.warning(f"Suspicious high value for {nutrient}: {value}")
+                            self.logger.warning("Suspicious high value for %s: %s", nutrient, value)
                             nutrients[nutrient] = "N/A"
                             continue
                     
                     if num_value < min_values.get(nutrient, 0):
-                        self.logger.warning(f"Suspicious low value for {nutrient}: {value}")
+                        self.logger.warning("Suspicious low value for %s: %s", nutrient, value)
                         # Don't reject, just warn - might be correct for very low values
                         
                 except ValueError:
-                    self.logger.warning(f"Invalid number format for {nutrient}: {value}")
+                    self.logger.warning("Invalid number format for %s: %s", nutrient, value)
                     nutrients[nutrient] = "N/A"
                     continue
                 
-                if nutrient == "energy":
-                    # Check if we matched both kJ and kcal (pattern with 2 groups)
-                    if match and len(match.groups()) >= 2:
-                        # Both units found - save as combined format
-                        kj_val = match.group(1)
-                        kcal_val = match.group(2)
-                        nutrients["energy"] = f"{kj_val} kJ / {kcal_val} kcal"
-                    else:
-                        # Single unit - infer from text
-                        unit = "kJ"
-                        if match_text:
-                            lt = match_text.lower()
-                            # Check for kcal pattern (must be explicit)
-                            if "kcal" in lt and "kj" not in lt:
-                                unit = "kcal"
-                            elif "kj" in lt:
-                                unit = "kJ"
-                        
-                        nutrients["energy"] = f"{value} {unit}"
-                else:
-                    # Handle sodium in mg → convert to g
-                    if nutrient == "sodium" and match_text and "mg" in match_text.lower():
-                        grams = num_value / 1000.0
-                        nutrients[nutrient] = f"{grams:.3f} g"
-                    else:
-                        nutrients[nutrient] = f"{value} g"
+                nutrients[nutrient] = self._format_nutrient(nutrient, match, value, num_value)
         
-        self.logger.info(f"Extracted nutrients: {nutrients}")
+        self.logger.info("Extracted nutrients: %s", nutrients)
         
         # Improved allergen detection with context
         # BE CONSERVATIVE: Default all allergens to False unless explicitly found
@@ -551,42 +758,58 @@ Return ONLY this JSON format:
             "mustard": False
         }
         
-        # CONSERVATIVE APPROACH: Only look for numbered allergen table format
-        
         # CONSERVATIVE APPROACH: Only look for numbered allergen table format
         # Format: "06 + Gluten", "03 - Eggs", etc.
-        
-        # Basic fallback: parse numbered format "06 + Gluten", "03 - Eggs"
-        allergen_keywords = {
-            "gluten": ["gluten", "glutén"],
-            "milk": ["milk", "tej", "tejfehérje", "laktóz"],
-            "egg": ["egg", "tojás"],
-            "crustaceans": ["crustacean", "rák", "rákfélék"],
-            "fish": ["fish", "hal"],
-            "peanut": ["peanut", "földimogyoró"],
-            "soy": ["soy", "szója"],
-            "tree_nuts": ["almond", "walnut", "dió", "diófélék"],
-            "celery": ["celery", "zeller"],
-            "mustard": ["mustard", "mustár"]
-        }
-        
-        for allergen, keywords_list in allergen_keywords.items():
-            for keyword in keywords_list:
+        for allergen, keyword_patterns in self._allergen_patterns().items():
+            for keyword, (plus_pattern, minus_pattern) in zip(self.ALLERGEN_KEYWORDS[allergen], keyword_patterns):
+                if prefilter and keyword not in lowered:
+                    # Both patterns need the keyword itself
+                    continue
                 # Check for "+" indicator
-                plus_pattern = rf"\d+\s*\+\s+.*?{keyword}"
-                if re.search(plus_pattern, text, re.IGNORECASE):
+                if plus_pattern.search(text):
                     allergens[allergen] = True
-                    self.logger.info(f"Found {allergen} with +")
+                    self.logger.info("Found %s with +", allergen)
                     break
                 # Check for "-" indicator
-                minus_pattern = rf"\d+\s*\-\s+.*?{keyword}"
-                if re.search(minus_pattern, text, re.IGNORECASE):
+                if minus_pattern.search(text):
                     allergens[allergen] = False
-                    self.logger.info(f"Found {allergen} with -")
+                    self.logger.info("Found %s with -", allergen)
                     break
         
         return allergens, nutrients
     
+    @staticmethod
+    def _format_nutrient(nutrient: str, match: re.Match, value: str, num_value: float) -> str:
+        """Output string for a matched nutrient value (units, kJ/kcal pairs, sodium mg -> g)"""
+        match_text = match.group(0)
+        if nutrient == "energy":
+            # Check if we matched both kJ and kcal (pattern with 2 groups)
+            if len(match.groups()) >= 2:
+                # Both units found - save as combined format
+                kj_val = match.group(1)
+                kcal_val = match.group(2)
+                return f"{kj_val} kJ / {kcal_val} kcal"
+            
+            # Single unit - infer from text
+            unit = "kJ"
+            lt = match_text.lower()
+            # Check for kcal pattern (must be explicit)
+            if "kcal" in lt and "kj" not in lt:
+                unit = "kcal"
+            elif "kj" in lt:
+                unit = "kJ"
+            return f"{value} {unit}"
+        
+        # Handle sodium in mg → convert to g
+        if nutrient == "sodium" and "mg" in match_text.lower():
+            grams = num_value / 1000.0
+            return f"{grams:.3f} g"
+        return f"{value} g"
+    
+    def clean_document(self, document: Document) -> Document:
+        """clean_text applied page by page; clean_text flattens whitespace, so pages are joined by a space"""
+        return document.map_pages(self.clean_text, separator=" ")
+    
     def clean_text(self, text: str) -> str:
         """Advanced text cleaning with OCR error correction"""
         # Remove extra spaces and normalize
@@ -42,3 +42,70 @@ def sample_gemini_key():
     """Sample Gemini API key"""
     return "test_api_key_12345"
 
+
+def build_pdf(pages):
+    """
+    Minimal PDF: one page per entry, each a dict with optional "text" (lines drawn in
+    Helvetica) and "image" (share of the page covered by a gray image XObject)
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None]
+    kids = []
+    font_id = None
+    for page in pages:
+        resources = []
+        content = b""
+        if page.get("text") is not None:
+            if font_id is None:
+                objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+                font_id = len(objects)
+            resources.append(f"/Font << /F1 {font_id} 0 R >>")
+            lines = " ".join(f"({line}) Tj T*" for line in page["text"].split("\n"))
+            content += f"BT /F1 10 Tf 20 800 Td 12 TL {lines} ET\n".encode("latin-1")
+        if page.get("image"):
+            objects.append(b"<< /Type /XObject /Subtype /Image /Width 1 /Height 1 /ColorSpace /DeviceGray "
+                           b"/BitsPerComponent 8 /Length 1 >>\nstream\n\x80\nendstream")
+            resources.append(f"/XObject << /Im1 {len(objects)} 0 R >>")
+            content += f"q 595 0 0 {842 * page['image']:.0f} 0 0 cm /Im1 Do Q\n".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        contents_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << {' '.join(resources)} >> "
+            f"/Contents {contents_id} 0 R >>".encode()
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+LABEL_TEXT = (
+    "Nutrition per 100 g\nEnergy: 1173 kJ/282kcal\nFat: 6,9 g\nCarbohydrate: 45 g\n"
+    "of which sugars: 12,5 g\nProtein: 8,2 g\nSalt: 1,2 g\nAllergens 01 + Gluten 07 + Milk"
+)
+
+
+@pytest.fixture
+def make_pdf():
+    """Factory for small generated PDFs (see build_pdf)"""
+    return build_pdf
+
+
+@pytest.fixture
+def label_text():
+    """Text of a typical nutrition label"""
+    return LABEL_TEXT
+
+
+@pytest.fixture
+def label_pdf():
+    """Text PDF with a nutrition table and allergen list"""
+    return build_pdf([{"text": LABEL_TEXT}])
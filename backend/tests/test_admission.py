@@ -0,0 +1,152 @@
+"""Admission control: OCR page budget, per-client quotas and tickets"""
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionRejected, client_key
+from app.services.triage import ROUTE_HYBRID, ROUTE_OCR, ROUTE_TEXT, Triage
+
+
+def scan(pages):
+    return Triage(ROUTE_OCR, pages, list(range(1, pages + 1)))
+
+
+def text(pages=1):
+    return Triage(ROUTE_TEXT, pages)
+
+
+def test_ocr_budget():
+    controller = AdmissionController(max_ocr_pages=4)
+    first = controller.try_admit("a", scan(3))
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.try_admit("b", scan(2))
+    assert rejected.value.status_code == 503
+    assert rejected.value.retry_after >= 1
+    # Text PDFs are not charged and keep flowing
+    controller.try_admit("b", text(50)).release()
+    first.release()
+    controller.try_admit("b", scan(2)).release()
+    assert controller.stats()["rejected"]["ocr_budget"] == 1
+
+
+def test_hybrid_is_charged_its_scanned_pages_only():
+    controller = AdmissionController(max_ocr_pages=4)
+    ticket = controller.try_admit("a", Triage(ROUTE_HYBRID, 10, [2, 5]))
+    assert controller.ocr_pages_in_flight == 2
+    ticket.release()
+
+
+def test_document_larger_than_budget_only_when_idle():
+    controller = AdmissionController(max_ocr_pages=4)
+    ticket = controller.try_admit("a", scan(20))
+    assert controller.ocr_pages_in_flight == 4
+    with pytest.raises(AdmissionRejected):
+        controller.try_admit("b", scan(1))
+    ticket.release()
+    assert controller.ocr_pages_in_flight == 0
+
+
+def test_release_is_idempotent():
+    controller = AdmissionController(max_ocr_pages=4)
+    ticket = controller.try_admit("a", scan(2))
+    ticket.release()
+    ticket.release()
+    stats = controller.stats()
+    assert stats["ocr_pages_in_flight"] == 0
+    assert stats["requests_in_flight"] == 0
+    assert stats["clients_in_flight"] == 0
+
+
+def test_reserve_ocr_charges_the_ticket():
+    controller = AdmissionController(max_ocr_pages=4)
+    ticket = controller.try_admit("a", text(3))
+    ticket.reserve_ocr(3)
+    assert controller.ocr_pages_in_flight == 3
+    other = controller.try_admit("b", text(2))
+    with pytest.raises(AdmissionRejected) as rejected:
+        other.reserve_ocr(2)
+    assert rejected.value.status_code == 503
+    assert other.ocr_pages == 0
+    ticket.release()
+    other.release()
+    assert controller.ocr_pages_in_flight == 0
+
+
+def test_client_inflight_limit():
+    controller = AdmissionController(max_ocr_pages=4, client_max_inflight=2)
+    tickets = [controller.try_admit("a", text()) for _ in range(2)]
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.try_admit("a", text())
+    assert rejected.value.status_code == 429
+    controller.try_admit("b", text()).release()
+    tickets[0].release()
+    controller.try_admit("a", text()).release()
+
+
+def test_client_rate_limit(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("app.services.admission.time.monotonic", lambda: clock[0])
+    controller = AdmissionController(max_ocr_pages=4, client_rate=6)  # burst of 1, one per 10 s
+    controller.try_admit("a", text()).release()
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.try_admit("a", text())
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after == 10
+    clock[0] += 10
+    controller.try_admit("a", text()).release()
+
+
+def test_refilled_rate_buckets_are_pruned(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("app.services.admission.time.monotonic", lambda: clock[0])
+    controller = AdmissionController(max_ocr_pages=4, client_rate=60)
+    for client in range(100):
+        controller.try_admit(f"ip:{client}", text()).release()
+    assert controller.stats()["rate_buckets"] == 100
+    clock[0] += 60
+    controller.try_admit("ip:new", text()).release()
+    assert controller.stats()["rate_buckets"] == 1
+
+
+def test_client_key(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "ADMISSION_CLIENT_KEY", "api_key")
+    assert client_key("secret", "10.0.0.1") == client_key("secret", "10.0.0.2")
+    assert "secret" not in client_key("secret", None)
+    assert client_key("", "10.0.0.1") == "ip:10.0.0.1"
+    monkeypatch.setattr(settings, "ADMISSION_CLIENT_KEY", "ip")
+    assert client_key("secret", "10.0.0.1") == "ip:10.0.0.1"
+
+
+def test_reserve_ocr_caps_one_request_at_the_budget():
+    controller = AdmissionController(max_ocr_pages=4)
+    ticket = controller.try_admit("a", scan(1))
+    ticket.reserve_ocr(300)
+    assert controller.ocr_pages_in_flight == 4
+    ticket.release()
+    # Unknown length: the whole budget, and only while nothing else is OCR'd
+    other = controller.try_admit("b", scan(1))
+    unknown = controller.try_admit("c", scan(1))
+    with pytest.raises(AdmissionRejected):
+        unknown.reserve_ocr(None)
+    other.release()
+    unknown.reserve_ocr(None)
+    assert controller.ocr_pages_in_flight == 4
+    unknown.release()
+
+
+def test_ocr_page_estimate_times_only_the_ocr_stage(monkeypatch):
+    import app.services.admission as admission
+
+    now = [0.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    controller = AdmissionController(max_ocr_pages=8, seconds_per_ocr_page=3.0)
+    triage = scan(2)
+    ticket = controller.try_admit("a", triage)
+    # 2 pages OCR'd in 2 s; the request took 60 s in all (LLM, waiting for an OCR thread)
+    triage.ocr_seconds, triage.ocr_pages_done = 2.0, 2
+    now[0] = 60.0
+    ticket.release()
+    assert controller.stats()["seconds_per_ocr_page"] == pytest.approx(3.0 + 0.2 * (1.0 - 3.0))
+    # No OCR ran (e.g. every page came from a text layer): the estimate is unchanged
+    controller.try_admit("a", scan(2)).release()
+    assert controller.stats()["seconds_per_ocr_page"] == pytest.approx(2.6)
@@ -0,0 +1,78 @@
+"""Bulk extraction CLI: checkpoint and resume"""
+import json
+
+from app.cli import ResultWriter, _repair_tail, iter_inputs, load_checkpoint, main
+
+
+def records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_repair_tail_drops_a_cut_off_record(tmp_path):
+    out = tmp_path / "results.jsonl"
+    out.write_text('{"file": "a", "success": true}\n{"file": "b", "succ')
+    _repair_tail(str(out))
+    assert out.read_text() == '{"file": "a", "success": true}\n'
+
+
+def test_checkpoint_jsonl(tmp_path):
+    out = str(tmp_path / "results.jsonl")
+    assert load_checkpoint(out, "jsonl", False) == set()
+    writer = ResultWriter(out, "jsonl")
+    writer.write({"file": "a.pdf", "success": True})
+    writer.write({"file": "b.pdf", "success": False, "error": "not a PDF file"})
+    writer.write({"file": "c.pdf", "success": False})
+    writer.write({"file": "c.pdf", "success": True})  # the last record of a file wins
+    writer.close()
+    assert load_checkpoint(out, "jsonl", False) == {"a.pdf", "b.pdf", "c.pdf"}
+    assert load_checkpoint(out, "jsonl", True) == {"a.pdf", "c.pdf"}
+
+
+def test_checkpoint_csv(tmp_path):
+    out = str(tmp_path / "results.csv")
+    for record in ({"file": "a.pdf", "success": True, "allergens": {"milk": True}}, {"file": "b.pdf", "success": False}):
+        # A writer per record: the header is written once
+        writer = ResultWriter(out, "csv")
+        writer.write(record)
+        writer.close()
+    lines = (tmp_path / "results.csv").read_text().splitlines()
+    assert len(lines) == 3
+    assert lines[0].startswith("file,success,")
+    assert load_checkpoint(out, "csv", True) == {"a.pdf"}
+
+
+def test_iter_inputs(tmp_path):
+    (tmp_path / "b").mkdir()
+    for name in ("b/2.pdf", "b/1.PDF", "a.pdf", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# listed\nextra.pdf\n\n")
+    names = [name for _, name in iter_inputs([str(tmp_path)], str(manifest))]
+    assert names == [str(tmp_path / name) for name in ("a.pdf", "b/1.PDF", "b/2.pdf")] + ["extra.pdf"]
+
+
+def test_interrupted_run_resumes(tmp_path, label_pdf):
+    inputs = tmp_path / "pdfs"
+    inputs.mkdir()
+    (inputs / "1.pdf").write_bytes(label_pdf)
+    (inputs / "2.pdf").write_bytes(b"not a pdf")
+    out = tmp_path / "results.jsonl"
+    argv = [str(inputs), "--out", str(out), "--no-llm", "--workers", "1", "--progress-interval", "60"]
+
+    assert main(argv) == 1
+    first = {record["file"]: record for record in records(out)}
+    assert first[str(inputs / "1.pdf")]["success"] is True
+    assert first[str(inputs / "1.pdf")]["allergens"]["gluten"] is True
+    assert first[str(inputs / "2.pdf")]["success"] is False
+
+    # A new file and a record cut off by the interruption: only those two are (re)done
+    (inputs / "3.pdf").write_bytes(label_pdf)
+    with open(out, "a", encoding="utf-8") as f:
+        f.write('{"file": "' + str(inputs / "3.pdf") + '", "succ')
+    assert main(argv) == 0
+    assert [record["file"] for record in records(out)] == [str(inputs / name) for name in ("1.pdf", "2.pdf", "3.pdf")]
+
+    # --retry-failed redoes the failed file only
+    assert main(argv + ["--retry-failed"]) == 1
+    assert [record["file"] for record in records(out)][3:] == [str(inputs / "2.pdf")]
@@ -0,0 +1,84 @@
+"""Request deadline: stages cut short return the best result so far, marked degraded"""
+import asyncio
+import time
+
+import pytest
+
+from app.api.endpoints import nutrition_extractor
+from app.core.config import settings
+from app.core.deadline import Deadline
+from app.services.pdf_processor import PDFProcessor
+
+
+def test_header_only_shortens_the_request_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "REQUEST_TIMEOUT", 30.0)
+    assert Deadline.for_request(None).timeout == 30.0
+    assert Deadline.for_request("5").timeout == 5.0
+    assert Deadline.for_request("90").timeout == 30.0
+    assert Deadline.for_request("soon").timeout == 30.0
+    monkeypatch.setattr(settings, "REQUEST_TIMEOUT", 0)
+    assert Deadline.for_request(None) is None
+    assert Deadline.for_request("5").timeout == 5.0
+
+
+def test_ocr_stops_before_the_page_that_would_overrun(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(settings, "OCR_PAGE_SECONDS", 1.0)
+    monkeypatch.setattr(settings, "DEADLINE_LLM_MIN_SECONDS", 1.0)
+    processor = PDFProcessor()
+    monkeypatch.setattr(
+        processor, "_iter_page_images", lambda pdf_data, lazy, pages: (3, iter([(1, "p1"), (2, "p2"), (3, "p3")]))
+    )
+    monkeypatch.setattr(processor, "_enhance_image_for_ocr", lambda image: image)
+
+    def ocr(image):
+        clock[0] += 1.0  # every page takes a second
+        return f"Text of {image}", 90.0
+
+    monkeypatch.setattr(processor, "_extract_text_from_image", ocr)
+    deadline = Deadline(3.5)
+    # Page 3 would leave the LLM less than its minimum of 1 s
+    document = processor._ocr_document(b"%PDF-1.4", None, None, deadline)
+    assert [span.page for span in document] == [1, 2]
+    assert deadline.reasons == ["ocr_incomplete"]
+
+
+@pytest.fixture
+def slow_gemini(monkeypatch):
+    calls = []
+
+    async def extract_with_gemini(text, api_key, timeout=None, document=None, usage=None):
+        calls.append(timeout)
+        await asyncio.sleep(30)
+
+    monkeypatch.setattr(nutrition_extractor.extraction_service, "extract_with_gemini", extract_with_gemini)
+    return calls
+
+
+def extract_text(client, label_text, timeout):
+    return client.post(
+        "/api/v1/extract/text",
+        json={"pages": [label_text], "gemini_api_key": "key"},
+        headers={Deadline.HEADER: str(timeout)}
+    ).json()
+
+
+def test_llm_timeout_returns_the_fallback_result_degraded(client, label_text, slow_gemini, monkeypatch):
+    monkeypatch.setattr(settings, "DEADLINE_LLM_MIN_SECONDS", 0.1)
+    started = time.monotonic()
+    body = extract_text(client, label_text, 0.5)
+    assert time.monotonic() - started < 5
+    assert len(slow_gemini) == 1
+    assert body["degraded"] is True
+    assert body["degraded_reasons"] == ["llm_timeout"]
+    assert body["llm_used"] == "regex_fallback"
+    assert body["nutrients"]["protein"].startswith("8,2")
+
+
+def test_llm_is_skipped_without_its_minimum_budget(client, label_text, slow_gemini, monkeypatch):
+    monkeypatch.setattr(settings, "DEADLINE_LLM_MIN_SECONDS", 2.0)
+    body = extract_text(client, label_text, 1)
+    assert slow_gemini == []
+    assert body["degraded_reasons"] == ["llm_skipped"]
+    assert body["nutrients"]["protein"].startswith("8,2")
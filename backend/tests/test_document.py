@@ -0,0 +1,45 @@
+"""Document page spans and offsets"""
+from app.models.document import SOURCE_DIRECT, SOURCE_OCR, Document
+
+
+def test_offsets_and_separators():
+    document = Document.from_texts(["first", "second", "third"])
+    assert document.text == "first\nsecond\nthird"
+    assert [(span.page, span.start, span.end) for span in document] == [(1, 0, 5), (2, 6, 12), (3, 13, 18)]
+    assert [document.page_text(span) for span in document] == ["first", "second", "third"]
+    assert len(document) == len(document.text)
+
+
+def test_empty_pages_keep_a_zero_length_span():
+    document = Document.from_texts(["", "a", "", "b", ""])
+    assert document.text == "a\nb"
+    assert [len(span) for span in document] == [0, 1, 0, 1, 0]
+    assert [span.page for span in document] == [1, 2, 3, 4, 5]
+    assert document.page_text(document.pages[3]) == "b"
+
+
+def test_add_page_after_text_was_read():
+    document = Document.from_texts(["one"])
+    assert document.text == "one"
+    span = document.add_page("two", 2, SOURCE_OCR, 87.5)
+    assert document.text == "one\ntwo"
+    assert document.page_text(span) == "two"
+    assert (span.source, span.confidence) == (SOURCE_OCR, 87.5)
+
+
+def test_select_keeps_document_order():
+    document = Document.from_texts(["p1", "", "p3", "p4"])
+    assert document.select([4, 1, 2]) == "p1\np4"
+    assert document.select([]) == ""
+
+
+def test_map_pages_keeps_page_metadata():
+    document = Document(separator=" | ")
+    document.add_page("Fat 5 g", 1, SOURCE_DIRECT)
+    document.add_page("salt 1 g", 3, SOURCE_OCR, 60.0)
+    mapped = document.map_pages(str.upper)
+    assert mapped.text == "FAT 5 G | SALT 1 G"
+    assert [(span.page, span.source, span.confidence) for span in mapped] == [
+        (1, SOURCE_DIRECT, None), (3, SOURCE_OCR, 60.0)
+    ]
+    assert mapped.page_text(mapped.pages[1]) == "SALT 1 G"
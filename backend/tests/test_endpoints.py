@@ -0,0 +1,82 @@
+"""Response shaping and request validation of the extraction endpoints"""
+import pytest
+from fastapi import HTTPException
+
+from app.api.endpoints import _response_fields, _shape_response
+
+
+@pytest.fixture
+def result():
+    return {
+        "success": True,
+        "allergens": {"gluten": True},
+        "nutrients": {"energy": "1173 kJ"},
+        "llm_used": "regex_fallback",
+        "extracted_text": "Energy: 1173 kJ\nGluten",
+        "pages": [
+            {"page": 1, "source": "direct", "text": "Energy: 1173 kJ"},
+            {"page": 2, "source": "ocr", "text": "Gluten", "confidence": 91.0},
+        ],
+        "processing_time": 0.1,
+    }
+
+
+def test_response_fields():
+    assert _response_fields(None) is None
+    assert _response_fields("") is None
+    assert _response_fields("allergens, nutrients") == {"allergens", "nutrients", "success", "error"}
+    with pytest.raises(HTTPException) as error:
+        _response_fields("allergens,bogus")
+    assert error.value.status_code == 400
+    assert "bogus" in error.value.detail
+
+
+def test_shape_response_all_fields(result):
+    body = _shape_response(result, None, True, 0)
+    assert body["extracted_text"] == result["extracted_text"]
+    assert body["allergens"]["gluten"] is True
+    assert body["allergens"]["milk"] is False
+    assert body["nutrients"]["fat"] == "N/A"
+    assert [page["page"] for page in body["pages"]] == [1, 2]
+    assert body["text_truncated"] is False
+
+
+def test_shape_response_selected_fields(result):
+    body = _shape_response(result, _response_fields("nutrients"), True, 0)
+    assert set(body) == {"success", "error", "nutrients"}
+
+
+def test_shape_response_without_text(result):
+    body = _shape_response(result, None, False, 0)
+    assert body["extracted_text"] is None
+    assert body["pages"][0]["text"] == "Energy: 1173 kJ"
+
+
+def test_shape_response_truncates_copies(result):
+    body = _shape_response(result, None, True, 6)
+    assert body["extracted_text"] == "Energy"
+    assert [page["text"] for page in body["pages"]] == ["Energy", "Gluten"]
+    assert body["text_truncated"] is True
+    # The pipeline result may be cached or shared: it is left alone
+    assert result["extracted_text"] == "Energy: 1173 kJ\nGluten"
+    assert result["pages"][0]["text"] == "Energy: 1173 kJ"
+    assert "text_truncated" not in result
+
+
+def test_extract_text_validation(client):
+    def post(**body):
+        return client.post("/api/v1/extract/text", json={"gemini_api_key": "key", **body})
+
+    assert post(pages=["Fat 5 g"], fields="bogus").status_code == 400
+    assert post(pages=["", "  "]).status_code == 400
+    assert client.post("/api/v1/extract/text", json={"pages": ["Fat 5 g"], "gemini_api_key": ""}).status_code == 400
+
+
+def test_extract_text_size_counts_utf8_bytes(client, monkeypatch):
+    from app.core.config import settings
+
+    # 4 characters, 8 bytes
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", 6)
+    response = client.post("/api/v1/extract/text", json={"pages": ["ÄÖÜß"], "gemini_api_key": "key"})
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Text too large")
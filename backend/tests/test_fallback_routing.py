@@ -0,0 +1,116 @@
+"""Keyword prefilter of the regex fallback: results must match the unfiltered fallback"""
+import json
+import random
+import re
+from pathlib import Path
+
+import pytest
+
+from app.core.config import settings
+from app.services import pattern_keywords
+from app.services.pattern_keywords import fold_case, required_keywords
+from app.services.universal_extraction_service import UniversalExtractionService
+
+TEXTS = [
+    # Mixed languages
+    "Zsír 6,9 g grasas: 5 g el los las 300 kcal 1500 kJ sal: 1 g valor Energy 224 kJ 53 kcal",
+    "so: 2 g sodium: 300 mg és az egy tartalmaz tápérték",
+    "Tápérték 100 g termékben Energia 1173 kJ/282kcal Zsír 6,9 g amelyből telített zsírsavak 2,1 g "
+    "Szénhidrát 45 g amelyből cukrok 12,5 g Fehérje 8,2 g Só 1,2 g 01 + Glutén 07 - tej",
+    "Nutrition per 100 g Energy: 1540 kJ / 368 kcal Fat: 3,4 g Carbohydrate: 8,1 g "
+    "of which sugars: 2,4 g Protein: 3,2 g Salt: 0,12 g 1 + milk 2 - soy",
+    "Valeurs nutritionnelles Énergie: 980 kJ Matières grasses: 12 g Glucides: 30 g Sucres: 4 g "
+    "Protéines: 6 g Sel: 0,8 g",
+    "Información nutricional Valor energético 1200 kJ Grasas: 9 g Hidratos de carbono: 40 g "
+    "Azúcares: 3 g Proteínas: 7 g Sal: 1,1 g",
+    "Energy/Energia 1173 kJ/282kcal Fat/Zsír 6,9 g Protein/Fehérje 8 g Salt/Só 1,1 g",
+    # A dash declares the nutrient absent
+    "Energia 1173 kJ Zsír 6,9 g Só: - ",
+    # Characters re.IGNORECASE matches to i and s
+    "PROTEİN: 5 g ſugar: 3 g 01 + MİLK",
+    "",
+]
+
+# Keywords of every fallback pattern, pinned: regenerate with python -m tests.test_fallback_routing
+KEYWORDS_FILE = Path(__file__).with_name("fallback_keywords.json")
+
+
+def _pattern_keywords() -> dict:
+    return {
+        pattern: sorted(required_keywords(pattern) or ())
+        for patterns in UniversalExtractionService.NUTRIENT_PATTERNS.values()
+        for pattern in patterns
+    }
+
+
+@pytest.fixture
+def service():
+    return UniversalExtractionService()
+
+
+def _fallback(service, text, prefilter, monkeypatch):
+    monkeypatch.setattr(settings, "FALLBACK_KEYWORD_PREFILTER", prefilter)
+    return service.advanced_fallback(text)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_prefilter_matches_unfiltered_fallback(service, monkeypatch, text):
+    assert _fallback(service, text, True, monkeypatch) == _fallback(service, text, False, monkeypatch)
+
+
+def test_prefilter_matches_unfiltered_fallback_on_random_mixes(service, monkeypatch):
+    rng = random.Random(7)
+    words = sorted({keyword for keywords in _pattern_keywords().values() for keyword in keywords})
+    words += sorted({keyword for keywords in UniversalExtractionService.ALLERGEN_KEYWORDS.values() for keyword in keywords})
+    words += ["és", "az", "the", "and", "le", "la", "el", "los", "tápérték", "nutrition", "valeurs"]
+    words += ["kJ", "kcal", "Fat/Zsír", "energy/energia:", "(g)", "[g]", "so", "amelyből cukrok"]
+    for _ in range(300):
+        parts = []
+        for _ in range(rng.randint(3, 30)):
+            parts.append(rng.choice(words) + rng.choice([": ", " ", ":", "/", "\n"]))
+            if rng.random() < 0.5:
+                parts.append(f"{rng.randint(0, 3000)},{rng.randint(0, 9)} {rng.choice(['g', 'mg', 'kJ', 'kcal'])} ")
+        text = "".join(parts)
+        assert _fallback(service, text, True, monkeypatch) == _fallback(service, text, False, monkeypatch), text
+
+
+def test_required_keywords():
+    assert required_keywords(r"sugars?\s*:\s*(\d+)") == {"sugar"}
+    assert required_keywords(r"(?:só|salt|sodium)[:\s]+[-–]") == {"só", "salt", "sodium"}
+    assert required_keywords(r"Fehérje\s*(\d+)") == {"fehérje"}
+    assert required_keywords(r"(\d+)\s*kj(?!\s*/)") == {"kj"}
+    assert required_keywords(r"^\s*(\d+)") is None
+
+
+def test_every_fallback_pattern_needs_a_keyword():
+    for pattern, keywords in _pattern_keywords().items():
+        assert keywords, pattern
+
+
+def test_pattern_keywords_are_pinned():
+    assert _pattern_keywords() == json.loads(KEYWORDS_FILE.read_text(encoding="utf-8"))
+
+
+def test_required_keywords_without_the_regex_parser(monkeypatch):
+    monkeypatch.setattr(pattern_keywords, "_sre_parser", None)
+    assert required_keywords(r"sugars?\s*:\s*(\d+)") is None
+
+
+def test_required_keywords_when_the_regex_parser_changes(monkeypatch):
+    class ChangedParser:
+        @staticmethod
+        def parse(pattern, flags):
+            return [("NEW_OPCODE", None)]
+
+    monkeypatch.setattr(pattern_keywords, "_sre_parser", ChangedParser)
+    assert required_keywords(r"sugars?\s*:\s*(\d+)") is None
+
+
+@pytest.mark.parametrize("text", ["PROTEİN", "proteın", "ſugar", "SZÉNHIDRÁT"])
+def test_fold_case_agrees_with_ignorecase(text):
+    for keyword in ("protein", "sugar", "szénhidrát"):
+        assert (keyword in fold_case(text)) == bool(re.search(keyword, text, re.IGNORECASE))
+
+
+if __name__ == "__main__":
+    KEYWORDS_FILE.write_text(json.dumps(_pattern_keywords(), ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
@@ -0,0 +1,148 @@
+"""LLM reply cache: single flight, LRU/TTL and the shared SQLite tier"""
+import asyncio
+
+import pytest
+
+from app.services.shared_cache import SQLiteCacheStore
+from app.services.universal_extraction_service import LLMResponseCache
+
+REPLY = ({"gluten": True}, {"energy": "100 kJ"})
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_upstream_request():
+    cache = LLMResponseCache(16, 60)
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return REPLY
+
+    results = await asyncio.gather(*(cache.get_or_call("key", call) for _ in range(5)))
+    assert calls == 1
+    assert all(result == REPLY for result in results)
+    assert cache.stats()["coalesced"] == 4
+    assert await cache.get_or_call("key", call) == REPLY
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_callers_get_copies():
+    cache = LLMResponseCache(16, 60)
+
+    async def call():
+        return {"gluten": True}, {"energy": "100 kJ"}
+
+    allergens, _ = await cache.get_or_call("key", call)
+    allergens["gluten"] = False
+    assert (await cache.get_or_call("key", call))[0] == {"gluten": True}
+
+
+@pytest.mark.asyncio
+async def test_failures_are_shared_but_not_cached():
+    cache = LLMResponseCache(16, 60)
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(*(cache.get_or_call("key", failing) for _ in range(3)), return_exceptions=True)
+    assert calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    async def empty():
+        return {}, {}
+
+    await cache.get_or_call("key", empty)
+    assert cache.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_cancelled_owner_hands_over_to_a_waiter():
+    cache = LLMResponseCache(16, 60)
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+        return REPLY
+
+    async def fast():
+        return REPLY
+
+    owner = asyncio.create_task(cache.get_or_call("key", slow))
+    await started.wait()
+    waiter = asyncio.create_task(cache.get_or_call("key", fast))
+    await asyncio.sleep(0)
+    owner.cancel()
+    assert await waiter == REPLY
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("app.services.universal_extraction_service.time.monotonic", lambda: clock[0])
+    cache = LLMResponseCache(2, ttl=10)
+    cache.put("a", REPLY)
+    cache.put("b", REPLY)
+    cache.get("a")
+    cache.put("c", REPLY)
+    assert cache.get("b") is None
+    assert cache.get("a") == REPLY
+    assert cache.evictions == 1
+    clock[0] += 11
+    assert cache.get("a") is None
+
+
+def test_make_key_covers_model_config_and_prompt():
+    key = LLMResponseCache.make_key("m", {"temperature": 0.1}, "prompt")
+    assert key == LLMResponseCache.make_key("m", {"temperature": 0.1}, "prompt")
+    assert key != LLMResponseCache.make_key("m2", {"temperature": 0.1}, "prompt")
+    assert key != LLMResponseCache.make_key("m", {"temperature": 0.2}, "prompt")
+    assert key != LLMResponseCache.make_key("m", {"temperature": 0.1}, "prompt2")
+
+
+@pytest.mark.asyncio
+async def test_workers_share_replies_through_sqlite(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    # Two caches over one file stand for two worker processes
+    first = LLMResponseCache(16, 60, shared_store=SQLiteCacheStore(path))
+    second = LLMResponseCache(16, 60, shared_store=SQLiteCacheStore(path))
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        return REPLY
+
+    assert await first.get_or_call("key", call) == REPLY
+    assert await second.get_or_call("key", call) == REPLY
+    assert calls == 1
+    assert second.stats()["shared_hits"] == 1
+    # The shared hit is kept in the local tier too
+    assert second.get("key") == REPLY
+
+
+def test_sqlite_store_expiry(tmp_path, monkeypatch):
+    store = SQLiteCacheStore(str(tmp_path / "cache.sqlite3"))
+    store.set("key", [{"a": 1}, {}], ttl=60)
+    assert store.get("key") == [{"a": 1}, {}]
+    now = __import__("time").time()
+    monkeypatch.setattr("app.services.shared_cache.time.time", lambda: now + 61)
+    assert store.get("key") is None
+
+
+def test_sqlite_store_evicts_the_oldest_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(SQLiteCacheStore, "PRUNE_EVERY", 5)
+    store = SQLiteCacheStore(str(tmp_path / "cache.sqlite3"), max_rows=3)
+    for number in range(4):
+        store.set(f"key{number}", number, ttl=60)
+    # Rewriting a key makes it the newest
+    store.set("key0", 0, ttl=60)
+    assert [store.get(f"key{number}") for number in range(4)] == [0, None, 2, 3]
+    rows = store._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    assert rows == 3
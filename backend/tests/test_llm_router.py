@@ -0,0 +1,138 @@
+"""Circuit breaker and LLM provider failover/hedging"""
+import asyncio
+import time
+
+import pytest
+
+from app.core.metrics import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, CircuitBreaker, CircuitOpenError
+from app.services.llm_providers import LLMProvider, LLMRouter, ProviderError
+
+
+class FakeProvider(LLMProvider):
+    """Answers after `delay` seconds, or fails, with the bookkeeping of a real provider"""
+
+    def __init__(self, name, delay=0.0, fail=False):
+        super().__init__(f"{name}-model", window=60)
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+
+    async def complete(self, prompt, structured, api_key, timeout, usage):
+        if not self.circuit.allow():
+            raise CircuitOpenError(f"{self.name} circuit open")
+        self.calls += 1
+        started = time.monotonic()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            self._record_failure()
+            raise ProviderError(f"{self.name} API error: 503")
+        self.latency.record(time.monotonic() - started)
+        self._outcomes.append((time.monotonic(), True))
+        self.circuit.record_success()
+        usage["response_tokens"] = 1
+        return f"reply from {self.name}"
+
+
+def router(*providers, hedge=False, hedge_min_seconds=0.05):
+    return LLMRouter(list(providers), hedge, hedge_min_seconds, max_error_rate=0.5)
+
+
+def test_circuit_opens_half_opens_and_closes(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("app.core.metrics.time.monotonic", lambda: clock[0])
+    circuit = CircuitBreaker(failures=2, reset_seconds=30)
+    circuit.record_failure()
+    assert circuit.allow()
+    circuit.record_failure()
+    assert circuit.state == CIRCUIT_OPEN
+    assert not circuit.allow()
+    clock[0] += 30
+    assert circuit.allow()
+    assert circuit.state == CIRCUIT_HALF_OPEN
+    # Only one trial call per reset period
+    assert not circuit.allow()
+    circuit.record_success()
+    assert circuit.state == CIRCUIT_CLOSED
+    assert circuit.stats()["opened"] == 1
+
+
+def test_failed_trial_reopens_the_circuit(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("app.core.metrics.time.monotonic", lambda: clock[0])
+    circuit = CircuitBreaker(failures=3, reset_seconds=10)
+    for _ in range(3):
+        circuit.record_failure()
+    clock[0] += 10
+    assert circuit.allow()
+    circuit.record_failure()
+    assert circuit.state == CIRCUIT_OPEN
+    assert not circuit.allow()
+
+
+def test_disabled_circuit_never_opens():
+    circuit = CircuitBreaker(failures=0, reset_seconds=10)
+    for _ in range(10):
+        circuit.record_failure()
+    assert circuit.allow()
+
+
+@pytest.mark.asyncio
+async def test_failover_to_the_next_provider():
+    primary, secondary = FakeProvider("primary", fail=True), FakeProvider("secondary")
+    llm = router(primary, secondary)
+    usage = {}
+    provider, text = await llm.complete("prompt", True, "key", None, usage)
+    assert provider is secondary
+    assert text == "reply from secondary"
+    assert usage["provider"] == "secondary"
+    assert llm.failovers == 1
+
+
+@pytest.mark.asyncio
+async def test_last_error_is_raised_when_every_provider_fails():
+    llm = router(FakeProvider("primary", fail=True), FakeProvider("secondary", fail=True))
+    with pytest.raises(ProviderError, match="secondary"):
+        await llm.complete("prompt", True, "key", None, {})
+
+
+@pytest.mark.asyncio
+async def test_hedged_call_wins_and_the_slow_one_is_cancelled():
+    slow, fast = FakeProvider("slow", delay=1.0), FakeProvider("fast", delay=0.0)
+    llm = router(slow, fast, hedge=True, hedge_min_seconds=0.02)
+    usage = {}
+    provider, _ = await llm.complete("prompt", True, "key", None, usage)
+    assert provider is fast
+    assert usage["hedged"] is True
+    assert (llm.hedged, llm.hedge_wins) == (1, 1)
+    await asyncio.sleep(0)
+    assert slow.cancelled == 1
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_when_the_first_provider_is_quick():
+    llm = router(FakeProvider("first", delay=0.0), FakeProvider("second"), hedge=True, hedge_min_seconds=0.5)
+    provider, _ = await llm.complete("prompt", True, "key", None, {})
+    assert provider.name == "first"
+    assert llm.hedged == 0
+
+
+@pytest.mark.asyncio
+async def test_ranking_prefers_fast_healthy_providers():
+    slow, fast = FakeProvider("slow", delay=0.03), FakeProvider("fast", delay=0.0)
+    llm = router(slow, fast)
+    # Both unmeasured: configured order
+    assert llm.ranked() == [slow, fast]
+    await slow.complete("prompt", True, "key", None, {})
+    # Unmeasured providers go first so they get measured
+    assert llm.ranked() == [fast, slow]
+    await fast.complete("prompt", True, "key", None, {})
+    assert llm.ranked() == [fast, slow]
+    fast.fail = True
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            await fast.complete("prompt", True, "key", None, {})
+    assert llm.ranked() == [slow, fast]
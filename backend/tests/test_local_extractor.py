@@ -0,0 +1,97 @@
+"""Local extraction model: candidate scoring, confidence gating ahead of Gemini and training"""
+import json
+import sys
+
+import pytest
+
+from app.api.endpoints import nutrition_extractor
+from app.core.config import settings
+from app.models.document import SOURCE_OCR, Document
+from app.services.local_extractor import LinearCandidateExtractor, create_local_extractor
+from app.services.universal_extraction_service import UniversalExtractionService
+
+
+@pytest.fixture
+def clean_label(label_text):
+    return UniversalExtractionService().clean_text(label_text)
+
+
+def test_label_is_read_with_high_confidence(clean_label):
+    result = LinearCandidateExtractor().extract(clean_label)
+    assert result.nutrients == {
+        "energy": "1173 kJ", "fat": "6,9 g", "carbohydrate": "45 g",
+        "sugar": "12,5 g", "protein": "8,2 g", "sodium": "1,2 g"
+    }
+    assert [allergen for allergen, present in result.allergens.items() if present] == ["gluten", "milk"]
+    assert result.confidence == min(result.field_confidence.values())
+    assert result.confidence > 0.85
+
+
+def test_unmarked_mentions_and_missing_values_lower_the_confidence():
+    result = LinearCandidateExtractor().extract("Ingredients: flour, milk powder. Fat: 6,9 g")
+    assert result.allergens["milk"] is False
+    assert result.nutrients["protein"] == "N/A"
+    assert result.field_confidence["milk"] < 0.5
+    assert result.field_confidence["protein"] < 0.5
+    assert result.field_confidence["fat"] > 0.9
+
+
+def test_ocr_pages_mark_their_candidates(clean_label):
+    document = Document()
+    document.add_page("Cover", 1, "direct")
+    document.add_page(clean_label, 2, SOURCE_OCR, 72.0)
+    candidates = LinearCandidateExtractor().nutrient_candidates(document.text, document)
+    fat = candidates["fat"][0]
+    assert fat.features["ocr"] == 1.0
+    assert fat.features["ocr_confidence"] == pytest.approx(0.72)
+
+
+def test_create_local_extractor(tmp_path):
+    assert create_local_extractor("") is None
+    assert create_local_extractor("no-such-model") is None
+    weights = {"nutrient": {"bias": 5.0}, "allergen": {"bias": 5.0}, "missing_nutrient_logit": 5.0}
+    path = tmp_path / "model.json"
+    path.write_text(json.dumps(weights))
+    assert create_local_extractor("linear", str(path)).weights == weights
+
+
+@pytest.fixture
+def gemini_calls(monkeypatch):
+    calls = []
+
+    async def extract_with_gemini(text, api_key, timeout=None, document=None, usage=None):
+        calls.append(text)
+        return {"gluten": True}, {"energy": "1173 kJ", "fat": "6.9 g"}
+
+    monkeypatch.setattr(nutrition_extractor.extraction_service, "extract_with_gemini", extract_with_gemini)
+    monkeypatch.setattr(nutrition_extractor, "local_extractor", LinearCandidateExtractor())
+    return calls
+
+
+@pytest.mark.parametrize("threshold, llm_called, llm_used", [(0.85, False, "local_model"), (0.99, True, "gemini")])
+def test_confident_local_result_skips_gemini(client, label_text, gemini_calls, monkeypatch, threshold, llm_called, llm_used):
+    monkeypatch.setattr(settings, "LOCAL_MODEL_THRESHOLD", threshold)
+    body = client.post("/api/v1/extract/text", json={"pages": [label_text], "gemini_api_key": "key"}).json()
+    assert bool(gemini_calls) is llm_called
+    assert body["llm_used"].startswith(llm_used)
+
+
+def test_training_writes_weights(tmp_path, monkeypatch, label_text, capsys):
+    from tools import train_local_model
+
+    records = [
+        {"text": label_text, "allergens": {"gluten": True, "milk": True},
+         "nutrients": {"energy": "1173 kJ", "fat": "6,9 g", "carbohydrate": "45 g",
+                       "sugar": "12,5 g", "protein": "8,2 g", "sodium": "1,2 g"}},
+        {"pages": ["Cover", "Fat: 3,4 g Protein: 3,2 g"], "allergens": {},
+         "nutrients": {"fat": "3,4 g", "protein": "3,2 g"}},
+    ]
+    data = tmp_path / "labelled.jsonl"
+    data.write_text("\n".join(json.dumps(record) for record in records), encoding="utf-8")
+    out = tmp_path / "model.json"
+    monkeypatch.setattr(sys, "argv", ["train_local_model", str(data), "--out", str(out), "--epochs", "50"])
+    train_local_model.main()
+    assert "2 documents" in capsys.readouterr().out
+    model = LinearCandidateExtractor.load(str(out))
+    assert set(model.weights) == {"nutrient", "allergen", "missing_nutrient_logit"}
+    assert model.extract(label_text).nutrients["fat"] == "6,9 g"
@@ -0,0 +1,73 @@
+"""Request ids on log records, JSON lines and sampled payload logging"""
+import json
+import logging
+
+import pytest
+
+from app.core import logging_config
+from app.core.config import settings
+from app.core.logging_config import JsonFormatter, RequestIdFilter, log_payload, request_id_var
+
+logger = logging.getLogger("tests.logging")
+
+
+class Payload:
+    """Document text stand-in that counts how often it is formatted"""
+
+    formatted = 0
+
+    def __str__(self):
+        Payload.formatted += 1
+        return "Energy: 1173 kJ"
+
+
+@pytest.fixture
+def payload():
+    Payload.formatted = 0
+    return Payload()
+
+
+def test_payload_is_not_logged_or_formatted_by_default(caplog, payload):
+    with caplog.at_level(logging.INFO, logger="tests.logging"):
+        log_payload(logger, "Text: %s", payload)
+    assert caplog.records == []
+    assert Payload.formatted == 0
+
+
+def test_payload_is_logged_for_the_sampled_fraction(caplog, monkeypatch, payload):
+    monkeypatch.setattr(settings, "LOG_PAYLOAD_SAMPLE_RATE", 0.25)
+    draws = iter([0.1, 0.9, 0.2, 0.3])
+    monkeypatch.setattr(logging_config.random, "random", lambda: next(draws))
+    with caplog.at_level(logging.INFO, logger="tests.logging"):
+        for _ in range(4):
+            log_payload(logger, "Text: %s", payload)
+    assert [record.getMessage() for record in caplog.records] == ["Text: Energy: 1173 kJ"] * 2
+
+
+def test_payload_is_skipped_below_info(caplog, monkeypatch, payload):
+    monkeypatch.setattr(settings, "LOG_PAYLOAD_SAMPLE_RATE", 1.0)
+    with caplog.at_level(logging.WARNING, logger="tests.logging"):
+        log_payload(logger, "Text: %s", payload)
+    assert caplog.records == []
+    assert Payload.formatted == 0
+
+
+def test_json_lines_carry_the_request_id():
+    record = logging.LogRecord("app.test", logging.INFO, __file__, 1, "Page %s of %s\nnext", (1, 2), None)
+    token = request_id_var.set("abc-123")
+    try:
+        RequestIdFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+    line = JsonFormatter().format(record)
+    assert "\n" not in line
+    payload = json.loads(line)
+    assert payload["message"] == "Page 1 of 2\nnext"
+    assert payload["request_id"] == "abc-123"
+    assert payload["level"] == "INFO"
+
+
+def test_request_id_is_echoed_or_replaced(client):
+    assert client.get("/health", headers={"X-Request-ID": "req-42"}).headers["x-request-id"] == "req-42"
+    generated = client.get("/health", headers={"X-Request-ID": "bad id"}).headers["x-request-id"]
+    assert generated != "bad id" and len(generated) == 32
@@ -0,0 +1,104 @@
+"""OCR backends: selection, per-thread tesserocr engines and warm-up in every OCR thread"""
+import threading
+import types
+
+from app.core.config import settings
+from app.services.ocr_backends import OCRBackend, PytesseractBackend, TesserocrBackend, create_ocr_backend
+from app.services.pdf_processor import PDFProcessor
+
+
+class RecordingBackend(OCRBackend):
+    """Answers from a table of language -> text and records the threads it ran in"""
+
+    name = "recording"
+    per_thread = True
+
+    def __init__(self, answers=None):
+        super().__init__()
+        self.answers = answers or {}
+        self.calls = []
+        self.threads = set()
+
+    def image_to_string(self, image, lang=None):
+        self.calls.append(lang)
+        self.threads.add(threading.get_ident())
+        return self.answers.get(lang, "")
+
+
+def fake_tesserocr(created):
+    class PyTessBaseAPI:
+        def __init__(self, lang, psm, oem):
+            self.lang = lang
+            created.append((lang, threading.get_ident()))
+
+        def SetVariable(self, name, value):
+            pass
+
+        def SetImage(self, image):
+            pass
+
+        def GetUTF8Text(self):
+            return f"text in {self.lang}"
+
+        def MeanTextConf(self):
+            return 87
+
+        def Clear(self):
+            pass
+
+    return types.SimpleNamespace(PyTessBaseAPI=PyTessBaseAPI)
+
+
+def test_unknown_or_missing_backend_falls_back_to_pytesseract(monkeypatch):
+    import sys
+
+    assert isinstance(create_ocr_backend("no-such-engine"), PytesseractBackend)
+    monkeypatch.setitem(sys.modules, "tesserocr", None)  # import fails as if not installed
+    assert isinstance(create_ocr_backend("tesserocr"), PytesseractBackend)
+
+
+def test_tesserocr_keeps_one_engine_per_thread_and_language(monkeypatch):
+    import sys
+
+    created = []
+    monkeypatch.setitem(sys.modules, "tesserocr", fake_tesserocr(created))
+    backend = create_ocr_backend("tesserocr")
+    assert isinstance(backend, TesserocrBackend)
+
+    assert backend.recognize("image", lang="hun") == ("text in hun", 87.0)
+    backend.image_to_string("image", lang="hun")
+    backend.image_to_string("image")
+    assert [lang for lang, _ in created] == ["hun", "eng"]
+
+    other = threading.Thread(target=backend.image_to_string, args=("image", "hun"))
+    other.start()
+    other.join()
+    assert len(created) == 3
+    assert created[2][1] != created[0][1]
+
+
+def test_warm_up_runs_in_every_ocr_thread(monkeypatch):
+    monkeypatch.setattr(settings, "OCR_THREADS", 3)
+    monkeypatch.setattr(settings, "OCR_LANGUAGES", ["hun", "eng"])
+    processor = PDFProcessor()
+    backend = processor.ocr_backend = RecordingBackend()
+    try:
+        timings = processor.warm_up()
+    finally:
+        processor.ocr_executor.shutdown()
+    assert set(timings) == {"imports", "tesseract"}
+    assert len(backend.threads) == 3
+    assert sorted(backend.calls) == ["eng"] * 3 + ["hun"] * 3
+
+
+def test_languages_are_tried_in_order(monkeypatch):
+    monkeypatch.setattr(settings, "OCR_LANGUAGES", ["hun+eng", "hun", "eng"])
+    processor = PDFProcessor()
+    processor.ocr_backend = RecordingBackend({"hun": "Energia 1173 kJ Zsír 6,9 g"})
+    assert processor._extract_text_from_image("image") == ("Energia 1173 kJ Zsír 6,9 g", None)
+    assert processor.ocr_backend.calls == ["hun+eng", "hun"]
+
+    # Nothing usable in any language: one last try with the engine default
+    processor.ocr_backend = RecordingBackend({None: "kJ"})
+    assert processor._extract_text_from_image("image") == ("kJ", None)
+    assert processor.ocr_backend.calls == ["hun+eng", "hun", "eng", None]
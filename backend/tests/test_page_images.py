@@ -0,0 +1,105 @@
+"""Scanned pages OCR'd from their embedded image: which pages qualify and how they decode"""
+import io
+import zlib
+
+import pytest
+
+from app.services.page_images import decode_scan_image, page_scan_image
+
+PAGE = (595, 842)  # A4 in points
+
+
+def scan_pdf(data: bytes, image_dict: str, size=PAGE, rotate=0, content=None) -> bytes:
+    """One page drawing one image XObject over size (points); image_dict goes into its dictionary"""
+    width, height = size
+    content = content or f"q {width} 0 0 {height} 0 0 cm /Im0 Do Q".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE[0]} {PAGE[1]}] /Rotate {rotate} "
+        f"/Resources << /XObject << /Im0 5 0 R >> >> /Contents 4 0 R >>".encode(),
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        f"<< /Type /XObject /Subtype /Image {image_dict} /Length {len(data)} >>\nstream\n".encode()
+        + data + b"\nendstream",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return out
+
+
+def first_page(pdf: bytes):
+    import PyPDF2
+
+    return PyPDF2.PdfReader(io.BytesIO(pdf)).pages[0]
+
+
+def gray_samples(width=4, height=2):
+    return bytes(range(0, 256, 256 // (width * height)))[:width * height]
+
+
+def flate_gray_pdf(**kwargs):
+    samples = gray_samples()
+    image_dict = "/Width 4 /Height 2 /ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode"
+    return scan_pdf(zlib.compress(samples), image_dict, **kwargs), samples
+
+
+def jpeg(size, mode="RGB"):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new(mode, size, "white" if mode != "CMYK" else (0, 0, 0, 0)).save(buffer, "JPEG", quality=50)
+    return buffer.getvalue()
+
+
+def test_flate_gray_scan_decodes_to_its_samples():
+    pdf, samples = flate_gray_pdf()
+    page = first_page(pdf)
+    xobject = page_scan_image(page)
+    assert xobject is not None
+    image = decode_scan_image(page, xobject)
+    assert (image.mode, image.size) == ("L", (4, 2))
+    assert image.tobytes() == samples
+
+
+def test_large_jpeg_is_decoded_gray_at_reduced_scale():
+    # 200 dpi scan of an A4 page, wanted at 100 dpi
+    data = jpeg((1654, 2339))
+    page = first_page(scan_pdf(data, "/Width 1654 /Height 2339 /ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode"))
+    image = decode_scan_image(page, page_scan_image(page), dpi=100)
+    assert image.mode == "L"
+    # DCT scaling halves the size, never going below the requested resolution
+    assert image.size == (827, 1170)
+
+
+def test_rotated_page_is_turned_upright():
+    pdf, _ = flate_gray_pdf(rotate=90)
+    page = first_page(pdf)
+    assert decode_scan_image(page, page_scan_image(page)).size == (2, 4)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"size": (595, 421)},  # covers half the page
+    {"content": b"q 595 0 0 842 0 0 cm /Im0 Do Q BT /F1 10 Tf (Header) Tj ET"},  # text drawn as well
+    {"content": b"q 0 842 -595 0 595 0 cm /Im0 Do Q"},  # placed rotated
+])
+def test_pages_that_are_not_a_plain_scan_are_rendered(kwargs):
+    pdf, _ = flate_gray_pdf(**kwargs)
+    assert page_scan_image(first_page(pdf)) is None
+
+
+@pytest.mark.parametrize("image_dict", [
+    "/Width 4 /Height 2 /ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Decode [1 0]",
+    "/Width 4 /Height 2 /ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /LZWDecode",
+    "/Width 4 /Height 2 /ColorSpace /DeviceCMYK /BitsPerComponent 8 /Filter /DCTDecode",
+    "/Width 4 /Height 2 /ColorSpace /DeviceGray /BitsPerComponent 4 /Filter /FlateDecode",
+])
+def test_images_that_decode_differently_from_their_samples_are_rendered(image_dict):
+    data = jpeg((4, 2), "CMYK") if "DCT" in image_dict else zlib.compress(gray_samples())
+    assert page_scan_image(first_page(scan_pdf(data, image_dict))) is None
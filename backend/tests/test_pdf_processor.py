@@ -0,0 +1,114 @@
+"""PDF processor routing around OCR (OCR itself needs poppler and tesseract)"""
+import pytest
+
+from app.models.document import Document
+from app.services.admission import AdmissionController, AdmissionRejected
+from app.services.pdf_processor import PDFProcessor
+from app.services.triage import triage_pdf
+
+UNREADABLE_PDF = b"%PDF-1.4\ngarbage without objects"
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    processor = PDFProcessor()
+    ocr_calls = []
+
+    async def fake_ocr(pdf_data, on_progress=None, deadline=None, pages=None, triage=None):
+        ocr_calls.append((pages, triage.pages))
+        return Document()
+
+    monkeypatch.setattr(processor, "_extract_text_with_ocr", fake_ocr)
+    processor.ocr_calls = ocr_calls
+    return processor
+
+
+def poppler_pages(monkeypatch, pages):
+    import pdf2image
+
+    def pdfinfo(pdf_data):
+        if pages is None:
+            raise pdf2image.exceptions.PDFPageCountError("Unable to get page count")
+        return {"Pages": pages}
+
+    monkeypatch.setattr(pdf2image, "pdfinfo_from_bytes", pdfinfo)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("pages, charged", [(3, 3), (40, 16), (None, 16)])
+async def test_unreadable_structure_is_charged_its_real_pages(processor, monkeypatch, pages, charged):
+    poppler_pages(monkeypatch, pages)
+    controller = AdmissionController(max_ocr_pages=16)
+    triage = triage_pdf(UNREADABLE_PDF)
+    assert not triage.pages_known
+    ticket = controller.try_admit("a", triage)
+    assert controller.ocr_pages_in_flight == 1
+    await processor.extract_document(UNREADABLE_PDF, triage=triage, reserve_ocr=ticket.reserve_ocr)
+    assert controller.ocr_pages_in_flight == charged
+    # The OCR job is scheduled by the real size
+    assert processor.ocr_calls == [(None, pages or 1)]
+    ticket.release()
+
+
+@pytest.mark.asyncio
+async def test_unreadable_structure_over_the_budget_is_refused(processor, monkeypatch):
+    poppler_pages(monkeypatch, 40)
+    controller = AdmissionController(max_ocr_pages=16)
+    busy = controller.try_admit("a", triage_pdf(UNREADABLE_PDF))
+    triage = triage_pdf(UNREADABLE_PDF)
+    ticket = controller.try_admit("b", triage)
+    with pytest.raises(AdmissionRejected):
+        await processor.extract_document(UNREADABLE_PDF, triage=triage, reserve_ocr=ticket.reserve_ocr)
+    assert processor.ocr_calls == []
+    busy.release()
+    ticket.release()
+
+
+@pytest.mark.asyncio
+async def test_unreadable_structure_over_the_page_limit_is_rejected(processor, monkeypatch):
+    from app.core.config import settings
+    from app.services.triage import UnprocessableDocumentError
+
+    poppler_pages(monkeypatch, 40)
+    monkeypatch.setattr(settings, "TRIAGE_MAX_PAGES", 30)
+    with pytest.raises(UnprocessableDocumentError, match="more than 30 pages"):
+        await processor.extract_document(UNREADABLE_PDF)
+
+
+def test_pages_are_rendered_and_decoded_at_ocr_dpi(monkeypatch, make_pdf, label_text):
+    import pdf2image
+
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "OCR_DPI", 150)
+    monkeypatch.setattr(settings, "OCR_EMBEDDED_IMAGES", True)
+    rendered, decoded = [], []
+    monkeypatch.setattr(pdf2image, "pdfinfo_from_bytes", lambda pdf_data: {"Pages": 2})
+    monkeypatch.setattr(
+        pdf2image, "convert_from_bytes", lambda pdf_data, **options: rendered.append(options["dpi"]) or ["page"]
+    )
+    monkeypatch.setattr(
+        "app.services.pdf_processor.decode_scan_image", lambda page, xobject, dpi: decoded.append(dpi) or "scan"
+    )
+    processor = PDFProcessor()
+    page_count, images = processor._iter_page_images(make_pdf([{"image": 1.0}, {"text": label_text}]), True)
+    assert page_count == 2
+    assert list(images) == [(1, "scan"), (2, "page")]
+    assert (decoded, rendered) == ([150], [150])
+
+
+@pytest.mark.asyncio
+async def test_ocr_time_is_recorded_on_the_triage(monkeypatch):
+    import time
+
+    processor = PDFProcessor()
+
+    def ocr_document(pdf_data, pages, on_progress, deadline):
+        time.sleep(0.05)
+        return Document.from_texts(["Energia 1173 kJ", "Zsír 6,9 g"], "ocr")
+
+    monkeypatch.setattr(processor, "_ocr_document", ocr_document)
+    triage = triage_pdf(UNREADABLE_PDF)
+    await processor._extract_text_with_ocr(UNREADABLE_PDF, triage=triage)
+    assert triage.ocr_pages_done == 2
+    assert 0.05 <= triage.ocr_seconds < 1.0
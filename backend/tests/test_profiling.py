@@ -0,0 +1,84 @@
+"""Request profiling: executor threads and worker processes end up in one profile"""
+import asyncio
+import multiprocessing
+import pstats
+
+import pytest
+
+from app.api.endpoints import nutrition_extractor
+from app.core import profiling
+from app.core.config import settings
+from app.core.profiling import RequestProfile, profiled, run_with_stats
+
+TOKEN = "profile-secret"
+
+
+def parse_label(text: str) -> int:
+    """Stand-in for work done in a sandbox worker process"""
+    return sum(ord(character) for character in text)
+
+
+def _functions(stats: pstats.Stats):
+    return {name for _, _, name in stats.stats}
+
+
+def test_worker_process_stats_are_merged():
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        result, stats = pool.apply(run_with_stats, (parse_label, "Energy"))
+    assert result == parse_label("Energy")
+    profile = RequestProfile("test.prof")
+    # As in profile_request, the loop thread's profiler ran for the request
+    profile.loop_profile.enable()
+    profile.add_stats(stats)
+    profile.loop_profile.disable()
+    assert "parse_label" in _functions(profile.merged())
+    # Merging again (e.g. the saved file after a summary) still sees the worker's calls
+    assert "parse_label" in _functions(profile.merged())
+
+
+def test_profiled_is_a_no_op_without_a_profile():
+    assert profiled(parse_label) is parse_label
+
+
+@pytest.mark.asyncio
+async def test_executor_calls_join_the_request_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_DIR", str(tmp_path))
+    loop = asyncio.get_running_loop()
+    async with profiling.profile_request(True, "req-1") as profile:
+        assert await loop.run_in_executor(None, profiled(parse_label), "Fat") == parse_label("Fat")
+        # One profiled request per worker at a time
+        async with profiling.profile_request(True, "req-2") as other:
+            assert other is None
+    assert "parse_label" in _functions(pstats.Stats(str(tmp_path / profile.name)))
+
+
+@pytest.fixture
+def profiling_on(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "PROFILING_ADMIN_TOKEN", TOKEN)
+    monkeypatch.setattr(settings, "PROFILING_DIR", str(tmp_path))
+
+    async def extract_with_gemini(text, api_key, timeout=None, document=None, usage=None):
+        return {}, {}
+
+    monkeypatch.setattr(nutrition_extractor.extraction_service, "extract_with_gemini", extract_with_gemini)
+
+
+def test_profiled_request_can_be_downloaded(client, label_text, profiling_on):
+    response = client.post(
+        "/api/v1/extract/text",
+        json={"pages": [label_text], "gemini_api_key": "key"},
+        headers={profiling.HEADER: TOKEN}
+    )
+    name = response.headers["X-Profile-Id"]
+    headers = {profiling.HEADER: TOKEN}
+    assert client.get("/api/v1/profiles", headers=headers).json() == [name]
+    summary = client.get(f"/api/v1/profiles/{name}", params={"format": "text"}, headers=headers).text
+    assert "advanced_fallback" in summary
+
+
+def test_profiles_need_the_admin_token(client, label_text, profiling_on):
+    response = client.post("/api/v1/extract/text", json={"pages": [label_text], "gemini_api_key": "key"})
+    assert "X-Profile-Id" not in response.headers
+    assert client.get("/api/v1/profiles", headers={profiling.HEADER: "guess"}).status_code == 403
+    assert client.get("/api/v1/profiles/../../etc/passwd", headers={profiling.HEADER: TOKEN}).status_code == 404
@@ -0,0 +1,59 @@
+"""Prompt builder: template slot, input budget and what is kept when text is cut"""
+import pytest
+
+from app.core.config import settings
+from app.models.document import Document
+from app.services.prompt_builder import CHARS_PER_TOKEN, PromptBuilder, estimate_tokens
+
+FILLER = "Lorem ipsum dolor sit amet consectetur. " * 5
+LABEL = "Energia 1173 kJ Zsír 6,9 g Szénhidrát 45 g Fehérje 8,2 g Só 1,2 g"
+
+
+def test_template_needs_one_text_slot():
+    with pytest.raises(ValueError):
+        PromptBuilder("no slot")
+    with pytest.raises(ValueError):
+        PromptBuilder("{text} and {text}")
+
+
+def test_short_text_is_sent_whole():
+    builder = PromptBuilder("Extract: {text}\nJSON only", max_input_tokens=100)
+    built = builder.build(LABEL)
+    assert built.prompt == f"Extract: {LABEL}\nJSON only"
+    assert built.truncated is False
+    assert built.input_chars == len(LABEL)
+    assert built.estimated_tokens == estimate_tokens("Extract: ") + estimate_tokens("\nJSON only") + estimate_tokens(LABEL)
+
+
+def test_long_document_keeps_its_most_relevant_pages_in_order():
+    document = Document.from_texts([FILLER, "Allergének: glutén, tej", FILLER, LABEL])
+    budget_tokens = 30
+    builder = PromptBuilder("{text}", max_input_tokens=budget_tokens)
+    text, truncated = builder.fit(document.text, document)
+    assert truncated
+    assert text == "Allergének: glutén, tej\n" + LABEL
+    assert len(text) <= budget_tokens * CHARS_PER_TOKEN
+
+
+def test_long_single_page_keeps_the_window_with_the_label():
+    text = FILLER * 4 + LABEL + FILLER * 4
+    builder = PromptBuilder("{text}", max_input_tokens=25)
+    window, truncated = builder.fit(text)
+    assert truncated
+    assert len(window) == 100
+    assert "Zsír 6,9 g" in window
+
+
+def test_relevant_text_skips_pages_without_terms():
+    document = Document.from_texts([FILLER, LABEL, "", FILLER])
+    assert PromptBuilder().relevant_text(document) == LABEL
+
+
+def test_template_from_file(tmp_path, monkeypatch):
+    path = tmp_path / "prompt.txt"
+    path.write_text("Címke:\n{text}\nVálasz JSON-ban.", encoding="utf-8")
+    monkeypatch.setattr(settings, "PROMPT_TEMPLATE_PATH", str(path))
+    monkeypatch.setattr(settings, "GEMINI_MAX_INPUT_TOKENS", 50)
+    builder = PromptBuilder.from_settings()
+    assert builder.max_input_tokens == 50
+    assert builder.build("Fat 5 g").prompt == "Címke:\nFat 5 g\nVálasz JSON-ban."
@@ -0,0 +1,91 @@
+"""Readiness: 503 with reasons while over capacity; request metrics and /health stats"""
+import pytest
+
+from app.api.endpoints import admission, nutrition_extractor
+from app.core import metrics
+from app.core.config import settings
+from app.core.metrics import CIRCUIT_OPEN, LatencyWindow, RequestMetrics
+from app.services.triage import ROUTE_OCR, Triage
+
+
+@pytest.fixture
+def request_metrics(monkeypatch):
+    """Fresh counters for /ready, so requests of other tests do not count"""
+    fresh = RequestMetrics(60)
+    monkeypatch.setattr("app.main.request_metrics", fresh)
+    return fresh
+
+
+def test_idle_worker_is_ready(client, request_metrics):
+    response = client.get("/ready")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["ready"] is True and body["reasons"] == []
+    assert body["ocr_pool"]["slots"] == nutrition_extractor.pdf_processor.ocr_threads
+    assert body["requests"]["latency_p95"] is None
+
+
+def test_full_ocr_budget_is_not_ready(client, request_metrics):
+    pages = admission.max_ocr_pages
+    ticket = admission.try_admit("ready-test", Triage(ROUTE_OCR, pages, list(range(1, pages + 1))))
+    try:
+        response = client.get("/ready")
+    finally:
+        ticket.release()
+    assert response.status_code == 503
+    assert response.json()["reasons"] == ["ocr_budget"]
+    assert response.json()["ocr_budget_used"] == 1.0
+    assert client.get("/ready").status_code == 200
+
+
+def test_in_flight_and_latency_limits(client, request_metrics, monkeypatch):
+    monkeypatch.setattr(settings, "READINESS_MAX_IN_FLIGHT", 2)
+    monkeypatch.setattr(settings, "READINESS_MAX_P95_SECONDS", 5.0)
+    request_metrics.in_flight = 3
+    for seconds in [0.5] * 18 + [9.0, 9.0]:
+        request_metrics.latency.record(seconds)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    body = response.json()
+    assert body["reasons"] == ["in_flight", "latency"]
+    assert body["requests"]["latency_p50"] == 0.5
+    assert body["requests"]["latency_p95"] == 9.0
+
+
+def test_open_llm_circuit_is_reported_but_ready(client, request_metrics, monkeypatch):
+    provider = nutrition_extractor.extraction_service.llm_router.providers[0]
+    monkeypatch.setattr(provider.circuit, "state", CIRCUIT_OPEN)
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["llm_circuits"][provider.name] == CIRCUIT_OPEN
+
+
+def test_latency_window_forgets_old_requests(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(metrics.time, "monotonic", lambda: now[0])
+    window = LatencyWindow(60)
+    window.record(8.0)
+    now[0] = 130.0
+    window.record(1.0)
+    assert window.percentile(0.95) == 8.0
+    now[0] = 170.0
+    assert window.percentile(0.95) == 1.0
+    now[0] = 200.0
+    assert window.percentile(0.95) is None
+
+
+def test_extraction_requests_are_counted(client, label_text):
+    completed = metrics.request_metrics.completed
+    client.post("/api/v1/extract/text", json={"pages": [label_text], "gemini_api_key": ""})
+    client.get("/health")
+    assert metrics.request_metrics.completed == completed + 1
+    assert metrics.request_metrics.in_flight == 0
+
+
+def test_health_reports_the_pipeline_stats(client):
+    body = client.get("/health").json()
+    assert body["status"] == "healthy"
+    for key in ("llm_cache", "page_cache", "admission", "llm_router", "triage_routes", "scheduler"):
+        assert key in body, key
+    assert set(body["scheduler"]) == {"ocr", "text"}
+    assert body["admission"]["max_ocr_pages"] == admission.max_ocr_pages
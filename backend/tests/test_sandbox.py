@@ -0,0 +1,104 @@
+"""Sandboxed PDF processing: resource limits end in 422, not in a quiet fallback"""
+import asyncio
+import time
+import zlib
+
+import pytest
+
+from app.services.pdf_processor import _isolated_direct_text
+from app.services.sandbox import ParseSandbox, SandboxLimitError
+from app.services.triage import triage_pdf
+
+MEMORY_MB = 400
+
+
+def flate_bomb_pdf(megabytes: int) -> bytes:
+    """One-page PDF whose content stream inflates to `megabytes` MB of zeros"""
+    compressor = zlib.compressobj(9)
+    chunk = b"\0" * (1 << 20)
+    stream = b"".join(compressor.compress(chunk) for _ in range(megabytes)) + compressor.flush()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << >> /Contents 4 0 R >>",
+        b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return out
+
+
+@pytest.fixture(scope="module")
+def bomb():
+    return flate_bomb_pdf(1024)
+
+
+@pytest.fixture
+def sandbox():
+    sandbox = ParseSandbox(1, 10, timeout=60, cpu_seconds=0, memory_mb=MEMORY_MB)
+    yield sandbox
+    sandbox.close()
+
+
+@pytest.mark.asyncio
+async def test_memory_limit_in_triage(sandbox, bomb):
+    with pytest.raises(SandboxLimitError, match="memory limit exceeded"):
+        await sandbox.run(triage_pdf, bomb)
+    assert sandbox.stats()["killed"] == {"memory limit exceeded": 1}
+
+
+@pytest.mark.asyncio
+async def test_memory_limit_in_direct_text(sandbox, bomb):
+    with pytest.raises(SandboxLimitError, match="memory limit exceeded"):
+        await sandbox.run(_isolated_direct_text, bomb)
+
+
+@pytest.mark.asyncio
+async def test_worker_is_replaced_after_a_kill(sandbox, bomb, label_pdf):
+    with pytest.raises(SandboxLimitError):
+        await sandbox.run(triage_pdf, bomb)
+    assert (await sandbox.run(triage_pdf, label_pdf)).route == "text"
+    assert sandbox.stats()["started"] == 2
+
+
+@pytest.mark.asyncio
+async def test_timeout_kill_does_not_block_the_event_loop(sandbox):
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.02)
+
+    ticking = asyncio.create_task(ticker())
+    try:
+        with pytest.raises(SandboxLimitError, match="processing time limit exceeded"):
+            await sandbox.run(time.sleep, 30, timeout=1.0)
+    finally:
+        ticking.cancel()
+    gaps = [later - earlier for earlier, later in zip(ticks, ticks[1:])]
+    assert max(gaps) < 0.5
+
+
+def test_memory_limit_is_a_422(client, bomb, monkeypatch):
+    from app.api.endpoints import nutrition_extractor
+
+    sandbox = ParseSandbox(1, 10, timeout=60, cpu_seconds=0, memory_mb=MEMORY_MB)
+    monkeypatch.setattr(nutrition_extractor.pdf_processor, "sandbox", sandbox)
+    try:
+        response = client.post(
+            "/api/v1/extract",
+            files={"file": ("bomb.pdf", bomb, "application/pdf")},
+            data={"gemini_api_key": "key"}
+        )
+    finally:
+        sandbox.close()
+    assert response.status_code == 422
+    assert "memory limit exceeded" in response.json()["detail"]
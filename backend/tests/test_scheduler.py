@@ -0,0 +1,110 @@
+"""Shortest-job-first scheduling with aging"""
+import asyncio
+
+import pytest
+
+from app.services.scheduler import CostScheduler
+
+
+async def _run_jobs(scheduler, jobs, order, hold=0.01):
+    """Start a blocker, queue jobs (name, cost) in order, return the order they started in"""
+    release = asyncio.Event()
+
+    async def blocker():
+        async with scheduler.slot(0, "blocker"):
+            await release.wait()
+
+    async def job(name, cost):
+        async with scheduler.slot(cost, "job"):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    blocking = asyncio.create_task(blocker())
+    await asyncio.sleep(0)
+    tasks = []
+    for name, cost in jobs:
+        tasks.append(asyncio.create_task(job(name, cost)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(blocking, *tasks)
+
+
+@pytest.mark.asyncio
+async def test_cheapest_job_starts_first():
+    scheduler = CostScheduler(1, aging=0.0)
+    order = []
+    await _run_jobs(scheduler, [("scan", 30.0), ("text", 0.02), ("small scan", 3.0)], order)
+    assert order == ["text", "small scan", "scan"]
+    assert scheduler.running == 0
+    assert scheduler.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_aging_lets_a_long_waiting_job_go_first(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("app.services.scheduler.time.monotonic", lambda: clock[0])
+    scheduler = CostScheduler(1, aging=1.0)
+    order = []
+
+    release = asyncio.Event()
+
+    async def blocker():
+        async with scheduler.slot(0, "blocker"):
+            await release.wait()
+
+    async def job(name, cost):
+        async with scheduler.slot(cost, "job"):
+            order.append(name)
+
+    blocking = asyncio.create_task(blocker())
+    await asyncio.sleep(0)
+    scan = asyncio.create_task(job("scan", 10.0))
+    await asyncio.sleep(0)
+    # 15 s later a cheaper job arrives: the scan has earned 15 s of credit
+    clock[0] += 15
+    text = asyncio.create_task(job("text", 1.0))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(blocking, scan, text)
+    assert order == ["scan", "text"]
+
+
+@pytest.mark.asyncio
+async def test_slots_run_concurrently():
+    scheduler = CostScheduler(2)
+    running = []
+    peak = []
+
+    async def job():
+        async with scheduler.slot(1.0, "job"):
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+    await asyncio.gather(*(job() for _ in range(5)))
+    assert max(peak) == 2
+    assert scheduler.stats()["classes"]["job"]["started"] == 5
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_its_slot():
+    scheduler = CostScheduler(1)
+    release = asyncio.Event()
+
+    async def holder():
+        async with scheduler.slot(0, "a"):
+            await release.wait()
+
+    holding = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    waiting.cancel()
+    release.set()
+    await holding
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    assert scheduler.running == 0
+    async with scheduler.slot(0, "a"):
+        assert scheduler.running == 1
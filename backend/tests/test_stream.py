@@ -0,0 +1,78 @@
+"""Streaming extraction: per-stage events in SSE and NDJSON"""
+import json
+
+import pytest
+
+from app.api.endpoints import nutrition_extractor
+from app.services.triage import UnprocessableDocumentError
+
+LLM_NUTRIENTS = {
+    "energy": "1173 kJ", "fat": "6.9 g", "carbohydrate": "45 g", "sugar": "12.5 g", "protein": "8.2 g", "sodium": "1.2 g"
+}
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Gemini answers with the label's values, without a network call"""
+    async def extract_with_gemini(text, api_key, timeout=None, document=None, usage=None):
+        return {"gluten": True, "milk": True}, dict(LLM_NUTRIENTS)
+
+    monkeypatch.setattr(nutrition_extractor.extraction_service, "extract_with_gemini", extract_with_gemini)
+
+
+def sse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def stream(client, pdf, **form):
+    return client.post(
+        "/api/v1/extract/stream",
+        files={"file": ("label.pdf", pdf, "application/pdf")},
+        data={"gemini_api_key": "key", **form}
+    )
+
+
+def test_sse_events_follow_the_stages(client, label_pdf, gemini):
+    response = stream(client, label_pdf)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(response.text)
+    assert [event for event, _ in events] == ["triage", "direct_text", "fallback", "llm", "result"]
+
+    data = dict(events)
+    assert data["triage"]["route"] == "text"
+    assert data["direct_text"]["needs_ocr"] is False
+    # The regex result arrives before the LLM's
+    assert data["fallback"]["nutrients"]["fat"].startswith("6,9")
+    assert data["llm"]["accepted"] is True
+    assert data["result"]["nutrients"]["energy"] == "1173 kJ"
+    assert data["result"]["allergens"]["milk"] is True
+
+
+def test_ndjson_result_is_shaped_like_extract(client, label_pdf, gemini):
+    response = stream(client, label_pdf, format="ndjson", fields="nutrients")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1]["event"] == "result"
+    assert set(lines[-1]["data"]) == {"success", "error", "nutrients"}
+
+
+def test_unprocessable_document_mid_stream_is_an_error_event(client, label_pdf, monkeypatch):
+    async def extract_document(*args, **kwargs):
+        raise UnprocessableDocumentError("memory limit exceeded")
+
+    monkeypatch.setattr(nutrition_extractor.pdf_processor, "extract_document", extract_document)
+    events = sse_events(stream(client, label_pdf).text)
+    assert events == [("error", {"status_code": 422, "detail": "Unprocessable PDF: memory limit exceeded"})]
+
+
+def test_stream_rejects_before_streaming(client, label_pdf):
+    assert stream(client, label_pdf, format="xml").status_code == 400
+    # Triage runs before the stream starts, so a document it rejects still gets a plain 422
+    response = stream(client, b"not a pdf")
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Unprocessable PDF: not a PDF file"
@@ -0,0 +1,53 @@
+"""Structured Gemini output: schema from the response models, replies validated into them"""
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from app.models.schemas import AllergenData, NutritionData
+from app.services.structured_output import extraction_generation_config, parse_extraction_result, response_schema
+from app.services.universal_extraction_service import UniversalExtractionService
+
+NUTRIENTS = {
+    "energy": "1173 kJ", "fat": "6,9 g", "carbohydrate": "45 g", "sugar": "12,5 g", "protein": "8,2 g", "sodium": "N/A"
+}
+REPLY = json.dumps({"allergens": {**AllergenData().model_dump(), "gluten": True}, "nutrients": NUTRIENTS})
+
+
+def test_schema_requires_every_field_in_model_order():
+    schema = extraction_generation_config()["responseSchema"]
+    assert schema["required"] == ["allergens", "nutrients"]
+    allergens = schema["properties"]["allergens"]
+    assert allergens["propertyOrdering"] == list(AllergenData.model_fields)
+    assert allergens["properties"]["gluten"] == {"type": "BOOLEAN"}
+    # Optional[str] becomes a plain STRING with the field description
+    energy = schema["properties"]["nutrients"]["properties"]["energy"]
+    assert energy["type"] == "STRING" and energy["description"]
+    assert "$ref" not in json.dumps(schema) and "default" not in json.dumps(schema)
+    assert response_schema(NutritionData)["required"] == list(NutritionData.model_fields)
+
+
+def test_reply_is_validated_into_the_models():
+    allergens, nutrients = parse_extraction_result(REPLY)
+    assert allergens["gluten"] is True and allergens["milk"] is False
+    assert nutrients == NUTRIENTS
+
+
+@pytest.mark.parametrize("reply", [
+    REPLY[:-20],  # cut off at maxOutputTokens
+    json.dumps({"allergens": {"gluten": "maybe"}, "nutrients": NUTRIENTS}),
+])
+def test_invalid_reply_raises(reply):
+    with pytest.raises(ValidationError):
+        parse_extraction_result(reply)
+
+
+def test_service_parses_an_invalid_structured_reply_as_text():
+    service = UniversalExtractionService()
+    assert service._parse_structured_reply(REPLY) == parse_extraction_result(REPLY)
+    # Not valid for the schema but still JSON: parsed like a free-form reply
+    loose = json.dumps({"allergens": {"gluten": "contains"}, "nutrients": {"fat": "6,9 g"}})
+    assert service._parse_structured_reply(loose) == ({"gluten": "contains"}, {"fat": "6,9 g"})
+    # Not JSON at all: the regex fallback reads the text
+    _, nutrients = service._parse_structured_reply("Fehérje: 8,2 g")
+    assert nutrients["protein"].startswith("8,2")
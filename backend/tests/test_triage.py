@@ -0,0 +1,61 @@
+"""Pre-flight triage routes and cost estimates"""
+import pytest
+
+from app.core.config import settings
+from app.services.triage import ROUTE_HYBRID, ROUTE_OCR, ROUTE_REJECT, ROUTE_TEXT, triage_pdf
+
+
+def test_text_pdf(make_pdf, label_text):
+    triage = triage_pdf(make_pdf([{"text": label_text}, {"text": "Ingredients: wheat flour"}]))
+    assert triage.route == ROUTE_TEXT
+    assert triage.pages == 2
+    assert triage.ocr_pages == 0
+    assert triage.has_text_layer
+
+
+def test_scanned_pdf(make_pdf):
+    triage = triage_pdf(make_pdf([{"image": 1.0}, {"image": 1.0}]))
+    assert triage.route == ROUTE_OCR
+    assert triage.ocr_page_numbers == [1, 2]
+    assert triage.estimated_seconds > triage.pages * settings.OCR_PAGE_SECONDS - 0.01
+
+
+def test_scan_with_a_text_header_needs_ocr(make_pdf):
+    triage = triage_pdf(make_pdf([{"text": "Spec sheet", "image": 0.9}]))
+    assert triage.route == ROUTE_OCR
+    assert triage.image_coverage == pytest.approx(0.9, abs=0.01)
+
+
+def test_small_image_on_a_text_page(make_pdf, label_text):
+    assert triage_pdf(make_pdf([{"text": label_text, "image": 0.2}])).route == ROUTE_TEXT
+
+
+def test_hybrid_pdf(make_pdf, label_text):
+    triage = triage_pdf(make_pdf([{"text": label_text}, {"image": 1.0}, {"text": label_text}]))
+    assert triage.route == ROUTE_HYBRID
+    assert triage.ocr_page_numbers == [2]
+
+
+def test_not_a_pdf():
+    triage = triage_pdf(b"GIF89a not a pdf")
+    assert triage.route == ROUTE_REJECT
+    assert triage.reason == "not a PDF file"
+
+
+def test_too_large(label_pdf, monkeypatch):
+    pdf_data = label_pdf
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", len(pdf_data) - 1)
+    assert triage_pdf(pdf_data).reason == "file too large"
+
+
+def test_too_many_pages(make_pdf, monkeypatch):
+    monkeypatch.setattr(settings, "TRIAGE_MAX_PAGES", 2)
+    triage = triage_pdf(make_pdf([{"text": "a"}] * 3))
+    assert triage.route == ROUTE_REJECT
+    assert triage.reason == "more than 2 pages"
+
+
+def test_unreadable_structure_goes_to_ocr():
+    triage = triage_pdf(b"%PDF-1.4\ngarbage without objects")
+    assert triage.route == ROUTE_OCR
+    assert triage.reason.startswith("structure unreadable")
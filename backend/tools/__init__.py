@@ -0,0 +1 @@
+# Developer tools (load testing, Gemini stub)
@@ -0,0 +1,143 @@
+"""
+Local stand-in for the Gemini generateContent API (and OpenAI-compatible
+/chat/completions), for load tests and offline runs.
+
+Answers with the regex fallback result for the prompt's text, after an injected
+latency, and can be told to fail with 429s or malformed (non-JSON) replies.
+
+    python -m tools.gemini_stub --port 8090 --latency-ms 800 --jitter-ms 300 --rate-429 0.05
+    GEMINI_API_BASE=http://127.0.0.1:8090 python -m app
+    OPENAI_API_BASE=http://127.0.0.1:8090 LLM_PROVIDERS='["openai"]' python -m app
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+from app.services.prompt_builder import estimate_tokens
+from app.services.universal_extraction_service import UniversalExtractionService
+
+TEXT_START = "TEXT TO ANALYZE:\n"
+TEXT_END = "\n\nReturn ONLY"
+
+
+def _prompt_text(prompt: str) -> str:
+    """The document text embedded in an extraction prompt"""
+    start = prompt.find(TEXT_START)
+    if start == -1:
+        return prompt
+    start += len(TEXT_START)
+    end = prompt.find(TEXT_END, start)
+    return prompt[start:end if end != -1 else None]
+
+
+def create_app(
+    latency_ms: float = 500,
+    jitter_ms: float = 0,
+    rate_429: float = 0.0,
+    rate_malformed: float = 0.0,
+    seed: int = None
+) -> web.Application:
+    rng = random.Random(seed)
+    extraction_service = UniversalExtractionService()
+    stats = {"requests": 0, "429": 0, "malformed": 0, "ok": 0}
+
+    async def reply_for(prompt: str, structured: bool):
+        """Reply text after the injected latency, or None for a 429"""
+        stats["requests"] += 1
+        delay = max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+        if rng.random() < rate_429:
+            stats["429"] += 1
+            return None
+
+        allergens, nutrients = extraction_service.advanced_fallback(_prompt_text(prompt))
+        result = json.dumps({"allergens": allergens, "nutrients": nutrients}, indent=2)
+        if rng.random() < rate_malformed:
+            stats["malformed"] += 1
+            if structured:
+                # Schema mode never returns prose; the realistic failure is output cut at maxOutputTokens
+                reply = result[:len(result) // 2]
+            else:
+                reply = "Sure! Here are the values I found: allergens gluten yes, energy 1000 kJ"
+        else:
+            stats["ok"] += 1
+            reply = result if structured else "```json\n" + result + "\n```"
+        return reply
+
+    async def generate_content(request: web.Request) -> web.Response:
+        body = await request.json()
+        prompt = body["contents"][0]["parts"][0]["text"]
+        structured = body.get("generationConfig", {}).get("responseMimeType") == "application/json"
+        reply = await reply_for(prompt, structured)
+        if reply is None:
+            return web.json_response(
+                {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}},
+                status=429
+            )
+
+        prompt_tokens = estimate_tokens(prompt)
+        reply_tokens = estimate_tokens(reply)
+        return web.json_response({
+            "candidates": [{"content": {"parts": [{"text": reply}], "role": "model"}, "finishReason": "STOP"}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": reply_tokens,
+                "totalTokenCount": prompt_tokens + reply_tokens
+            }
+        })
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        structured = (body.get("response_format") or {}).get("type") in ("json_object", "json_schema")
+        reply = await reply_for(prompt, structured)
+        if reply is None:
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429
+            )
+
+        prompt_tokens = estimate_tokens(prompt)
+        reply_tokens = estimate_tokens(reply)
+        return web.json_response({
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": reply_tokens,
+                "total_tokens": prompt_tokens + reply_tokens
+            }
+        })
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post("/models/{model_action}", generate_content)
+    app.router.add_post("/chat/completions", chat_completions)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini generateContent / OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=500, help="Mean reply latency")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Uniform +/- jitter on the latency")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-malformed", type=float, default=0.0, help="Fraction of replies that are not JSON")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.jitter_ms, args.rate_429, args.rate_malformed, args.seed)
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
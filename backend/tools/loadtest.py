@@ -0,0 +1,302 @@
+"""
+Load test for POST /api/v1/extract.
+
+Replays a corpus of PDFs at a fixed open-loop arrival rate against either the
+FastAPI app in-process (default) or a running server (--target). Gemini is
+replaced by tools/gemini_stub.py, started as a subprocess with the requested
+latency, 429 and malformed-reply rates.
+
+    python -m tools.loadtest --corpus ./pdfs --rate 5 --duration 60 \\
+        --stub-latency-ms 800 --stub-jitter-ms 300 --stub-429-rate 0.05
+
+Reports throughput, client latency and per-stage latency (p50/p95/p99, from the
+response "timings"), error and regex_fallback rates, and RSS over time.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def read_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Current resident set size of pid (default: this process) in MB"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid is None:
+        # Peak rather than current RSS, but better than nothing off Linux
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+    return None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(args) -> subprocess.Popen:
+    """Run tools.gemini_stub in a subprocess and wait until it accepts connections"""
+    cmd = [
+        sys.executable, "-m", "tools.gemini_stub",
+        "--port", str(args.stub_port),
+        "--latency-ms", str(args.stub_latency_ms),
+        "--jitter-ms", str(args.stub_jitter_ms),
+        "--rate-429", str(args.stub_429_rate),
+        "--rate-malformed", str(args.stub_malformed_rate),
+    ]
+    if args.seed is not None:
+        cmd += ["--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, cwd=Path(__file__).resolve().parent.parent)
+
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", args.stub_port), timeout=0.2):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("Gemini stub did not start")
+
+
+def make_client(args):
+    import httpx
+
+    timeout = httpx.Timeout(args.timeout)
+    if args.target:
+        return httpx.AsyncClient(base_url=args.target, timeout=timeout)
+
+    # In-process: settings are read at import time, so configure the environment first
+    os.environ["GEMINI_API_BASE"] = f"http://127.0.0.1:{args.stub_port}"
+    if args.no_cache:
+        os.environ["LLM_CACHE_SIZE"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from app.main import app
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=timeout)
+
+
+async def send_one(client, path: Path, pdf_data: bytes, args, results: List[Dict], inflight: asyncio.Semaphore):
+    async with inflight:
+        started = time.perf_counter()
+        record = {"file": path.name, "started": started}
+        try:
+            response = await client.post(
+                "/api/v1/extract",
+                files={"file": (path.name, pdf_data, "application/pdf")},
+                data={"gemini_api_key": args.api_key}
+            )
+            record["status"] = response.status_code
+            if response.status_code == 200:
+                body = response.json()
+                record["success"] = body.get("success", False)
+                record["llm_used"] = body.get("llm_used")
+                record["timings"] = body.get("timings") or {}
+                record["llm_usage"] = body.get("llm_usage") or {}
+        except Exception as e:
+            record["status"] = None
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["latency"] = time.perf_counter() - started
+        results.append(record)
+
+
+async def sample_rss(args, samples: List[Dict], started: float, stop: asyncio.Event):
+    pid = args.server_pid if args.target else None
+    if args.target and not pid:
+        return
+    while not stop.is_set():
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            samples.append({"t": round(time.perf_counter() - started, 2), "rss_mb": round(rss, 1)})
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=args.rss_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args) -> Dict:
+    corpus = sorted(p for p in Path(args.corpus).rglob("*") if p.suffix.lower() == ".pdf")
+    if not corpus:
+        raise SystemExit(f"No PDFs found in {args.corpus}")
+    documents = [(path, path.read_bytes()) for path in corpus]
+
+    rng = random.Random(args.seed)
+    client = make_client(args)
+    results: List[Dict] = []
+    rss_samples: List[Dict] = []
+    inflight = asyncio.Semaphore(args.max_inflight)
+    stop = asyncio.Event()
+
+    started = time.perf_counter()
+    sampler = asyncio.create_task(sample_rss(args, rss_samples, started, stop))
+    tasks = []
+    sent = 0
+    next_at = started
+    async with client:
+        while True:
+            now = time.perf_counter()
+            if now - started >= args.duration or (args.requests and sent >= args.requests):
+                break
+            if now < next_at:
+                await asyncio.sleep(next_at - now)
+            path, pdf_data = documents[sent % len(documents)] if args.sequential else rng.choice(documents)
+            tasks.append(asyncio.create_task(send_one(client, path, pdf_data, args, results, inflight)))
+            sent += 1
+            # Open-loop arrivals: Poisson by default, fixed interval with --uniform
+            interval = 1 / args.rate if args.uniform else rng.expovariate(args.rate)
+            next_at += interval
+
+        sending_time = time.perf_counter() - started
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    return build_report(args, results, rss_samples, sent, sending_time, elapsed)
+
+
+def build_report(args, results: List[Dict], rss_samples: List[Dict], sent: int, sending_time: float, elapsed: float) -> Dict:
+    completed = [r for r in results if r.get("status") == 200 and r.get("success")]
+    errors = [r for r in results if not (r.get("status") == 200 and r.get("success"))]
+    fallback = [r for r in completed if r.get("llm_used") == "regex_fallback"]
+
+    def summary(values: List[float]) -> Dict:
+        return {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values) if values else None,
+        }
+
+    stages = sorted({stage for r in completed for stage in r["timings"]})
+    usages = [r["llm_usage"] for r in completed if r["llm_usage"].get("prompt_tokens") is not None]
+    status_counts: Dict[str, int] = {}
+    for r in results:
+        key = str(r.get("status"))
+        status_counts[key] = status_counts.get(key, 0) + 1
+
+    return {
+        "config": {
+            "rate": args.rate,
+            "duration": args.duration,
+            "target": args.target or "in-process",
+            "stub_latency_ms": args.stub_latency_ms,
+            "stub_429_rate": args.stub_429_rate,
+            "stub_malformed_rate": args.stub_malformed_rate,
+        },
+        "sent": sent,
+        "completed": len(completed),
+        "offered_rate": sent / sending_time if sending_time else None,
+        "throughput": len(completed) / elapsed if elapsed else None,
+        "elapsed": elapsed,
+        "error_rate": len(errors) / len(results) if results else 0.0,
+        "fallback_rate": len(fallback) / len(completed) if completed else 0.0,
+        "status_counts": status_counts,
+        "latency": summary([r["latency"] for r in results]),
+        "tokens": {
+            "llm_calls": len(usages),
+            "prompt_total": sum(u["prompt_tokens"] for u in usages),
+            "response_total": sum(u.get("response_tokens") or 0 for u in usages),
+            "prompt_mean": sum(u["prompt_tokens"] for u in usages) / len(usages) if usages else None,
+        },
+        "stages": {stage: summary([r["timings"][stage] for r in completed if stage in r["timings"]]) for stage in stages},
+        "rss": {
+            "peak_mb": max((s["rss_mb"] for s in rss_samples), default=None),
+            "samples": rss_samples,
+        },
+        "errors": [r["error"] for r in errors if "error" in r][:10],
+    }
+
+
+def print_report(report: Dict) -> None:
+    def fmt(value):
+        return "-" if value is None else f"{value * 1000:8.1f} ms"
+
+    print(f"\nSent {report['sent']} requests, {report['completed']} completed in {report['elapsed']:.1f}s")
+    print(f"Offered rate:  {report['offered_rate'] or 0:.2f} req/s")
+    print(f"Throughput:    {report['throughput'] or 0:.2f} req/s")
+    print(f"Error rate:    {report['error_rate']:.1%}   statuses: {report['status_counts']}")
+    print(f"Fallback rate: {report['fallback_rate']:.1%}   (llm_used == regex_fallback)")
+    print(f"Peak RSS:      {report['rss']['peak_mb'] or '-'} MB")
+    tokens = report["tokens"]
+    print(f"LLM tokens:    {tokens['prompt_total']} prompt + {tokens['response_total']} response over {tokens['llm_calls']} calls")
+    print(f"\n{'stage':<12}{'p50':>12}{'p95':>12}{'p99':>12}{'max':>12}")
+    rows = [("client", report["latency"])] + list(report["stages"].items())
+    for name, s in rows:
+        print(f"{name:<12}{fmt(s['p50']):>12}{fmt(s['p95']):>12}{fmt(s['p99']):>12}{fmt(s['max']):>12}")
+    for error in report["errors"]:
+        print(f"error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for /api/v1/extract with a fake Gemini backend")
+    parser.add_argument("--corpus", required=True, help="Directory of PDFs to replay")
+    parser.add_argument("--rate", type=float, default=2.0, help="Arrival rate, requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to keep sending")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0 = no limit)")
+    parser.add_argument("--uniform", action="store_true", help="Fixed inter-arrival time instead of Poisson")
+    parser.add_argument("--sequential", action="store_true", help="Replay corpus in order instead of random picks")
+    parser.add_argument("--max-inflight", type=int, default=1000, help="Client-side cap on concurrent requests")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--target", default=None, help="Base URL of a running server (default: in-process app)")
+    parser.add_argument("--server-pid", type=int, default=None, help="PID of --target server, for RSS sampling")
+    parser.add_argument("--rss-interval", type=float, default=1.0, help="Seconds between RSS samples")
+    parser.add_argument("--api-key", default="loadtest", help="Value sent as gemini_api_key")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the LLM response cache (in-process only)")
+    parser.add_argument("--no-stub", action="store_true", help="Do not start the Gemini stub (target has its own)")
+    parser.add_argument(
+        "--stub-port", type=int, default=0,
+        help="Port for the Gemini stub (default: random). With --target, start the server with "
+             "GEMINI_API_BASE=http://127.0.0.1:<port>"
+    )
+    parser.add_argument("--stub-latency-ms", type=float, default=800)
+    parser.add_argument("--stub-jitter-ms", type=float, default=200)
+    parser.add_argument("--stub-429-rate", type=float, default=0.0)
+    parser.add_argument("--stub-malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--report", default=None, help="Write the full JSON report to this file")
+    args = parser.parse_args()
+
+    if not args.stub_port:
+        args.stub_port = free_port()
+
+    stub = None if args.no_stub else start_stub(args)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if stub:
+            stub.terminate()
+            stub.wait()
+
+    print_report(report)
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
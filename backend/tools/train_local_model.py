@@ -0,0 +1,160 @@
+"""
+Fit the weights of the local extraction model (app/services/local_extractor.py).
+
+Input is JSONL, one labelled document per line: the cleaned text (or its pages)
+and the expected result, e.g. reviewed /extract responses:
+
+    {"text": "...", "allergens": {"gluten": true, ...}, "nutrients": {"fat": "6,9 g", ...}}
+    {"pages": ["...", "..."], "allergens": {...}, "nutrients": {...}}
+
+    python -m tools.train_local_model labelled.jsonl --out local_model.json
+
+Every nutrient candidate becomes one example (correct when it equals the label),
+every allergen decision another; each group gets an L2-regularised logistic
+regression fitted by batch gradient descent. Prints per-field accuracy, and the
+share of documents accepted at --threshold with how many of those were fully right.
+Point LOCAL_MODEL_PATH at the written file.
+"""
+import argparse
+import json
+import math
+import re
+import sys
+from typing import Dict, List, Tuple
+
+from app.models.document import Document
+from app.services.local_extractor import (
+    ALLERGEN_FEATURES,
+    DEFAULT_WEIGHTS,
+    NUTRIENT_FEATURES,
+    LinearCandidateExtractor,
+)
+from app.services.universal_extraction_service import UniversalExtractionService
+
+Example = Tuple[Dict[str, float], int]
+
+
+def normalize_value(value) -> str:
+    """Comparable form of a nutrient value: "6,9 g" == "6.9g" """
+    return re.sub(r'\s+', '', str(value or "N/A").lower()).replace(',', '.')
+
+
+def load_documents(path: str) -> List[Tuple[Document, Dict]]:
+    service = UniversalExtractionService()
+    documents = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            pages = record.get("pages") or [record.get("text", "")]
+            document = Document.from_texts(pages).map_pages(service.clean_text, separator=" ")
+            documents.append((document, record))
+    return documents
+
+
+def build_examples(extractor: LinearCandidateExtractor, documents) -> Tuple[List[Example], List[Example], float]:
+    """Nutrient and allergen examples, plus the logit for "no candidate means really absent" """
+    nutrient_examples: List[Example] = []
+    allergen_examples: List[Example] = []
+    missing_total = missing_absent = 0
+
+    for document, record in documents:
+        expected_nutrients = record.get("nutrients", {})
+        for nutrient, candidates in extractor.nutrient_candidates(document.text, document).items():
+            expected = normalize_value(expected_nutrients.get(nutrient))
+            if not candidates:
+                missing_total += 1
+                missing_absent += expected == "n/a"
+            for candidate in candidates:
+                nutrient_examples.append((candidate.features, int(normalize_value(candidate.formatted) == expected)))
+
+        expected_allergens = record.get("allergens", {})
+        for allergen, (value, features) in extractor.allergen_evidence(document.text).items():
+            allergen_examples.append((features, int(value == bool(expected_allergens.get(allergen, False)))))
+
+    # Laplace-smoothed rate, as a logit
+    rate = (missing_absent + 1) / (missing_total + 2)
+    return nutrient_examples, allergen_examples, math.log(rate / (1 - rate))
+
+
+def fit_logistic(examples: List[Example], names, epochs: int, learning_rate: float, l2: float) -> Dict[str, float]:
+    weights = {name: 0.0 for name in names}
+    if not examples:
+        return weights
+    for _ in range(epochs):
+        gradient = {name: 0.0 for name in names}
+        for features, label in examples:
+            z = sum(weights[name] * features.get(name, 0.0) for name in names)
+            error = 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z)))) - label
+            for name in names:
+                gradient[name] += error * features.get(name, 0.0)
+        for name in names:
+            # The bias is not regularised
+            penalty = 0.0 if name == "bias" else l2 * weights[name]
+            weights[name] -= learning_rate * (gradient[name] / len(examples) + penalty)
+    return weights
+
+
+def evaluate(extractor: LinearCandidateExtractor, documents, threshold: float) -> Dict:
+    field_correct: Dict[str, int] = {}
+    accepted = accepted_correct = 0
+    for document, record in documents:
+        result = extractor.extract(document.text, document)
+        all_correct = True
+        for nutrient, value in result.nutrients.items():
+            correct = normalize_value(value) == normalize_value(record.get("nutrients", {}).get(nutrient))
+            field_correct[nutrient] = field_correct.get(nutrient, 0) + correct
+            all_correct &= correct
+        for allergen, value in result.allergens.items():
+            correct = value == bool(record.get("allergens", {}).get(allergen, False))
+            field_correct[allergen] = field_correct.get(allergen, 0) + correct
+            all_correct &= correct
+        if result.confidence >= threshold:
+            accepted += 1
+            accepted_correct += all_correct
+
+    total = len(documents) or 1
+    return {
+        "documents": len(documents),
+        "field_accuracy": {field: round(count / total, 3) for field, count in field_correct.items()},
+        "accepted_rate": round(accepted / total, 3),
+        "accepted_precision": round(accepted_correct / accepted, 3) if accepted else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local extraction model on labelled documents")
+    parser.add_argument("data", help="JSONL file of labelled documents")
+    parser.add_argument("--out", default="local_model.json", help="Where to write the weights")
+    parser.add_argument("--epochs", type=int, default=500)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=0.001)
+    parser.add_argument("--threshold", type=float, default=0.85, help="LOCAL_MODEL_THRESHOLD to evaluate")
+    args = parser.parse_args()
+
+    documents = load_documents(args.data)
+    if not documents:
+        sys.exit(f"No documents in {args.data}")
+
+    baseline = LinearCandidateExtractor(DEFAULT_WEIGHTS)
+    nutrient_examples, allergen_examples, missing_logit = build_examples(baseline, documents)
+    print(f"{len(documents)} documents, {len(nutrient_examples)} nutrient candidates, "
+          f"{len(allergen_examples)} allergen decisions")
+
+    weights = {
+        "nutrient": fit_logistic(nutrient_examples, NUTRIENT_FEATURES, args.epochs, args.learning_rate, args.l2),
+        "allergen": fit_logistic(allergen_examples, ALLERGEN_FEATURES, args.epochs, args.learning_rate, args.l2),
+        "missing_nutrient_logit": missing_logit,
+    }
+
+    print("Built-in weights:", json.dumps(evaluate(baseline, documents, args.threshold), indent=2))
+    print("Trained weights: ", json.dumps(evaluate(LinearCandidateExtractor(weights), documents, args.threshold), indent=2))
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(weights, f, indent=2)
+    print(f"Weights written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()